@@ -2,52 +2,232 @@
 # Audio Processing Module using Pedalboard
 
 import os
+import threading
+from functools import partial
 import numpy as np
 import soundfile as sf
-from pedalboard import Pedalboard, Reverb, Compressor
+from pedalboard import Reverb, Compressor
+from metrics import METRICS
+from audio_writer import DEFAULT_FORMAT, AudioWriter, write_audio
+from effect_chain import (
+    cached_board,
+    chain_key,
+    compile_chain,
+    effects_to_chain,
+    is_chain_spec,
+    unstreamable_effects,
+)
 
 
-def apply_effects(audio_ar, sr, effects):
+def normalize_effects(effects):
     """
-    Apply selected effects to the audio array.
+    Return the effects dict with defaults filled in and disabled effects
+    dropped, so equivalent settings compare (and hash) equal.
     """
-    board = Pedalboard()
+    normalized = {}
     if effects.get("reverb"):
-        room_size = effects.get("room_size", 0.9)
-        board.append(Reverb(room_size=room_size))
+        normalized["reverb"] = True
+        normalized["room_size"] = float(effects.get("room_size", 0.9))
     if effects.get("compressor"):
-        threshold = effects.get("threshold", -24.0)
-        ratio = effects.get("ratio", 2.0)
-        board.append(Compressor(threshold_db=threshold, ratio=ratio))
-    # Apply the effects
-    effected = board(audio_ar, sr)
+        normalized["compressor"] = True
+        normalized["threshold"] = float(effects.get("threshold", -24.0))
+        normalized["ratio"] = float(effects.get("ratio", 2.0))
+    return normalized
+
+
+def as_chain(effects):
+    """
+    Return effects as a chain spec, converting the GUI's flat effects dict.
+    """
+    return effects if is_chain_spec(effects) else effects_to_chain(effects)
+
+
+def effects_key(effects):
+    """
+    Canonical string form of an effects dict or chain spec. Settings that
+    compile to the same chain have the same key.
+    """
+    return chain_key(as_chain(effects))
+
+
+def build_board(effects):
+    """
+    Build a new Pedalboard for an effects dict or chain spec.
+    """
+    return compile_chain(as_chain(effects))
+
+
+class LiveEffects:
+    """
+    A persistent effects chain for processing playback block by block.
+    update() may be called from any thread and takes effect from the next
+    block. Parameter changes are made on the existing plugins, so reverb
+    tails and compressor state carry on; enabling or disabling an effect
+    swaps in a new board.
+    """
+
+    def __init__(self, effects=None):
+        self._lock = threading.Lock()
+        self._enabled = None
+        self._board = None
+        self.update(effects or {})
+
+    def update(self, effects):
+        effects = normalize_effects(effects)
+        enabled = ("reverb" in effects, "compressor" in effects)
+        with self._lock:
+            if enabled != self._enabled:
+                self._board = build_board(effects)
+                self._enabled = enabled
+                return
+            for plugin in self._board:
+                if isinstance(plugin, Reverb):
+                    plugin.room_size = effects["room_size"]
+                elif isinstance(plugin, Compressor):
+                    plugin.threshold_db = effects["threshold"]
+                    plugin.ratio = effects["ratio"]
+
+    def process(self, block, sample_rate):
+        """
+        Apply the chain to one (channels, samples) block.
+        """
+        with self._lock:
+            return self._board(block, sample_rate, reset=False)
+
+
+def apply_effects(audio_ar, sr, effects):
+    """
+    Apply selected effects (an effects dict or chain spec) to the audio array.
+    """
+    board, lock = cached_board(as_chain(effects))
+    # Apply the effects (reset=True clears any state from the last render)
+    with lock, METRICS.time("effect_render"):
+        effected = board(audio_ar, sr, reset=True)
     return effected
 
 
-def process_audio(file_path, effects):
+def process_audio(file_path, effects, cache=None, sample_rate=None, input_meter=None):
     """
     Load an audio file, apply selected effects, and return processed data.
+    If a RenderCache is given, repeat renders are served from it, as
+    read-only arrays. If sample_rate is given, the file is first converted
+    to that rate through the normalized-audio cache. If a LoudnessMeter is
+    given, the decoded input is measured with it (cache hits aren't decoded,
+    so aren't measured).
     """
-    audio_ar, sr = load_audio(file_path)
+    if cache is not None:
+        key = cache.make_key(file_path, effects, sample_rate)
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+    audio_ar, sr = load_audio(file_path, sample_rate)
+    if input_meter is not None:
+        input_meter.add(audio_ar)
     processed_audio = apply_effects(audio_ar, sr, effects)
+    if cache is not None:
+        cache.put(key, processed_audio, sr)
     return processed_audio, sr
 
 
-def save_wav(audio_ar, sample_rate, file_name):
+def process_audio_streaming(
+    file_path,
+    effects,
+    out_path,
+    block_size=65536,
+    sample_rate=None,
+    input_meter=None,
+    output_meter=None,
+    output_format=DEFAULT_FORMAT,
+):
+    """
+    Apply selected effects block by block, writing each block straight to
+    out_path. One board is kept for the whole file (reset=False) so reverb
+    tails and compressor state carry across block edges. Returns the number
+    of frames written. If sample_rate is given, blocks are read from the
+    file's memory-mapped normalized copy instead. LoudnessMeters, if given,
+    measure the input and output blocks as they pass. Blocks are encoded
+    on a background thread while the next block is processed. Raises
+    ValueError for chains with effects in effect_chain.UNSTREAMABLE.
+    """
+    unstreamable = unstreamable_effects(as_chain(effects))
+    if unstreamable:
+        raise ValueError(
+            f"{', '.join(unstreamable)} can't be streamed; process the file whole"
+        )
+    writer = partial(
+        _write_blocks,
+        out_path=out_path,
+        input_meter=input_meter,
+        output_meter=output_meter,
+        output_format=output_format,
+    )
+    board = build_board(effects)
+    if sample_rate:
+        audio_ar, sr = load_audio(file_path, sample_rate)
+        blocks = (
+            audio_ar[:, i : i + block_size].T
+            for i in range(0, audio_ar.shape[1], block_size)
+        )
+        return writer(board, blocks, sr, audio_ar.shape[0])
+    with sf.SoundFile(file_path) as src:
+        blocks = src.blocks(blocksize=block_size, dtype="float32", always_2d=True)
+        return writer(board, blocks, src.samplerate, src.channels)
+
+
+def _write_blocks(
+    board,
+    blocks,
+    sample_rate,
+    channels,
+    out_path,
+    input_meter,
+    output_meter,
+    output_format,
+):
+    frames = 0
+    with AudioWriter(out_path, sample_rate, channels, output_format) as dst:
+        for block in blocks:
+            # Blocks are (samples, channels); Pedalboard takes (channels, samples)
+            block = np.ascontiguousarray(block.T)
+            effected = board(block, sample_rate, reset=False)
+            if input_meter is not None:
+                input_meter.add(block)
+            if output_meter is not None:
+                output_meter.add(effected)
+            dst.write(effected)
+            frames += effected.shape[1]
+    return frames
+
+
+def save_wav(
+    audio_ar,
+    sample_rate,
+    file_name,
+    base_path="./recordings",
+    output_format=DEFAULT_FORMAT,
+):
     """
-    Save the processed audio array to a WAV file.
+    Save the processed audio array to base_path/file_name, as 24-bit WAV by
+    default or any format in audio_writer.OUTPUT_FORMATS.
     """
-    base_path = "./recordings"
-    file_path = os.path.join(base_path, file_name)
-    # Transpose audio_ar to shape (samples, channels)
-    audio_ar = audio_ar.T
-    sf.write(file_path, audio_ar, sample_rate, subtype="PCM_24")
+    write_audio(
+        os.path.join(base_path, file_name), audio_ar, sample_rate, output_format
+    )
 
 
-def load_audio(file_path):
+def load_audio(file_path, sample_rate=None):
     """
-    Load an audio file and return audio array and sample rate.
+    Load an audio file and return audio array and sample rate. If
+    sample_rate is given and differs from the file's, the converted copy
+    from the normalized-audio cache is returned (read-only, memory-mapped).
     """
-    audio_ar, sr = sf.read(file_path, dtype="float32", always_2d=True)
+    if sample_rate:
+        # Imported here because normalize imports render_cache, which
+        # imports this module
+        from normalize import load_normalized
+
+        return load_normalized(file_path, sample_rate)
+    with METRICS.time("decode"):
+        audio_ar, sr = sf.read(file_path, dtype="float32", always_2d=True)
     audio_ar = audio_ar.T  # Now shape is (channels, samples)
     return audio_ar, sr
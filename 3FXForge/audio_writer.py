@@ -0,0 +1,207 @@
+# audio_writer.py
+# One writer for every output format, with dither and background encoding
+
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import soundfile as sf
+
+# name -> (container, sample format, file extension)
+OUTPUT_FORMATS = {
+    "wav": ("WAV", "PCM_24", ".wav"),
+    "wav16": ("WAV", "PCM_16", ".wav"),
+    "float": ("WAV", "FLOAT", ".wav"),
+    "flac": ("FLAC", "PCM_24", ".flac"),
+    "flac16": ("FLAC", "PCM_16", ".flac"),
+}
+DEFAULT_FORMAT = "wav"
+BLOCK_SIZE = 65536
+PCM_BITS = {"PCM_16": 16, "PCM_24": 24}
+
+
+def format_for_path(path):
+    """
+    Pick the output format for a path from its extension (24-bit WAV for
+    anything that isn't .flac).
+    """
+    return "flac" if path.lower().endswith(".flac") else DEFAULT_FORMAT
+
+
+def output_name(file_name, output_format):
+    """
+    Replace a file name's extension with the one for output_format.
+    """
+    return os.path.splitext(file_name)[0] + OUTPUT_FORMATS[output_format][2]
+
+
+class Quantizer:
+    """
+    Converts float (channels, frames) blocks to the (frames, channels) data
+    soundfile writes for a subtype. Integer subtypes are rounded to their bit
+    depth here, with TPDF dither (two uniform random values per sample, +-1
+    LSB peak) unless dither is off, and clipped to full scale; soundfile's
+    own conversion neither dithers nor clips. Float subtypes pass through.
+    """
+
+    def __init__(self, subtype, dither=True, seed=None):
+        self.bits = PCM_BITS.get(subtype)
+        self.dither = dither
+        self._rng = np.random.default_rng(seed)
+
+    def __call__(self, block):
+        block = np.asarray(block, dtype=np.float32).T
+        if self.bits is None:
+            return block
+        scale = float(1 << (self.bits - 1))
+        scaled = block * np.float32(scale)
+        if self.dither:
+            noise = self._rng.random(scaled.shape, dtype=np.float32)
+            noise -= self._rng.random(scaled.shape, dtype=np.float32)
+            scaled += noise
+        quantized = np.clip(np.rint(scaled), -scale, scale - 1).astype(np.int32)
+        # soundfile takes int32 as full-scale 32-bit, keeping the top bits
+        return quantized << (32 - self.bits)
+
+
+def _open(path, sample_rate, channels, output_format):
+    container, subtype, _ = OUTPUT_FORMATS[output_format]
+    return (
+        sf.SoundFile(
+            path,
+            "w",
+            samplerate=sample_rate,
+            channels=channels,
+            subtype=subtype,
+            format=container,
+        ),
+        subtype,
+    )
+
+
+def write_audio(
+    path,
+    audio_ar,
+    sample_rate,
+    output_format=DEFAULT_FORMAT,
+    dither=True,
+    block_size=BLOCK_SIZE,
+):
+    """
+    Write a (channels, frames) float array to path in one of OUTPUT_FORMATS,
+    converting and encoding it block by block so no full-size integer copy
+    is ever made.
+    """
+    f, subtype = _open(path, sample_rate, audio_ar.shape[0], output_format)
+    quantize = Quantizer(subtype, dither)
+    with f:
+        for start in range(0, audio_ar.shape[1], block_size):
+            f.write(quantize(audio_ar[:, start : start + block_size]))
+
+
+class AudioWriter:
+    """
+    Writes blocks of a stream to a file on a background thread, so encoding
+    one block overlaps with producing the next. write() only queues the
+    block, blocking when max_pending blocks are already waiting; blocks must
+    not be modified after they are queued. Errors from the writer thread are
+    raised by write() or close().
+    """
+
+    def __init__(
+        self,
+        path,
+        sample_rate,
+        channels,
+        output_format=DEFAULT_FORMAT,
+        dither=True,
+        max_pending=4,
+    ):
+        self._file, subtype = _open(path, sample_rate, channels, output_format)
+        self._quantize = Quantizer(subtype, dither)
+        self._blocks = queue.Queue(maxsize=max_pending)
+        self._error = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def write(self, block):
+        if self._error is not None:
+            raise self._error
+        self._blocks.put(block)
+
+    def close(self):
+        """
+        Wait for every queued block to be written and close the file.
+        """
+        self._blocks.put(None)
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self.close()
+        except Exception:
+            # An exception is already propagating (and likely caused the
+            # writer's); raise the writer's only if there is none
+            if exc_type is None:
+                raise
+
+    def _run(self):
+        with self._file:
+            while True:
+                block = self._blocks.get()
+                if block is None:
+                    return
+                if self._error is not None:
+                    # Keep draining so write() never blocks on a dead thread
+                    continue
+                try:
+                    self._file.write(self._quantize(block))
+                except Exception as e:
+                    self._error = e
+
+
+class BackgroundWriter:
+    """
+    Writes whole renders on a background thread. submit() returns a Future
+    right away, so the caller can start on the next file while this one is
+    encoded; it blocks only when max_pending writes are already waiting,
+    which bounds the memory held by unwritten renders.
+    """
+
+    def __init__(self, max_pending=2):
+        self._pool = ThreadPoolExecutor(max_workers=1)
+        self._slots = threading.BoundedSemaphore(max_pending)
+
+    def submit(
+        self, path, audio_ar, sample_rate, output_format=DEFAULT_FORMAT, dither=True
+    ):
+        self._slots.acquire()
+        try:
+            future = self._pool.submit(
+                write_audio, path, audio_ar, sample_rate, output_format, dither
+            )
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def close(self):
+        """
+        Wait for all submitted writes to finish. Write errors are raised by
+        each write's Future, never here.
+        """
+        self._pool.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
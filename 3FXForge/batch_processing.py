@@ -0,0 +1,421 @@
+# batch_processing.py
+# Headless batch processing for 3FXForge using a process pool
+
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import soundfile as sf
+
+from audio_processing import process_audio, process_audio_streaming
+from audio_writer import (
+    DEFAULT_FORMAT,
+    OUTPUT_FORMATS,
+    BackgroundWriter,
+    output_name,
+    write_audio,
+)
+from effect_chain import (
+    is_chain_spec,
+    load_spec,
+    unstreamable_effects,
+    validate_chain,
+)
+from loudness import (
+    MAX_TRUE_PEAK_DB,
+    LoudnessMeter,
+    analyze,
+    analyze_file,
+    apply_gain_file,
+    format_analysis,
+    normalization_gain,
+    normalize_loudness,
+    with_gain,
+)
+from render_cache import RenderCache
+
+
+def collect_inputs(sources):
+    """
+    Expand directories and glob patterns into a sorted list of WAV files.
+    """
+    files = set()
+    for source in sources:
+        if os.path.isdir(source):
+            files.update(
+                os.path.join(source, f)
+                for f in os.listdir(source)
+                if f.lower().endswith(".wav")
+            )
+        else:
+            files.update(f for f in glob.glob(source) if f.lower().endswith(".wav"))
+    return sorted(files)
+
+
+def output_names(files, output_format=DEFAULT_FORMAT):
+    """
+    Return the output file name for each input: "processed_" and its base
+    name, with the extension for output_format. Inputs with the same base
+    name in different directories get _2, _3, ... in input order, so none
+    overwrites another.
+    """
+    names = []
+    taken = set()
+    for file_path in files:
+        name = output_name(f"processed_{os.path.basename(file_path)}", output_format)
+        stem, ext = os.path.splitext(name)
+        count = 1
+        # Compared ignoring case, as the output directory may be on a
+        # case-insensitive file system
+        while name.lower() in taken:
+            count += 1
+            name = f"{stem}_{count}{ext}"
+        taken.add(name.lower())
+        names.append(name)
+    return names
+
+
+def load_effects(spec):
+    """
+    Load an effects dict or chain from a JSON/YAML file path or an inline
+    JSON string, and validate it up front so bad specs fail before any work.
+    """
+    effects = load_spec(spec)
+    if is_chain_spec(effects):
+        validate_chain(effects)
+    return effects
+
+
+def process_file(
+    file_path,
+    effects,
+    output_dir,
+    block_size=None,
+    cache_dir=None,
+    sample_rate=None,
+    measure=False,
+    target_lufs=None,
+    max_true_peak=MAX_TRUE_PEAK_DB,
+    output_format=DEFAULT_FORMAT,
+    writer=None,
+    file_name=None,
+):
+    """
+    Process a single file and save the result in output_format as file_name
+    (by default as named by output_names) in output_dir. Runs inside a
+    worker process.
+    When block_size is set the file is streamed instead of loaded whole.
+    When cache_dir is set, renders are looked up in and spilled to it.
+    When sample_rate is set, the file is converted to it first, through the
+    normalized-audio cache shared with the GUI.
+    When measure is set, the loudness and peaks of the input and output are
+    measured from the audio being processed and added to the result as
+    "before" and "after". When target_lufs is set, the output is also
+    scaled to that loudness (limited by max_true_peak) before it is saved.
+    When writer (a BackgroundWriter) is set, whole-file renders are handed to
+    it and this returns before they are written; the error and wall_time of
+    the result are filled in once the write finishes.
+    """
+    start = time.perf_counter()
+    file_name = file_name or output_names([file_path], output_format)[0]
+    out_path = os.path.join(output_dir, file_name)
+    measure = measure or target_lufs is not None
+    result = {"file": file_path, "output": out_path, "error": None}
+    future = None
+    try:
+        input_meter = output_meter = None
+        if measure:
+            info = sf.info(file_path)
+            rate = sample_rate or info.samplerate
+            input_meter = LoudnessMeter(rate, info.channels)
+            if block_size:
+                output_meter = LoudnessMeter(rate, info.channels)
+        if block_size:
+            # When normalizing, the first pass goes to a float file so that
+            # peaks above full scale survive until the gain is applied
+            first_pass = (
+                f"{out_path}.float.wav" if target_lufs is not None else out_path
+            )
+            frames = process_audio_streaming(
+                file_path,
+                effects,
+                first_pass,
+                block_size=block_size,
+                sample_rate=sample_rate,
+                input_meter=input_meter,
+                output_meter=output_meter,
+                output_format="float" if target_lufs is not None else output_format,
+            )
+            duration = frames / (sample_rate or sf.info(file_path).samplerate)
+            if measure:
+                after = output_meter.result()
+                if target_lufs is not None:
+                    # The output has to be measured whole before the gain is
+                    # known, so it is applied in a second pass over the file
+                    gain = normalization_gain(after, target_lufs, max_true_peak)
+                    apply_gain_file(
+                        first_pass, gain, out_path, output_format, block_size=block_size
+                    )
+                    os.remove(first_pass)
+                    after = with_gain(after, gain)
+                    result["gain_db"] = gain
+        else:
+            # A zero memory budget sends every render straight to disk
+            cache = RenderCache(max_bytes=0, cache_dir=cache_dir) if cache_dir else None
+            processed_audio, sr = process_audio(
+                file_path,
+                effects,
+                cache=cache,
+                sample_rate=sample_rate,
+                input_meter=input_meter,
+            )
+            if measure:
+                after = analyze(processed_audio, sr)
+                if target_lufs is not None:
+                    processed_audio, gain = normalize_loudness(
+                        processed_audio, sr, target_lufs, max_true_peak, after
+                    )
+                    after = with_gain(after, gain)
+                    result["gain_db"] = gain
+            duration = processed_audio.shape[1] / sr
+            if writer is not None:
+                future = writer.submit(out_path, processed_audio, sr, output_format)
+            else:
+                write_audio(out_path, processed_audio, sr, output_format)
+        if measure:
+            # Renders served from the cache were never decoded
+            result["before"] = (
+                input_meter.result() if input_meter.frames else analyze_file(file_path)
+            )
+            result["after"] = after
+    except Exception as e:
+        result["error"] = str(e)
+        duration = 0.0
+    result["duration"] = duration
+
+    def finish(write):
+        if write is not None and write.exception() is not None:
+            result.update(error=str(write.exception()), duration=0.0)
+        result["wall_time"] = time.perf_counter() - start
+
+    if future is None:
+        finish(None)
+    else:
+        future.add_done_callback(finish)
+    return result
+
+
+def process_files(jobs, *args, **kwargs):
+    """
+    Process several (file_path, file_name) jobs in one worker, encoding each
+    whole-file render on a background thread while the next file is
+    processed.
+    """
+    with BackgroundWriter() as writer:
+        results = [
+            process_file(f, *args, writer=writer, file_name=name, **kwargs)
+            for f, name in jobs
+        ]
+    return results
+
+
+def run_batch(
+    files,
+    effects,
+    output_dir,
+    workers=None,
+    block_size=None,
+    cache_dir=None,
+    sample_rate=None,
+    measure=False,
+    target_lufs=None,
+    max_true_peak=MAX_TRUE_PEAK_DB,
+    output_format=DEFAULT_FORMAT,
+):
+    """
+    Fan the files out across a process pool and return a summary dict. Files
+    go to the workers in chunks, so each worker can write one render in the
+    background while it processes the next. Output names are chosen here,
+    before any work starts, so inputs with the same name can't collide.
+    """
+    workers = workers or os.cpu_count() or 1
+    os.makedirs(output_dir, exist_ok=True)
+    jobs = list(zip(files, output_names(files, output_format)))
+    # Several chunks per worker keeps the pool balanced when file lengths vary
+    chunk_size = max(1, len(jobs) // (workers * 4))
+    chunks = [jobs[i : i + chunk_size] for i in range(0, len(jobs), chunk_size)]
+
+    results = []
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(
+                process_files,
+                chunk,
+                effects,
+                output_dir,
+                block_size,
+                cache_dir,
+                sample_rate,
+                measure,
+                target_lufs,
+                max_true_peak,
+                output_format,
+            )
+            for chunk in chunks
+        ]
+        for future in as_completed(futures):
+            for result in future.result():
+                results.append(result)
+                if result["error"]:
+                    print(f"FAILED {result['file']}: {result['error']}")
+                else:
+                    print(
+                        f"{result['file']} -> {result['output']}: "
+                        f"{result['wall_time']:.2f}s "
+                        f"({result['duration']:.1f}s of audio)"
+                    )
+                    if "before" in result:
+                        print(f"    in:  {format_analysis(result['before'])}")
+                        print(f"    out: {format_analysis(result['after'])}")
+    elapsed = time.perf_counter() - start
+
+    audio_seconds = sum(r["duration"] for r in results)
+    return {
+        "files": len(results),
+        "failed": sum(1 for r in results if r["error"]),
+        "workers": workers,
+        "elapsed": elapsed,
+        "files_per_sec": len(results) / elapsed if elapsed > 0 else 0.0,
+        "realtime_factor": audio_seconds / elapsed if elapsed > 0 else 0.0,
+        "results": results,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Apply 3FXForge effects to many WAV files without the GUI."
+    )
+    parser.add_argument(
+        "inputs", nargs="+", help="Directories or glob patterns of WAV files."
+    )
+    parser.add_argument(
+        "--effects",
+        required=True,
+        help="Effects or an effect chain as a JSON/YAML file or inline JSON, "
+        "e.g. '{\"reverb\": true}'.",
+    )
+    parser.add_argument(
+        "--output-dir",
+        default=os.path.join("recordings", "processed"),
+        help="Directory for processed files (default: recordings/processed).",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Number of worker processes (default: number of CPU cores).",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Stream files block by block to keep memory bounded.",
+    )
+    parser.add_argument(
+        "--block-size",
+        type=int,
+        default=65536,
+        help="Frames per block when streaming (default: 65536).",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=None,
+        help="Reuse renders from (and save new ones to) this cache directory.",
+    )
+    parser.add_argument(
+        "--sample-rate",
+        type=int,
+        default=None,
+        help="Convert every file to this rate before processing, caching the "
+        "converted audio (default: keep each file's own rate).",
+    )
+    parser.add_argument(
+        "--format",
+        choices=sorted(OUTPUT_FORMATS),
+        default=DEFAULT_FORMAT,
+        help="Output format: 24-bit (wav, flac) or 16-bit (wav16, flac16) PCM "
+        "with dither, or 32-bit float WAV (float) (default: %(default)s).",
+    )
+    parser.add_argument(
+        "--analyze",
+        action="store_true",
+        help="Measure loudness (LUFS), true peak, RMS and clipping of every "
+        "input and output.",
+    )
+    parser.add_argument(
+        "--normalize-lufs",
+        type=float,
+        default=None,
+        metavar="LUFS",
+        help="Scale every output to this integrated loudness (implies --analyze).",
+    )
+    parser.add_argument(
+        "--max-true-peak",
+        type=float,
+        default=MAX_TRUE_PEAK_DB,
+        metavar="DBTP",
+        help="Ceiling for the true peak when normalizing "
+        f"(default: {MAX_TRUE_PEAK_DB:g} dBTP).",
+    )
+    parser.add_argument(
+        "--report", default=None, help="Write the per-file results to this JSON file."
+    )
+    args = parser.parse_args(argv)
+
+    files = collect_inputs(args.inputs)
+    if not files:
+        print("No WAV files found.")
+        return 1
+    try:
+        effects = load_effects(args.effects)
+    except (ValueError, RuntimeError) as e:
+        parser.error(f"invalid --effects: {e}")
+    if args.stream and is_chain_spec(effects):
+        unstreamable = unstreamable_effects(effects)
+        if unstreamable:
+            parser.error(
+                f"--stream can't be used with {', '.join(unstreamable)}, whose "
+                "output depends on the block size; run without --stream"
+            )
+
+    summary = run_batch(
+        files,
+        effects,
+        args.output_dir,
+        args.workers,
+        block_size=args.block_size if args.stream else None,
+        cache_dir=args.cache_dir,
+        sample_rate=args.sample_rate,
+        measure=args.analyze,
+        target_lufs=args.normalize_lufs,
+        max_true_peak=args.max_true_peak,
+        output_format=args.format,
+    )
+    print(
+        f"Processed {summary['files']} files ({summary['failed']} failed) "
+        f"with {summary['workers']} workers in {summary['elapsed']:.2f}s: "
+        f"{summary['files_per_sec']:.2f} files/sec, "
+        f"{summary['realtime_factor']:.1f}x realtime"
+    )
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(summary, f, indent=2)
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
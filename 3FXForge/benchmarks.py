@@ -0,0 +1,145 @@
+# benchmarks.py
+# Headless benchmarks for the 3FXForge hot paths on synthetic audio
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import soundfile as sf
+
+from audio_processing import apply_effects, load_audio, save_wav
+from audio_writer import OUTPUT_FORMATS, output_name, write_audio
+from loudness import analyze
+from playback import ArraySource, BLOCK_SIZE
+
+EFFECT_COMBINATIONS = {
+    "none": {},
+    "reverb": {"reverb": True, "room_size": 0.9},
+    "compressor": {"compressor": True, "threshold": -24.0, "ratio": 2.0},
+    "reverb+compressor": {
+        "reverb": True,
+        "room_size": 0.9,
+        "compressor": True,
+        "threshold": -24.0,
+        "ratio": 2.0,
+    },
+}
+
+
+def make_wav(path, seconds=30.0, channels=2, sample_rate=44100):
+    """
+    Write a reproducible test signal (a tone plus seeded noise) as 24-bit WAV.
+    """
+    rng = np.random.default_rng(0)
+    frames = int(seconds * sample_rate)
+    t = np.arange(frames) / sample_rate
+    tone = 0.3 * np.sin(2 * np.pi * 220.0 * t)[:, None]
+    noise = 0.05 * rng.standard_normal((frames, channels))
+    sf.write(path, (tone + noise).astype(np.float32), sample_rate, subtype="PCM_24")
+
+
+def time_runs(fn, runs=5):
+    """
+    Call fn once to warm up, then runs times. Returns timing stats in seconds.
+    """
+    fn()
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return {
+        "median_s": float(np.median(times)),
+        "min_s": float(np.min(times)),
+        "runs": runs,
+    }
+
+
+def drain(source):
+    source.seek(0)
+    while source.read(BLOCK_SIZE).shape[1]:
+        pass
+
+
+def run_suite(seconds=30.0, channels=2, sample_rate=44100, runs=5):
+    """
+    Time decode, each effect combination, encode and the playback
+    conversions on a synthetic file. Returns {name: stats}.
+    """
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "input.wav")
+        make_wav(path, seconds, channels, sample_rate)
+        results["load_audio"] = time_runs(lambda: load_audio(path), runs)
+
+        audio_ar, sr = load_audio(path)
+        for name, effects in EFFECT_COMBINATIONS.items():
+            results[f"apply_effects[{name}]"] = time_runs(
+                lambda: apply_effects(audio_ar, sr, effects), runs
+            )
+        results["save_wav"] = time_runs(
+            lambda: save_wav(audio_ar, sr, "output.wav", base_path=tmp), runs
+        )
+        # Encoding throughput per output format, in MB of float input per
+        # second, and how large each format makes the file
+        for fmt in OUTPUT_FORMATS:
+            out_path = os.path.join(tmp, output_name("output", fmt))
+            stats = time_runs(lambda: write_audio(out_path, audio_ar, sr, fmt), runs)
+            stats["mb_per_sec"] = audio_ar.nbytes / 1e6 / stats["median_s"]
+            stats["output_bytes"] = os.path.getsize(out_path)
+            results[f"write[{fmt}]"] = stats
+        # Whole-buffer conversion for 16-bit output devices and files
+        results["int16_conversion"] = time_runs(
+            lambda: np.ascontiguousarray((audio_ar.T * 32767).astype(np.int16)), runs
+        )
+        # Loudness, true peak, RMS and clipping over the whole file
+        results["loudness_analysis"] = time_runs(lambda: analyze(audio_ar, sr), runs)
+        results["loudness_analysis"]["samples_per_sec"] = (
+            audio_ar.shape[1] / results["loudness_analysis"]["median_s"]
+        )
+        # Block-by-block reads as done by PlaybackController
+        results["playback_blocks"] = time_runs(
+            lambda: drain(ArraySource(audio_ar, sr)), runs
+        )
+    params = {"seconds": seconds, "channels": channels, "sample_rate": sample_rate}
+    for stats in results.values():
+        stats["params"] = params
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="3FXForge benchmarks")
+    parser.add_argument("--seconds", type=float, default=30.0)
+    parser.add_argument("--channels", type=int, default=2)
+    parser.add_argument("--sample-rate", type=int, default=44100)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--json", help="Also write the results to this file.")
+    args = parser.parse_args(argv)
+
+    results = run_suite(args.seconds, args.channels, args.sample_rate, args.runs)
+    print(
+        f"{args.seconds:g}s of {args.channels}-channel audio at "
+        f"{args.sample_rate} Hz, median of {args.runs} runs"
+    )
+    for name, stats in results.items():
+        line = f"{name:>32} {stats['median_s'] * 1000:>10.2f} ms"
+        if "samples_per_sec" in stats:
+            line += f"  ({stats['samples_per_sec'] / 1e6:.1f}M samples/sec)"
+        if "mb_per_sec" in stats:
+            line += (
+                f"  ({stats['mb_per_sec']:.0f} MB/sec, "
+                f"{stats['output_bytes'] / 1e6:.1f} MB out)"
+            )
+        print(line)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
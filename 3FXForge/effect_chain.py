@@ -0,0 +1,279 @@
+# effect_chain.py
+# Declarative effect chains for 3FXForge, compiled into Pedalboards
+#
+# A chain is a list of nodes, declared in JSON or YAML:
+#
+#   {"chain": [
+#       {"type": "highpass", "cutoff_frequency_hz": 80},
+#       {"parallel": [[{"type": "delay", "delay_seconds": 0.25, "mix": 1.0}], []]},
+#       {"type": "limiter", "threshold_db": -1.0, "bypass": true}
+#   ]}
+#
+# An effect node names a type from PLUGINS plus any of its parameters. A
+# parallel node holds branches (each a chain) whose outputs are summed; an
+# empty branch passes the dry signal. Any node can be switched off with
+# "bypass": true.
+
+import functools
+import json
+import os
+import threading
+from pedalboard import (
+    Bitcrush,
+    Chorus,
+    Clipping,
+    Compressor,
+    Delay,
+    Distortion,
+    Gain,
+    HighShelfFilter,
+    HighpassFilter,
+    Limiter,
+    LowShelfFilter,
+    LowpassFilter,
+    Mix,
+    NoiseGate,
+    Pedalboard,
+    PeakFilter,
+    Phaser,
+    PitchShift,
+    Reverb,
+)
+
+# type name -> (plugin class, parameter defaults)
+PLUGINS = {
+    "gain": (Gain, {"gain_db": 1.0}),
+    "reverb": (
+        Reverb,
+        {
+            "room_size": 0.5,
+            "damping": 0.5,
+            "wet_level": 0.33,
+            "dry_level": 0.4,
+            "width": 1.0,
+            "freeze_mode": 0.0,
+        },
+    ),
+    "compressor": (
+        Compressor,
+        {"threshold_db": 0.0, "ratio": 1.0, "attack_ms": 1.0, "release_ms": 100.0},
+    ),
+    "limiter": (Limiter, {"threshold_db": -10.0, "release_ms": 100.0}),
+    "noisegate": (
+        NoiseGate,
+        {"threshold_db": -100.0, "ratio": 10.0, "attack_ms": 1.0, "release_ms": 100.0},
+    ),
+    "delay": (Delay, {"delay_seconds": 0.5, "feedback": 0.0, "mix": 0.5}),
+    "chorus": (
+        Chorus,
+        {
+            "rate_hz": 1.0,
+            "depth": 0.25,
+            "centre_delay_ms": 7.0,
+            "feedback": 0.0,
+            "mix": 0.5,
+        },
+    ),
+    "phaser": (
+        Phaser,
+        {
+            "rate_hz": 1.0,
+            "depth": 0.5,
+            "centre_frequency_hz": 1300.0,
+            "feedback": 0.0,
+            "mix": 0.5,
+        },
+    ),
+    "distortion": (Distortion, {"drive_db": 25.0}),
+    "clipping": (Clipping, {"threshold_db": -6.0}),
+    "bitcrush": (Bitcrush, {"bit_depth": 8.0}),
+    "pitchshift": (PitchShift, {"semitones": 0.0}),
+    "highpass": (HighpassFilter, {"cutoff_frequency_hz": 50.0}),
+    "lowpass": (LowpassFilter, {"cutoff_frequency_hz": 50.0}),
+    "lowshelf": (
+        LowShelfFilter,
+        {"cutoff_frequency_hz": 440.0, "gain_db": 0.0, "q": 0.7071067690849304},
+    ),
+    "highshelf": (
+        HighShelfFilter,
+        {"cutoff_frequency_hz": 440.0, "gain_db": 0.0, "q": 0.7071067690849304},
+    ),
+    "peak": (
+        PeakFilter,
+        {"cutoff_frequency_hz": 440.0, "gain_db": 0.0, "q": 0.7071067690849304},
+    ),
+}
+
+# Effects that can't be streamed block by block: PitchShift holds back its
+# latency when called with reset=False, and its output depends on where the
+# block edges fall, so a streamed render is shorter and differs from a
+# whole-file one
+UNSTREAMABLE = {"pitchshift"}
+
+
+def is_chain_spec(spec):
+    """
+    True for a chain (a list of nodes or a {"chain": [...]} document), as
+    opposed to the GUI's flat effects dict.
+    """
+    return isinstance(spec, list) or (isinstance(spec, dict) and "chain" in spec)
+
+
+def effects_to_chain(effects):
+    """
+    Convert the GUI's flat effects dict (reverb/compressor flags) to a chain.
+    """
+    chain = []
+    if effects.get("reverb"):
+        chain.append({"type": "reverb", "room_size": effects.get("room_size", 0.9)})
+    if effects.get("compressor"):
+        chain.append(
+            {
+                "type": "compressor",
+                "threshold_db": effects.get("threshold", -24.0),
+                "ratio": effects.get("ratio", 2.0),
+            }
+        )
+    return chain
+
+
+def validate_chain(spec):
+    """
+    Check a chain spec and return its canonical form: bypassed nodes
+    removed and every effect's parameters filled in with defaults and
+    converted to float. Equivalent specs have equal canonical forms.
+    Raises ValueError naming the offending node.
+    """
+    if isinstance(spec, dict):
+        if set(spec) != {"chain"}:
+            raise ValueError('A chain document must have a single "chain" key')
+        spec = spec["chain"]
+    return _validate_nodes(spec, "chain")
+
+
+def _validate_nodes(nodes, path):
+    if not isinstance(nodes, list):
+        raise ValueError(f"{path}: expected a list of nodes")
+    canonical = []
+    for i, node in enumerate(nodes):
+        node_path = f"{path}[{i}]"
+        if not isinstance(node, dict):
+            raise ValueError(f"{node_path}: expected an object")
+        node = dict(node)
+        bypass = node.pop("bypass", False)
+        if not isinstance(bypass, bool):
+            raise ValueError(f"{node_path}: bypass must be true or false")
+        if "parallel" in node:
+            branches = node.pop("parallel")
+            if node:
+                raise ValueError(f"{node_path}: unexpected keys {sorted(node)}")
+            if not isinstance(branches, list) or not branches:
+                raise ValueError(f"{node_path}: parallel needs a list of branches")
+            validated = {
+                "parallel": [
+                    _validate_nodes(branch, f"{node_path}.parallel[{j}]")
+                    for j, branch in enumerate(branches)
+                ]
+            }
+        else:
+            validated = _validate_effect(node, node_path)
+        if not bypass:
+            canonical.append(validated)
+    return canonical
+
+
+def _validate_effect(node, path):
+    kind = node.pop("type", None)
+    if kind not in PLUGINS:
+        raise ValueError(
+            f"{path}: unknown effect type {kind!r} "
+            f"(expected one of {', '.join(sorted(PLUGINS))})"
+        )
+    defaults = PLUGINS[kind][1]
+    unknown = set(node) - set(defaults)
+    if unknown:
+        raise ValueError(f"{path}: unknown parameters for {kind}: {sorted(unknown)}")
+    params = {}
+    for name, default in defaults.items():
+        value = node.get(name, default)
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValueError(f"{path}: {kind}.{name} must be a number")
+        params[name] = float(value)
+    return {"type": kind, **params}
+
+
+def chain_key(spec):
+    """
+    Canonical string form of a chain, used to cache compiled boards and
+    rendered audio.
+    """
+    return json.dumps(validate_chain(spec), sort_keys=True)
+
+
+def unstreamable_effects(spec):
+    """
+    Return the sorted types of the effects in a chain, parallel branches
+    included, that are in UNSTREAMABLE.
+    """
+    found = set()
+
+    def walk(nodes):
+        for node in nodes:
+            if "parallel" in node:
+                for branch in node["parallel"]:
+                    walk(branch)
+            elif node["type"] in UNSTREAMABLE:
+                found.add(node["type"])
+
+    walk(validate_chain(spec))
+    return sorted(found)
+
+
+def compile_chain(spec):
+    """
+    Build a new Pedalboard for a chain. Parallel nodes become Mix plugins.
+    """
+    return _compile_nodes(validate_chain(spec))
+
+
+def _compile_nodes(nodes):
+    plugins = []
+    for node in nodes:
+        if "parallel" in node:
+            plugins.append(Mix([_compile_nodes(branch) for branch in node["parallel"]]))
+        else:
+            params = dict(node)
+            cls = PLUGINS[params.pop("type")][0]
+            plugins.append(cls(**params))
+    return Pedalboard(plugins)
+
+
+@functools.lru_cache(maxsize=64)
+def _compiled(key):
+    # Boards hold plugin state, so each one gets a lock for concurrent renders
+    return _compile_nodes(json.loads(key)), threading.Lock()
+
+
+def cached_board(spec):
+    """
+    Return (board, lock) for a chain, compiling it only the first time its
+    canonical form is seen in this process. Hold the lock while rendering.
+    """
+    return _compiled(chain_key(spec))
+
+
+def load_spec(source):
+    """
+    Load a chain or effects dict from a JSON/YAML file path or an inline
+    JSON string. YAML needs PyYAML.
+    """
+    if os.path.isfile(source):
+        with open(source) as f:
+            if source.lower().endswith((".yaml", ".yml")):
+                try:
+                    import yaml
+                except ImportError:
+                    raise RuntimeError("PyYAML is required to load YAML effect chains")
+                return yaml.safe_load(f)
+            return json.load(f)
+    return json.loads(source)
@@ -2,15 +2,36 @@
 # GUI Application for 3FXForge with Interactive Buttons and Progress Bar
 
 import os
+from functools import partial
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 import threading
-import psutil
+import queue
 import numpy as np
-from audio_processing import process_audio, save_wav, load_audio, apply_effects
-import simpleaudio as sa
+from audio_processing import (
+    process_audio,
+    load_audio,
+    apply_effects,
+    LiveEffects,
+)
+from audio_writer import BackgroundWriter, format_for_path
+from playback import PlaybackController, ArraySource, FileSource
+from render_cache import RenderCache
+from recordings_index import RecordingsIndex
+from prefetch import TrackPrefetcher
+from metrics import METRICS
+from normalize import TARGET_SAMPLE_RATE
+from resample import resample
 import time
 
+METRICS_JSONL_PATH = "fxforge_metrics.jsonl"
+METRICS_PROM_PATH = "fxforge_metrics.prom"
+# Everything is played and processed at one rate, so the output stream never
+# has to be reopened or resampled by the driver
+PLAYBACK_SAMPLE_RATE = TARGET_SAMPLE_RATE
+# How often the main thread applies playback state and background results
+UI_TICK_MS = 100
+
 
 class FXForgeApp:
     def __init__(self, master):
@@ -61,6 +82,13 @@ class FXForgeApp:
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         self.listbox.config(yscrollcommand=scrollbar.set)
 
+        # Waveform of the selected recording, drawn from the index
+        self.waveform_canvas = tk.Canvas(
+            master, height=60, bg="#2e2e2e", highlightthickness=0
+        )
+        self.waveform_canvas.pack(fill=tk.X, padx=20, pady=(5, 0))
+        self.waveform_canvas.bind("<Configure>", lambda event: self.draw_waveform())
+
         # Control Buttons
         control_frame = ttk.Frame(master)
         control_frame.pack(pady=10)
@@ -136,6 +164,23 @@ class FXForgeApp:
         ratio_entry = ttk.Entry(process_frame, textvariable=self.ratio_var, width=5)
         ratio_entry.grid(row=1, column=4, padx=5, pady=5, sticky="w")
 
+        # Live Preview Option: play the original through the effects chain
+        self.live_preview_var = tk.BooleanVar()
+        live_preview_cb = ttk.Checkbutton(
+            process_frame, text="Live Preview", variable=self.live_preview_var
+        )
+        live_preview_cb.grid(row=2, column=0, padx=5, pady=5, sticky="w")
+
+        # Edits reach the live chain within one block
+        for var in (
+            self.reverb_var,
+            self.room_size_var,
+            self.compressor_var,
+            self.threshold_var,
+            self.ratio_var,
+        ):
+            var.trace_add("write", self.update_live_effects)
+
         # Progress Bar and Time Label
         progress_frame = ttk.Frame(master)
         progress_frame.pack(fill=tk.X, padx=20, pady=10)
@@ -145,6 +190,7 @@ class FXForgeApp:
             progress_frame, variable=self.progress_var, maximum=100
         )
         self.progress_bar.pack(fill=tk.X, side=tk.LEFT, expand=True)
+        self.progress_bar.bind("<Button-1>", self.seek_playback)
 
         self.time_label = ttk.Label(
             progress_frame,
@@ -154,62 +200,151 @@ class FXForgeApp:
         )
         self.time_label.pack(side=tk.RIGHT, padx=10)
 
-        # CPU Usage Monitoring
-        self.cpu_window = tk.Toplevel(master)
-        self.cpu_window.title("CPU Usage Monitor")
-        self.cpu_window.geometry("300x100")
-        self.cpu_window.configure(bg="#1e1e1e")
+        # Performance Telemetry
+        self.telemetry_window = tk.Toplevel(master)
+        self.telemetry_window.title("Performance Monitor")
+        self.telemetry_window.geometry("360x240")
+        self.telemetry_window.configure(bg="#1e1e1e")
 
-        self.cpu_label = ttk.Label(
-            self.cpu_window,
-            text="CPU Usage: 0%",
+        self.telemetry_label = ttk.Label(
+            self.telemetry_window,
+            text="",
             foreground="white",
             background="#1e1e1e",
-            font=("Helvetica", 16),
+            font=("Courier", 11),
+            justify=tk.LEFT,
+        )
+        self.telemetry_label.pack(pady=10, padx=10, anchor="w")
+
+        export_button = ttk.Button(
+            self.telemetry_window, text="Export Metrics", command=self.export_metrics
         )
-        self.cpu_label.pack(pady=20)
+        export_button.pack(pady=5)
 
-        self.update_cpu_usage()
+        self.update_telemetry()
 
         # Variables
-        self.is_playing = False
-        self.is_paused = False
         self.current_index = 0
         self.recordings = []
+        # Background threads never touch Tk; they post callbacks here and the
+        # main thread runs them on its next tick
+        self.ui_events = queue.SimpleQueue()
+        self.recordings_index = RecordingsIndex("recordings")
+        self.indexing = False
+        self.prefetcher = TrackPrefetcher(sample_rate=PLAYBACK_SAMPLE_RATE)
+        self.skip_started = None  # When next/prev was pressed
         self.load_recordings()
 
-        self.play_obj = None
-        self.audio_data = None
-        self.sample_rate = None
-        self.playback_position = 0
+        # One playback worker and output stream for the app's lifetime. The
+        # play/pause state below is the UI's own and only changes on the
+        # main thread.
+        self.playback = PlaybackController()
+        self.playback_token = None  # Token of the track last loaded
+        self.playback_status = "stopped"
+        self.live_effects = LiveEffects()
         self.processed_audio = None  # Holds processed audio data
-
-    def update_cpu_usage(self):
-        cpu_percent = psutil.cpu_percent(interval=None)
-        self.cpu_label.config(text=f"CPU Usage: {cpu_percent}%")
-        self.master.after(1000, self.update_cpu_usage)
+        # Processed audio converted to the playback rate, made on first play
+        self.processed_playback = None
+        self.render_cache = RenderCache()  # Repeat applies are served from here
+        self.writer = BackgroundWriter()  # Saves run off the Tk thread
+        master.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.update_ui()
+
+    def on_close(self):
+        # Release the output device before Tk goes away
+        self.playback.close()
+        self.prefetcher.close()
+        # Let saves in progress finish so no file is left half written
+        self.writer.close()
+        self.master.destroy()
+
+    def update_telemetry(self):
+        METRICS.sample_process()
+        snapshot = METRICS.snapshot()
+        gauges, counters = snapshot["gauges"], snapshot["counters"]
+        lines = [
+            f"CPU: {gauges['process_cpu_percent']:.1f}%",
+            f"RSS: {gauges['process_rss_bytes'] / 2**20:.0f} MB",
+            f"Late playback blocks: {counters.get('playback_late_blocks', 0)}",
+            f"Prefetch errors: {counters.get('prefetch_errors', 0)}",
+        ]
+        for stage in (
+            "decode",
+            "effect_render",
+            "playback_start",
+            "playback_block",
+            "skip_to_sound",
+        ):
+            timing = snapshot["timings"].get(stage)
+            if timing:
+                lines.append(
+                    f"{stage}: {timing['p50_ms']:.1f} ms "
+                    f"(p99 {timing['p99_ms']:.1f}, n={timing['count']})"
+                )
+        self.telemetry_label.config(text="\n".join(lines))
+        self.master.after(1000, self.update_telemetry)
+
+    def export_metrics(self):
+        METRICS.write_jsonl(METRICS_JSONL_PATH)
+        METRICS.write_prometheus(METRICS_PROM_PATH, "fxforge")
+        self.status_label.config(
+            text=f"Metrics written to {METRICS_JSONL_PATH} and {METRICS_PROM_PATH}"
+        )
 
     def load_recordings(self):
         """
-        Load WAV recordings from the 'recordings' directory.
+        List recordings from the index right away, then bring the index up
+        to date in the background.
         """
-        self.recordings = []
-        recordings_dir = "recordings"
-        if not os.path.exists(recordings_dir):
-            os.makedirs(recordings_dir)
-            self.status_label.config(text="Created 'recordings' directory.")
+        self.show_recordings()
+        if not self.indexing:
+            self.indexing = True
+            threading.Thread(target=self.refresh_index, daemon=True).start()
 
-        self.recordings = [
-            f for f in os.listdir(recordings_dir) if f.lower().endswith(".wav")
-        ]
-        self.recordings.sort()
+    def refresh_index(self):
+        try:
+            stats = self.recordings_index.refresh()
+        except Exception as e:
+            stats = {"error": e}
+        self.post_to_ui(self.index_refreshed, stats)
+
+    def index_refreshed(self, stats):
+        self.indexing = False
+        if "error" in stats:
+            self.status_label.config(text=f"Indexing failed: {stats['error']}")
+            return
+        if stats["added"] or stats["updated"] or stats["removed"]:
+            self.show_recordings()
+        self.status_label.config(
+            text=f"Loaded {len(self.recordings)} recordings "
+            f"({stats['added']} new, {stats['updated']} changed, "
+            f"{stats['removed']} removed) in {stats['elapsed']:.2f}s."
+        )
+
+    def show_recordings(self):
+        """
+        Fill the list from the index, keeping the current selection.
+        """
+        selected = self.listbox.curselection()
+        current = self.recordings[selected[0]] if selected else None
+        rows = self.recordings_index.list()
+        self.recordings = [row["path"] for row in rows]
         self.listbox.delete(0, tk.END)
-        for rec in self.recordings:
-            self.listbox.insert(tk.END, rec)
-        self.status_label.config(text=f"Loaded {len(self.recordings)} recordings.")
-        if self.recordings:
+        for row in rows:
+            duration = time.strftime("%M:%S", time.gmtime(row["duration"]))
+            self.listbox.insert(
+                tk.END,
+                f"{row['path']}  ({duration}, {row['sample_rate'] / 1000:g} kHz, "
+                f"{row['channels']} ch)",
+            )
+        if current in self.recordings:
+            self.current_index = self.recordings.index(current)
+            self.listbox.selection_set(self.current_index)
+        elif self.recordings:
             self.listbox.selection_set(0)
             self.on_select(None)
+        else:
+            self.draw_waveform()
 
     def on_select(self, event):
         """
@@ -223,21 +358,95 @@ class FXForgeApp:
             # Discard processed audio when a new file is selected
             self.processed_audio = None
             self.processed_sample_rate = None
+            self.processed_playback = None
+            self.draw_waveform()
+            self.prefetch_neighbours()
+
+    def prefetch_neighbours(self):
+        """
+        Decode the next and previous tracks (and this one) in the background.
+        """
+        indexes = [self.current_index + 1, self.current_index - 1, self.current_index]
+        self.prefetcher.prefetch(
+            [
+                os.path.join("recordings", self.recordings[i])
+                for i in indexes
+                if 0 <= i < len(self.recordings)
+            ]
+        )
+
+    def draw_waveform(self):
+        """
+        Draw the selected recording's peak and RMS overview.
+        """
+        canvas = self.waveform_canvas
+        canvas.delete("all")
+        selected = self.listbox.curselection()
+        width, height = canvas.winfo_width(), canvas.winfo_height()
+        if not selected or width < 2:
+            return
+        overview = self.recordings_index.overview(self.recordings[selected[0]], width)
+        if overview is None or len(overview[0]) == 0:
+            return
+        # Reduce the overview to one column per pixel
+        edges = np.linspace(0, len(overview[0]), min(width, len(overview[0])) + 1)
+        edges = edges[:-1].astype(np.int64)
+        peaks = np.maximum.reduceat(overview[0], edges)
+        rms = np.maximum.reduceat(overview[1], edges)
+        mid = height / 2
+        scale = width / len(edges)
+        for x, (peak, level) in enumerate(zip(peaks, rms)):
+            px = x * scale
+            canvas.create_line(
+                px, mid - peak * mid, px, mid + peak * mid, fill="#666666"
+            )
+            canvas.create_line(
+                px, mid - level * mid, px, mid + level * mid, fill="#aaaaaa"
+            )
+
+    def post_to_ui(self, callback, *args):
+        """
+        Run callback(*args) on the main thread. Safe to call from any thread.
+        """
+        self.ui_events.put((callback, args))
+
+    def update_ui(self):
+        """
+        The main thread's only timer for playback and background work: runs
+        posted callbacks, handles finished tracks and redraws the progress
+        bar from the player's latest state, all in one pass.
+        """
+        while True:
+            try:
+                callback, args = self.ui_events.get_nowait()
+            except queue.Empty:
+                break
+            callback(*args)
+        while True:
+            try:
+                token, error = self.playback.events.get_nowait()
+            except queue.Empty:
+                break
+            # Ignore the end of a track that has since been replaced
+            if token == self.playback_token:
+                self.playback_finished(error)
+        if self.playback_status == "playing":
+            self.update_playback_progress(self.playback.state)
+        self.master.after(UI_TICK_MS, self.update_ui)
 
     def play_pause_recording(self):
-        if self.is_playing and not self.is_paused:
-            # Pause playback
-            if self.play_obj:
-                self.play_obj.stop()
-            self.is_paused = True
+        if self.playback_status == "playing":
+            # Pause playback; the player keeps its position
+            self.playback.pause()
+            self.playback_status = "paused"
             self.play_pause_button.config(text="Play")
             self.status_label.config(text="Paused")
-        elif self.is_playing and self.is_paused:
+        elif self.playback_status == "paused":
             # Resume playback
-            self.is_paused = False
+            self.playback.play()
+            self.playback_status = "playing"
             self.play_pause_button.config(text="Pause")
             self.status_label.config(text="Playing")
-            threading.Thread(target=self.start_playback_from_position).start()
         else:
             # Start playback
             selected = self.listbox.curselection()
@@ -246,73 +455,118 @@ class FXForgeApp:
                 return
             filename = self.recordings[selected[0]]
             filepath = os.path.join("recordings", filename)
+            self.start_playback(filepath)
             self.status_label.config(text=f"Playing {filename}")
-            try:
-                threading.Thread(target=self.start_playback).start()
-                self.play_pause_button.config(text="Pause")
-            except Exception as e:
-                messagebox.showerror("Error", f"Cannot play {filename}: {e}")
-                self.status_label.config(text="Playback failed")
-
-    def start_playback(self):
-        self.is_playing = True
-        self.is_paused = False
-        self.playback_position = 0
-
-        # Use processed audio if available
-        if self.processed_audio is not None:
-            self.audio_data = self.processed_audio
-            self.sample_rate = self.processed_sample_rate
+            self.play_pause_button.config(text="Pause")
+
+    def start_playback(self, filepath):
+        """
+        Start streaming the processed audio if available, otherwise the
+        prefetched track or the file itself. The source is opened on the
+        playback worker, so a track that still needs converting to the
+        playback rate doesn't hold up the UI; errors come back as events.
+        """
+        processor = None
+        if self.live_preview_var.get():
+            self.update_live_effects()
+            processor = self.live_effects.process
+        if self.processed_audio is not None and processor is None:
+            open_source = partial(
+                self.open_processed_source,
+                self.processed_audio,
+                self.processed_sample_rate,
+            )
         else:
-            selected = self.listbox.curselection()
-            filename = self.recordings[selected[0]]
-            filepath = os.path.join("recordings", filename)
-            self.audio_data, self.sample_rate = load_audio(filepath)
+            # Neighbouring tracks are decoded ahead of time; others stream,
+            # unless they need converting to the playback rate
+            decoded = self.prefetcher.get(filepath)
+            if decoded:
+                open_source = partial(ArraySource, *decoded)
+            else:
+                open_source = partial(self.open_file_source, filepath)
+        self.playback_token = self.playback.load(open_source, processor)
+        self.playback_status = "playing"
+
+    def open_processed_source(self, audio_ar, sample_rate):
+        """
+        Play processed audio, which keeps its file's rate so it can be saved
+        unchanged, converting it to the playback rate the first time.
+        """
+        if sample_rate != PLAYBACK_SAMPLE_RATE:
+            converted = self.processed_playback
+            if converted is None or converted[0] is not audio_ar:
+                with METRICS.time("normalize"):
+                    playback_ar = resample(
+                        audio_ar.T, sample_rate, PLAYBACK_SAMPLE_RATE
+                    )
+                converted = (audio_ar, np.ascontiguousarray(playback_ar.T))
+                self.processed_playback = converted
+            audio_ar, sample_rate = converted[1], PLAYBACK_SAMPLE_RATE
+        return ArraySource(audio_ar, sample_rate)
+
+    def open_file_source(self, filepath):
+        source = FileSource(filepath)
+        if source.sample_rate != PLAYBACK_SAMPLE_RATE:
+            source.close()
+            source = ArraySource(*load_audio(filepath, PLAYBACK_SAMPLE_RATE))
+        return source
+
+    def update_playback_progress(self, state):
+        if state.token != self.playback_token:
+            # The worker hasn't started the current track yet
+            return
+        position, duration = state.position, state.duration
+        self.progress_var.set(position / duration * 100 if duration else 0)
+        elapsed = time.strftime("%M:%S", time.gmtime(position))
+        total = time.strftime("%M:%S", time.gmtime(duration))
+        self.time_label.config(text=f"{elapsed} / {total}")
+        if self.skip_started is not None and state.first_sound_at is not None:
+            self.prefetcher.record_skip_latency(
+                state.first_sound_at - self.skip_started
+            )
+            self.skip_started = None
+            stats = self.prefetcher.stats()
+            self.status_label.config(
+                text=f"Playing {self.recordings[self.current_index]} "
+                f"(skip-to-sound {stats['skip_last_ms']:.0f} ms, "
+                f"prefetch hit rate {stats['hit_rate']:.0%})"
+            )
+        if self.live_preview_var.get():
+            stats = self.playback.block_stats()
+            self.status_label.config(
+                text=f"Live preview: {stats.get('block_mean_ms', 0):.1f} ms/block "
+                f"of {stats['budget_ms']:.1f} ms, late blocks: {stats['late_blocks']}"
+            )
 
-        self.audio_length = self.audio_data.shape[1] / self.sample_rate
-        self.start_playback_from_position()
+    def update_live_effects(self, *args):
+        try:
+            effects = self.get_selected_effects()
+        except tk.TclError:
+            # An entry is mid-edit and doesn't hold a number yet
+            return
+        self.live_effects.update(effects)
 
-    def start_playback_from_position(self):
-        def playback():
-            remaining_data = self.audio_data[
-                :, int(self.playback_position * self.sample_rate) :
-            ]
-            if remaining_data.size == 0:
-                self.is_playing = False
-                self.play_pause_button.config(text="Play")
-                self.status_label.config(text="Playback finished.")
-                self.progress_var.set(0)
-                self.time_label.config(text="00:00 / 00:00")
-                return
-            data_to_play = (remaining_data.T * 32767).astype(np.int16)
-            # Ensure data is C-contiguous
-            data_to_play = np.ascontiguousarray(data_to_play)
-            self.play_obj = sa.play_buffer(
-                data_to_play,
-                num_channels=self.audio_data.shape[0],
-                bytes_per_sample=2,
-                sample_rate=self.sample_rate,
-            )
-            start_time = time.time() - self.playback_position
-            while self.play_obj.is_playing():
-                if self.is_paused or not self.is_playing:
-                    self.play_obj.stop()
-                    break
-                current_time = time.time() - start_time
-                progress = (current_time / self.audio_length) * 100
-                self.progress_var.set(progress)
-                # Update time label
-                elapsed = time.strftime("%M:%S", time.gmtime(current_time))
-                total = time.strftime("%M:%S", time.gmtime(self.audio_length))
-                self.time_label.config(text=f"{elapsed} / {total}")
-                time.sleep(0.1)
-            self.is_playing = False
-            self.play_pause_button.config(text="Play")
-            self.status_label.config(text="Playback finished.")
-            self.progress_var.set(0)
-            self.time_label.config(text="00:00 / 00:00")
+    def seek_playback(self, event):
+        """
+        Jump to the clicked point of the progress bar.
+        """
+        state = self.playback.state
+        if self.playback_status == "stopped" or state.token != self.playback_token:
+            return
+        fraction = min(max(event.x / self.progress_bar.winfo_width(), 0.0), 1.0)
+        self.playback.seek(fraction * state.duration)
+        self.progress_var.set(fraction * 100)
 
-        threading.Thread(target=playback).start()
+    def playback_finished(self, error):
+        self.playback_status = "stopped"
+        self.play_pause_button.config(text="Play")
+        self.progress_var.set(0)
+        self.time_label.config(text="00:00 / 00:00")
+        if error is not None:
+            messagebox.showerror("Error", f"Playback failed: {error}")
+            self.status_label.config(text="Playback failed")
+        else:
+            self.status_label.config(text="Playback finished.")
 
     def apply_effects_button(self):
         """
@@ -341,28 +595,34 @@ class FXForgeApp:
 
     def apply_effects_in_memory(self, filepath, effects):
         """
-        Apply effects and store the processed audio in memory.
+        Apply effects and store the processed audio in memory, at the file's
+        own rate so saving it doesn't resample.
         """
         try:
-            processed_data, sample_rate = process_audio(filepath, effects)
-            self.processed_audio = processed_data
-            self.processed_sample_rate = sample_rate
-            self.master.after(0, self.show_processing_success)
+            processed_data, sample_rate = process_audio(
+                filepath, effects, cache=self.render_cache
+            )
+            self.post_to_ui(self.show_processing_success, processed_data, sample_rate)
         except Exception as e:
-            self.master.after(0, self.show_error_message, e)
+            self.post_to_ui(self.show_error_message, e)
 
-    def show_processing_success(self):
+    def show_processing_success(self, processed_data, sample_rate):
+        self.processed_audio = processed_data
+        self.processed_sample_rate = sample_rate
+        self.processed_playback = None
         messagebox.showinfo(
             "Success", "Effects applied. You can now play the processed audio."
         )
-        self.status_label.config(text="Effects applied. Ready to play.")
+        stats = self.render_cache.stats()
+        self.status_label.config(
+            text=f"Effects applied. Ready to play. "
+            f"(cache hits: {stats['hits'] + stats['disk_hits']}, "
+            f"misses: {stats['misses']})"
+        )
 
     def stop_playback(self):
-        self.is_playing = False
-        self.is_paused = False
-        self.playback_position = 0
-        if self.play_obj:
-            self.play_obj.stop()
+        self.playback.stop()
+        self.playback_status = "stopped"
         self.progress_var.set(0)
         self.play_pause_button.config(text="Play")
         self.status_label.config(text="Playback stopped.")
@@ -370,6 +630,7 @@ class FXForgeApp:
 
     def prev_track(self):
         if self.current_index > 0:
+            self.skip_started = time.perf_counter()
             self.current_index -= 1
             self.listbox.selection_clear(0, tk.END)
             self.listbox.selection_set(self.current_index)
@@ -379,6 +640,7 @@ class FXForgeApp:
 
     def next_track(self):
         if self.current_index < len(self.recordings) - 1:
+            self.skip_started = time.perf_counter()
             self.current_index += 1
             self.listbox.selection_clear(0, tk.END)
             self.listbox.selection_set(self.current_index)
@@ -413,11 +675,40 @@ class FXForgeApp:
         if not selected:
             messagebox.showerror("Error", "No recording selected.")
             return
-        filename = self.recordings[selected[0]]
+        filename = os.path.basename(self.recordings[selected[0]])
         processed_filename = f"processed_{filename}"
-        save_wav(self.processed_audio, self.processed_sample_rate, processed_filename)
-        self.status_label.config(text=f"Processed audio saved as {processed_filename}")
-        self.load_recordings()
+        self.save_in_background(
+            os.path.join("./recordings", processed_filename),
+            f"Processed audio saved as {processed_filename}",
+            refresh=True,
+        )
+
+    def save_in_background(self, save_path, message, refresh=False):
+        """
+        Write the processed audio to save_path on the writer thread, in the
+        format its extension names, and report the outcome on the Tk thread.
+        """
+        self.status_label.config(text=f"Saving {os.path.basename(save_path)}...")
+        future = self.writer.submit(
+            save_path,
+            self.processed_audio,
+            self.processed_sample_rate,
+            format_for_path(save_path),
+        )
+        future.add_done_callback(
+            lambda f: self.post_to_ui(
+                self.save_finished, f.exception(), message, refresh
+            )
+        )
+
+    def save_finished(self, error, message, refresh):
+        if error is not None:
+            messagebox.showerror("Error", f"Failed to save file: {error}")
+            self.status_label.config(text="Save failed.")
+            return
+        self.status_label.config(text=message)
+        if refresh:
+            self.load_recordings()
 
     def show_error_message(self, error):
         messagebox.showerror("Error", f"Failed to process audio: {error}")
@@ -434,21 +725,11 @@ class FXForgeApp:
             return
         save_path = filedialog.asksaveasfilename(
             defaultextension=".wav",
-            filetypes=[("WAV files", "*.wav")],
+            filetypes=[("WAV files", "*.wav"), ("FLAC files", "*.flac")],
             initialfile="processed_audio.wav",
         )
         if save_path:
-            try:
-                audio_ar = (
-                    self.processed_audio.T
-                )  # Transpose back to (samples, channels)
-                sa.write(
-                    save_path, audio_ar, self.processed_sample_rate, subtype="PCM_24"
-                )
-                self.status_label.config(text=f"Processed audio saved to {save_path}")
-            except Exception as e:
-                messagebox.showerror("Error", f"Failed to save file: {e}")
-                self.status_label.config(text="Save failed.")
+            self.save_in_background(save_path, f"Processed audio saved to {save_path}")
 
 
 # Run the application
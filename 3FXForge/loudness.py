@@ -0,0 +1,331 @@
+# loudness.py
+# Integrated loudness (ITU-R BS.1770), true peak, RMS and clipping analysis
+# in blocks, with optional normalization to a loudness target
+
+import argparse
+import sys
+from functools import lru_cache
+
+import numpy as np
+import soundfile as sf
+
+from audio_writer import DEFAULT_FORMAT, AudioWriter
+from resample import filter_bank
+
+# Gating per BS.1770-4: 400 ms blocks every 100 ms, an absolute gate at
+# -70 LUFS and a relative gate 10 LU below the loudness of the blocks above it
+SEGMENT_SECONDS = 0.1
+SEGMENTS_PER_BLOCK = 4
+ABSOLUTE_GATE = -70.0
+RELATIVE_GATE = -10.0
+# Length of the K-weighting filter's impulse response, rounded up to a power
+# of two samples. The slowest pole (the 38 Hz high-pass) has decayed by far
+# more than 24 bits within this time.
+K_WEIGHTING_SECONDS = 0.15
+# True peak is measured on a 4x oversampled signal
+OVERSAMPLING = 4
+OVERSAMPLING_HALF_WIDTH = 6
+# Samples at or above this level count as clipped (about -0.01 dBFS)
+CLIP_LEVEL = 0.999
+# Default targets for normalize_loudness
+TARGET_LUFS = -14.0
+MAX_TRUE_PEAK_DB = -1.0
+
+
+def _db(value, power=False):
+    with np.errstate(divide="ignore"):
+        return float((10.0 if power else 20.0) * np.log10(value))
+
+
+def k_weighting(sample_rate):
+    """
+    Return the two K-weighting biquads, a high shelf and a high-pass, as
+    [(b, a), (b, a)] for any sample rate. This is the bilinear design used by
+    libebur128, which reproduces the 48 kHz coefficients in BS.1770.
+    """
+    f0, gain, q = 1681.974450955533, 3.999843853973347, 0.7071752369554196
+    k = np.tan(np.pi * f0 / sample_rate)
+    vh = 10.0 ** (gain / 20.0)
+    vb = vh**0.4996667741545416
+    a0 = 1.0 + k / q + k * k
+    shelf = (
+        [
+            (vh + vb * k / q + k * k) / a0,
+            2.0 * (k * k - vh) / a0,
+            (vh - vb * k / q + k * k) / a0,
+        ],
+        [1.0, 2.0 * (k * k - 1.0) / a0, (1.0 - k / q + k * k) / a0],
+    )
+    f0, q = 38.13547087602444, 0.5003270373238773
+    k = np.tan(np.pi * f0 / sample_rate)
+    a0 = 1.0 + k / q + k * k
+    highpass = (
+        [1.0, -2.0, 1.0],
+        [1.0, 2.0 * (k * k - 1.0) / a0, (1.0 - k / q + k * k) / a0],
+    )
+    return [shelf, highpass]
+
+
+@lru_cache(maxsize=8)
+def _k_weighting_response(sample_rate):
+    """
+    Return (taps, response): the length of the K-weighting filter's
+    truncated impulse response and its spectrum for 4 * taps point real
+    FFTs. Filtering then becomes an FFT convolution with no recursion.
+    """
+    taps = 1 << int(np.ceil(np.log2(K_WEIGHTING_SECONDS * sample_rate)))
+    z = np.exp(-2j * np.pi * np.fft.rfftfreq(taps))
+    response = np.ones_like(z)
+    for b, a in k_weighting(sample_rate):
+        response *= np.polyval(b[::-1], z) / np.polyval(a[::-1], z)
+    impulse = np.fft.irfft(response, taps)
+    return taps, np.fft.rfft(impulse, 4 * taps)
+
+
+def channel_weights(channels):
+    """
+    BS.1770 channel weights, assuming the usual L, R, C, (LFE,) Ls, Rs order
+    for 5 and 6 channels. The LFE channel is left out.
+    """
+    if channels == 5:
+        return np.array([1.0, 1.0, 1.0, 1.41, 1.41])
+    if channels == 6:
+        return np.array([1.0, 1.0, 1.0, 0.0, 1.41, 1.41])
+    return np.ones(channels)
+
+
+class LoudnessMeter:
+    """
+    Measures audio fed to it in (channels, samples) blocks of any size, so
+    the same code serves whole arrays from load_audio and streamed files.
+    Each block is K-weighted with an overlap-add FFT convolution, reduced to
+    100 ms mean-square segments, and oversampled for true peak with a
+    polyphase filter; no state is kept per sample, only per segment.
+    """
+
+    def __init__(self, sample_rate, channels):
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.frames = 0
+        self._segment = int(round(SEGMENT_SECONDS * sample_rate))
+        self._segments = []
+        self._pending = np.zeros((channels, 0))
+        self._taps, self._response = _k_weighting_response(sample_rate)
+        self._tail = np.zeros((channels, self._taps - 1))
+        self._bank = filter_bank(OVERSAMPLING, 1.0, OVERSAMPLING_HALF_WIDTH).T
+        self._history = np.zeros(
+            (channels, 2 * OVERSAMPLING_HALF_WIDTH - 1), dtype=np.float32
+        )
+        self._sample_peak = 0.0
+        self._true_peak = 0.0
+        self._sum_squares = np.zeros(channels)
+        self._clipped = 0
+
+    def add(self, block):
+        """
+        Measure the next (channels, samples) block.
+        """
+        block = np.asarray(block, dtype=np.float64)
+        n = block.shape[1]
+        if n == 0:
+            return
+        self.frames += n
+        magnitude = np.abs(block)
+        self._sample_peak = max(self._sample_peak, float(magnitude.max()))
+        self._clipped += int(np.count_nonzero(magnitude >= CLIP_LEVEL))
+        self._sum_squares += np.einsum("cs,cs->c", block, block)
+        self._add_true_peak(block)
+
+        # K-weight by overlap-add in chunks sized for the FFT: the part of
+        # each convolution that runs past its chunk is carried into the next
+        taps, n_fft = self._taps, 4 * self._taps
+        step = n_fft - taps + 1
+        pending = self._pending.shape[1]
+        weighted = np.empty((self.channels, pending + n))
+        weighted[:, :pending] = self._pending
+        out = weighted[:, pending:]
+        for start in range(0, n, step):
+            chunk = block[:, start : start + step]
+            m = chunk.shape[1]
+            convolved = np.fft.irfft(np.fft.rfft(chunk, n_fft) * self._response, n_fft)
+            convolved[:, : taps - 1] += self._tail
+            out[:, start : start + m] = convolved[:, :m]
+            self._tail = convolved[:, m : m + taps - 1]
+
+        count = weighted.shape[1] // self._segment
+        if count:
+            whole = weighted[:, : count * self._segment]
+            self._segments.append(
+                np.square(whole).reshape(self.channels, count, -1).mean(axis=2)
+            )
+        self._pending = weighted[:, count * self._segment :]
+
+    def _add_true_peak(self, block):
+        # Each window of 2 * half width input samples gives the oversampled
+        # values between its two middle samples. Single precision is plenty
+        # for a peak reading and halves the cost.
+        padded = np.concatenate([self._history, block], axis=1).astype(np.float32)
+        self._history = padded[:, -self._history.shape[1] :]
+        windows = np.lib.stride_tricks.sliding_window_view(
+            padded, self._bank.shape[0], axis=1
+        )
+        peak = float(np.abs(windows @ self._bank).max())
+        self._true_peak = max(self._true_peak, peak)
+
+    def integrated_loudness(self):
+        """
+        Gated integrated loudness in LUFS, or -inf for silence or audio
+        shorter than one 400 ms block.
+        """
+        if not self._segments:
+            return float("-inf")
+        segments = np.concatenate(self._segments, axis=1)
+        if segments.shape[1] < SEGMENTS_PER_BLOCK:
+            return float("-inf")
+        # 400 ms block powers as moving means over 4 segments, summed over
+        # channels with their weights
+        cumulative = np.cumsum(np.pad(segments, ((0, 0), (1, 0))), axis=1)
+        blocks = (
+            cumulative[:, SEGMENTS_PER_BLOCK:] - cumulative[:, :-SEGMENTS_PER_BLOCK]
+        ) / SEGMENTS_PER_BLOCK
+        power = channel_weights(self.channels) @ blocks
+        with np.errstate(divide="ignore"):
+            loudness = -0.691 + 10.0 * np.log10(power)
+        gated = power[loudness > ABSOLUTE_GATE]
+        if not len(gated):
+            return float("-inf")
+        relative = -0.691 + 10.0 * np.log10(gated.mean()) + RELATIVE_GATE
+        gated = power[(loudness > ABSOLUTE_GATE) & (loudness > relative)]
+        return -0.691 + _db(gated.mean(), power=True)
+
+    def result(self):
+        """
+        Return the measurements so far as a dict. Levels are in dBFS (dBTP
+        for true peak); rms is over all channels.
+        """
+        true_peak = max(self._true_peak, self._sample_peak)
+        rms = (
+            np.sqrt(self._sum_squares.sum() / (self.frames * self.channels))
+            if self.frames
+            else 0.0
+        )
+        return {
+            "integrated_lufs": self.integrated_loudness(),
+            "true_peak_dbtp": _db(true_peak),
+            "sample_peak_dbfs": _db(self._sample_peak),
+            "rms_dbfs": _db(rms),
+            "clipped_samples": self._clipped,
+            "clipping": self._clipped > 0 or true_peak > 1.0,
+            "duration": self.frames / self.sample_rate,
+        }
+
+
+def analyze(audio_ar, sample_rate, block_size=65536):
+    """
+    Measure a (channels, samples) array, as returned by load_audio or
+    apply_effects.
+    """
+    meter = LoudnessMeter(sample_rate, audio_ar.shape[0])
+    for start in range(0, audio_ar.shape[1], block_size):
+        meter.add(audio_ar[:, start : start + block_size])
+    return meter.result()
+
+
+def analyze_file(file_path, block_size=65536):
+    """
+    Measure a file block by block without loading it whole.
+    """
+    with sf.SoundFile(file_path) as f:
+        meter = LoudnessMeter(f.samplerate, f.channels)
+        for block in f.blocks(blocksize=block_size, dtype="float32", always_2d=True):
+            meter.add(block.T)
+    return meter.result()
+
+
+def normalization_gain(
+    analysis, target_lufs=TARGET_LUFS, max_true_peak_db=MAX_TRUE_PEAK_DB
+):
+    """
+    Return the gain in dB that brings the analysed audio to target_lufs
+    without its true peak going above max_true_peak_db. Silence gets 0 dB.
+    """
+    if not np.isfinite(analysis["integrated_lufs"]):
+        return 0.0
+    gain = target_lufs - analysis["integrated_lufs"]
+    if np.isfinite(analysis["true_peak_dbtp"]):
+        gain = min(gain, max_true_peak_db - analysis["true_peak_dbtp"])
+    return gain
+
+
+def with_gain(analysis, gain_db):
+    """
+    Return the analysis of the same audio after a gain of gain_db, without
+    measuring it again (every level moves by exactly the gain). The clipped
+    sample count is exact when the new sample peak is below CLIP_LEVEL, and
+    otherwise left as it was.
+    """
+    scaled = dict(analysis)
+    for key in ("integrated_lufs", "true_peak_dbtp", "sample_peak_dbfs", "rms_dbfs"):
+        scaled[key] = analysis[key] + gain_db
+    if scaled["sample_peak_dbfs"] < _db(CLIP_LEVEL):
+        scaled["clipped_samples"] = 0
+    scaled["clipping"] = scaled["clipped_samples"] > 0 or scaled["true_peak_dbtp"] > 0.0
+    return scaled
+
+
+def normalize_loudness(
+    audio_ar,
+    sample_rate,
+    target_lufs=TARGET_LUFS,
+    max_true_peak_db=MAX_TRUE_PEAK_DB,
+    analysis=None,
+):
+    """
+    Scale a (channels, samples) array to target_lufs, limited so the true
+    peak stays at or below max_true_peak_db. Returns (audio, gain_db). Pass
+    the array's analysis if it has already been measured.
+    """
+    analysis = analysis or analyze(audio_ar, sample_rate)
+    gain = normalization_gain(analysis, target_lufs, max_true_peak_db)
+    return audio_ar * np.float32(10.0 ** (gain / 20.0)), gain
+
+
+def apply_gain_file(
+    file_path, gain_db, out_path, output_format=DEFAULT_FORMAT, block_size=65536
+):
+    """
+    Copy a file to out_path in output_format with a gain applied, block by
+    block.
+    """
+    factor = np.float32(10.0 ** (gain_db / 20.0))
+    with sf.SoundFile(file_path) as src, AudioWriter(
+        out_path, src.samplerate, src.channels, output_format
+    ) as dst:
+        for block in src.blocks(blocksize=block_size, dtype="float32", always_2d=True):
+            dst.write(block.T * factor)
+
+
+def format_analysis(analysis):
+    text = (
+        f"{analysis['integrated_lufs']:.1f} LUFS, "
+        f"true peak {analysis['true_peak_dbtp']:.1f} dBTP, "
+        f"RMS {analysis['rms_dbfs']:.1f} dBFS"
+    )
+    if analysis["clipping"]:
+        text += f", clipping ({analysis['clipped_samples']} clipped samples)"
+    return text
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Measure loudness, true peak, RMS and clipping of audio files."
+    )
+    parser.add_argument("files", nargs="+")
+    args = parser.parse_args(argv)
+    for file_path in args.files:
+        print(f"{file_path}: {format_analysis(analyze_file(file_path))}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
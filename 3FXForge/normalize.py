@@ -0,0 +1,159 @@
+# normalize.py
+# Convert source files to one sample rate and channel layout, once, with an
+# on-disk cache shared by the GUI and batch jobs
+
+import hashlib
+import os
+import threading
+
+import numpy as np
+import soundfile as sf
+
+from metrics import METRICS
+from render_cache import file_fingerprint
+from resample import convert_channels, resample
+
+TARGET_SAMPLE_RATE = 44100
+NORMALIZED_CACHE_DIR = os.path.join("recordings", ".normalized")
+# Size the converted copies may take up on disk before the least recently
+# used are deleted
+NORMALIZED_CACHE_BYTES = 2 * 1024**3
+# Bump when the conversion changes so old cache entries are ignored
+NORMALIZE_VERSION = 2
+
+
+class NormalizedCache:
+    """
+    Converted copies of source files as float32 (channels, frames) .npy
+    files, keyed by a hash of the source contents and the target format, so
+    renamed or copied files are found too. Entries are memory-mapped on load,
+    so processes reading the same file share one copy in memory. When the
+    entries take up more than max_bytes, the least recently used are deleted.
+    """
+
+    def __init__(
+        self, cache_dir=NORMALIZED_CACHE_DIR, max_bytes=NORMALIZED_CACHE_BYTES
+    ):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        # Content hashes by path, mtime and size, so each file is hashed once
+        self._hashes = {}
+        self._lock = threading.Lock()
+
+    def make_key(self, file_path, sample_rate, channels):
+        fingerprint = file_fingerprint(file_path)
+        with self._lock:
+            content = self._hashes.get(fingerprint)
+        if content is None:
+            content = file_fingerprint(file_path, content_hash=True)
+            with self._lock:
+                self._hashes[fingerprint] = content
+        return hashlib.blake2b(
+            f"{content}|{NORMALIZE_VERSION}:{sample_rate}:{channels}:float32".encode(),
+            digest_size=20,
+        ).hexdigest()
+
+    def load(self, file_path, sample_rate=TARGET_SAMPLE_RATE, channels=None):
+        """
+        Return (audio, sample_rate) for the file converted to sample_rate and
+        channels (None keeps the file's own count). Files already in that
+        format are read directly and not cached.
+        """
+        info = sf.info(file_path)
+        channels = channels or info.channels
+        if info.samplerate == sample_rate and info.channels == channels:
+            with METRICS.time("decode"):
+                audio_ar, _ = sf.read(file_path, dtype="float32", always_2d=True)
+            return audio_ar.T, sample_rate
+
+        path = os.path.join(
+            self.cache_dir, f"{self.make_key(file_path, sample_rate, channels)}.npy"
+        )
+        try:
+            audio_ar = np.load(path, mmap_mode="r")
+            # The modification time marks when the entry was last used
+            os.utime(path)
+            with self._lock:
+                self.hits += 1
+            METRICS.incr("normalize_cache_hits")
+            return audio_ar, sample_rate
+        except (OSError, ValueError):
+            pass
+        with self._lock:
+            self.misses += 1
+        METRICS.incr("normalize_cache_misses")
+
+        with METRICS.time("decode"):
+            audio_ar, sr = sf.read(file_path, dtype="float32", always_2d=True)
+        with METRICS.time("normalize"):
+            audio_ar = resample(convert_channels(audio_ar, channels), sr, sample_rate)
+            audio_ar = np.ascontiguousarray(audio_ar.T)
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # Write to a temp file first so readers never see a partial entry
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                np.save(f, audio_ar)
+            os.replace(tmp_path, path)
+            self._trim(keep=path)
+        except OSError:
+            # A read-only cache directory just means converting every time
+            pass
+        audio_ar.setflags(write=False)
+        return audio_ar, sample_rate
+
+    def _trim(self, keep):
+        """
+        Delete the least recently used entries, other than keep, until the
+        cache fits in max_bytes.
+        """
+        entries = []
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if entry.name.endswith(".npy") and entry.path != keep:
+                    st = entry.stat()
+                    entries.append((st.st_mtime, st.st_size, entry.path))
+        total = sum(size for _, size, _ in entries) + os.path.getsize(keep)
+        for _, size, entry_path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                # Open memory maps of the file stay valid on POSIX
+                os.remove(entry_path)
+            except OSError:
+                # Still open elsewhere on Windows, or already removed
+                continue
+            total -= size
+            METRICS.incr("normalize_cache_evictions")
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+_default_caches = {}
+_default_lock = threading.Lock()
+
+
+def load_normalized(
+    file_path,
+    sample_rate=TARGET_SAMPLE_RATE,
+    channels=None,
+    cache_dir=NORMALIZED_CACHE_DIR,
+):
+    """
+    Load a file as float32 (channels, frames) at sample_rate, through the
+    shared NormalizedCache for cache_dir.
+    """
+    with _default_lock:
+        cache = _default_caches.get(cache_dir)
+        if cache is None:
+            cache = _default_caches[cache_dir] = NormalizedCache(cache_dir)
+    return cache.load(file_path, sample_rate, channels)
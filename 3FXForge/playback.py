@@ -0,0 +1,316 @@
+# playback.py
+# Block-streaming playback for 3FXForge
+
+import itertools
+import queue
+import threading
+import time
+from collections import deque, namedtuple
+import numpy as np
+import soundfile as sf
+
+from metrics import METRICS
+
+BLOCK_SIZE = 2048
+
+# What the playback worker last published. token identifies the load() the
+# state belongs to; status is "stopped", "playing" or "paused".
+PlaybackState = namedtuple(
+    "PlaybackState",
+    "token status position duration first_sound_at time_to_first_sound",
+)
+STOPPED = PlaybackState(None, "stopped", 0.0, 0.0, None, None)
+
+
+class ArraySource:
+    """
+    Plays a (channels, samples) float array, e.g. processed audio, without
+    copying it. Each read slices out one block.
+    """
+
+    def __init__(self, audio_ar, sample_rate):
+        self.audio_ar = audio_ar
+        self.sample_rate = sample_rate
+        self.channels = audio_ar.shape[0]
+        self.frames = audio_ar.shape[1]
+        self.position = 0
+
+    def seek(self, frame):
+        self.position = min(max(int(frame), 0), self.frames)
+
+    def read(self, frames):
+        block = self.audio_ar[:, self.position : self.position + frames]
+        self.position += block.shape[1]
+        return np.ascontiguousarray(block, dtype=np.float32)
+
+    def close(self):
+        pass
+
+
+class FileSource:
+    """
+    Plays an audio file straight from disk, decoding one block at a time.
+    """
+
+    def __init__(self, file_path):
+        self._file = sf.SoundFile(file_path)
+        self.sample_rate = self._file.samplerate
+        self.channels = self._file.channels
+        self.frames = self._file.frames
+        self.position = 0
+
+    def seek(self, frame):
+        self.position = min(max(int(frame), 0), self.frames)
+        self._file.seek(self.position)
+
+    def read(self, frames):
+        block = self._file.read(frames, dtype="float32", always_2d=True)
+        self.position += len(block)
+        # SoundFile gives (samples, channels); playback uses (channels, samples)
+        return np.ascontiguousarray(block.T)
+
+    def close(self):
+        self._file.close()
+
+
+class PlaybackController:
+    """
+    Owns the only output stream and the only playback thread for the app.
+    Callers send commands (load, play, pause, seek, stop) through a queue;
+    the worker applies them between blocks, so the source and the stream
+    are only ever touched by the worker and need no locks.
+
+    The worker publishes an immutable PlaybackState after every block or
+    command (a single attribute swap) and reports the end of a track or an
+    error on the events queue as (token, error) pairs, error being None for
+    a track that played to its end. Nothing here calls into Tk; the GUI
+    reads state and events from its own timer. While stopped or paused the
+    worker sleeps on the queue and doesn't wake until the next command.
+
+    output is anything with write(audio, sample_rate) that blocks while the
+    block plays; by default a Pedalboard AudioStream is opened on the first
+    play and kept open, and only reopened when a track has a different rate
+    or channel count.
+    """
+
+    def __init__(self, block_size=BLOCK_SIZE, output=None, output_device_name=None):
+        self.block_size = block_size
+        self.output = output
+        self.output_device_name = output_device_name
+        self.state = STOPPED
+        self.events = queue.SimpleQueue()
+        self.late_blocks = 0
+        self.block_times = deque(maxlen=1024)
+        self._commands = queue.SimpleQueue()
+        self._tokens = itertools.count(1)
+        # Only the worker touches these
+        self._source = None
+        self._processor = None
+        self._token = None
+        self._playing = False
+        self._play_requested_at = None
+        self._first_sound_at = None
+        self._time_to_first_sound = None
+        self._sample_rate = None
+        self._stream = None
+        self._stream_format = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def load(self, open_source, processor=None, play=True):
+        """
+        Replace the current track. open_source is called on the worker
+        thread to create the source, so decoding or opening a file never
+        blocks the caller. processor, if given, is called as
+        processor(block, sample_rate) on every block before it is played
+        (see LiveEffects). Returns the token of the new track.
+        """
+        token = next(self._tokens)
+        self._commands.put(("load", token, open_source, processor, play))
+        return token
+
+    def play(self):
+        self._commands.put(("play",))
+
+    def pause(self):
+        self._commands.put(("pause",))
+
+    def seek(self, seconds):
+        self._commands.put(("seek", seconds))
+
+    def stop(self):
+        self._commands.put(("stop",))
+
+    def close(self):
+        """
+        Stop playback, release the output device and end the worker.
+        """
+        self._commands.put(("close",))
+        self._thread.join()
+
+    def block_stats(self):
+        """
+        Return per-block read and processing time figures in ms, against the
+        realtime budget of one block.
+        """
+        stats = {
+            "late_blocks": self.late_blocks,
+            "budget_ms": self.block_size / (self._sample_rate or 44100) * 1000.0,
+        }
+        times = list(self.block_times)
+        if times:
+            ms = np.array(times) * 1000.0
+            stats["block_mean_ms"] = float(ms.mean())
+            stats["block_p99_ms"] = float(np.percentile(ms, 99))
+            stats["block_max_ms"] = float(ms.max())
+        return stats
+
+    # Everything below runs on the worker thread only
+
+    def _run(self):
+        try:
+            while True:
+                # Block on the queue while idle; only drain it while playing
+                if not self._playing:
+                    if not self._handle(self._commands.get()):
+                        return
+                while True:
+                    try:
+                        command = self._commands.get_nowait()
+                    except queue.Empty:
+                        break
+                    if not self._handle(command):
+                        return
+                if self._playing:
+                    self._play_block()
+        finally:
+            self._unload()
+            self._close_stream()
+
+    def _handle(self, command):
+        """
+        Apply one command. Returns False when the worker should exit.
+        """
+        name = command[0]
+        if name == "close":
+            return False
+        if name == "load":
+            _, token, open_source, processor, play = command
+            self._unload()
+            self._token = token
+            try:
+                self._source = open_source()
+            except Exception as e:
+                self._fail(e)
+                return True
+            self._processor = processor
+            self._first_sound_at = self._time_to_first_sound = None
+            self._set_playing(play)
+        elif name == "play" and self._source is not None:
+            self._set_playing(True)
+        elif name == "pause" and self._source is not None:
+            self._set_playing(False)
+        elif name == "seek" and self._source is not None:
+            self._source.seek(command[1] * self._source.sample_rate)
+        elif name == "stop":
+            self._unload()
+        self._publish()
+        return True
+
+    def _set_playing(self, playing):
+        if playing and not self._playing:
+            self._play_requested_at = time.perf_counter()
+            self._first_sound_at = self._time_to_first_sound = None
+        self._playing = playing
+
+    def _play_block(self):
+        source = self._source
+        budget = self.block_size / source.sample_rate
+        started = time.perf_counter()
+        block = source.read(self.block_size)
+        if block.shape[1] == 0:
+            token = self._token
+            self._unload()
+            self._publish()
+            self.events.put((token, None))
+            return
+        if self._processor is not None:
+            block = self._processor(block, source.sample_rate)
+        elapsed = time.perf_counter() - started
+        self.block_times.append(elapsed)
+        METRICS.observe("playback_block", elapsed)
+        if elapsed > budget:
+            self.late_blocks += 1
+            METRICS.incr("playback_late_blocks")
+        try:
+            output = self._output_for(source.sample_rate, source.channels)
+        except Exception as e:
+            self._fail(e)
+            return
+        if self._time_to_first_sound is None:
+            self._first_sound_at = time.perf_counter()
+            self._time_to_first_sound = self._first_sound_at - self._play_requested_at
+            METRICS.observe("playback_start", self._time_to_first_sound)
+        self._publish()
+        try:
+            output.write(block, source.sample_rate)
+        except Exception as e:
+            self._close_stream()
+            self._fail(e)
+
+    def _publish(self):
+        source = self._source
+        if source is None:
+            self.state = STOPPED
+            return
+        self.state = PlaybackState(
+            self._token,
+            "playing" if self._playing else "paused",
+            source.position / source.sample_rate,
+            source.frames / source.sample_rate,
+            self._first_sound_at,
+            self._time_to_first_sound,
+        )
+
+    def _fail(self, error):
+        token = self._token
+        self._unload()
+        self._publish()
+        self.events.put((token, error))
+
+    def _unload(self):
+        if self._source is not None:
+            self._source.close()
+        self._source = None
+        self._processor = None
+        self._playing = False
+
+    def _output_for(self, sample_rate, channels):
+        self._sample_rate = sample_rate
+        if self.output is not None:
+            return self.output
+        if self._stream is not None and self._stream_format == (sample_rate, channels):
+            return self._stream
+        self._close_stream()
+        from pedalboard.io import AudioStream
+
+        # The stream stays open between tracks and while paused, so starting
+        # and resuming don't wait for the device
+        self._stream = AudioStream(
+            output_device_name=self.output_device_name
+            or AudioStream.default_output_device_name,
+            sample_rate=sample_rate,
+            buffer_size=self.block_size,
+            num_output_channels=channels,
+        )
+        self._stream.__enter__()
+        self._stream_format = (sample_rate, channels)
+        return self._stream
+
+    def _close_stream(self):
+        if self._stream is not None:
+            try:
+                self._stream.__exit__(None, None, None)
+            finally:
+                self._stream = None
+                self._stream_format = None
@@ -0,0 +1,100 @@
+# prefetch.py
+# Background decoding of neighbouring tracks for instant next/prev
+
+import threading
+from collections import deque
+
+import numpy as np
+
+from audio_processing import load_audio
+from metrics import METRICS
+from render_cache import RenderCache
+
+# Decoded tracks are keyed like renders with no effects
+NO_EFFECTS = {}
+
+
+class TrackPrefetcher:
+    """
+    Decodes tracks on a background thread into a bounded in-memory pool
+    (a RenderCache, so the least recently used tracks are evicted first).
+    prefetch() replaces the list of wanted tracks, so only the tracks around
+    the latest selection are decoded. With a sample_rate, tracks are
+    converted to it through the normalized-audio cache. Tracks that fail to
+    decode are skipped and logged in errors as (file_path, message).
+    """
+
+    def __init__(self, max_bytes=256 * 1024 * 1024, sample_rate=None):
+        self.cache = RenderCache(max_bytes=max_bytes)
+        self.sample_rate = sample_rate
+        self.skip_latencies = deque(maxlen=256)
+        self.errors = deque(maxlen=64)
+        self._wanted = deque()
+        self._condition = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def prefetch(self, file_paths):
+        """
+        Decode these files in the background, in order, unless already
+        decoded. Files still waiting from an earlier call are dropped.
+        """
+        with self._condition:
+            self._wanted = deque(file_paths)
+            self._condition.notify()
+
+    def get(self, file_path):
+        """
+        Return (audio, sample_rate) if the file has been decoded, else None.
+        Each call counts towards the hit rate.
+        """
+        try:
+            return self.cache.get(
+                self.cache.make_key(file_path, NO_EFFECTS, self.sample_rate)
+            )
+        except OSError:
+            return None
+
+    def record_skip_latency(self, seconds):
+        self.skip_latencies.append(seconds)
+        METRICS.observe("skip_to_sound", seconds)
+
+    def stats(self):
+        """
+        Return the pool's hit/miss counters and skip-to-sound latency in ms.
+        """
+        stats = self.cache.stats()
+        if self.skip_latencies:
+            ms = np.array(self.skip_latencies) * 1000.0
+            stats["skip_mean_ms"] = float(ms.mean())
+            stats["skip_max_ms"] = float(ms.max())
+            stats["skip_last_ms"] = float(ms[-1])
+        stats["errors"] = len(self.errors)
+        return stats
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._wanted and not self._closed:
+                    self._condition.wait()
+                if self._closed:
+                    return
+                file_path = self._wanted.popleft()
+            try:
+                key = self.cache.make_key(file_path, NO_EFFECTS, self.sample_rate)
+                if key in self.cache:
+                    continue
+                audio_ar, sr = load_audio(file_path, self.sample_rate)
+                self.cache.put(key, audio_ar, sr)
+            except Exception as e:
+                # Missing, unreadable or corrupt; playback will report it if
+                # chosen, and the next track is still prefetched
+                self.errors.append((file_path, str(e)))
+                METRICS.incr("prefetch_errors")
@@ -0,0 +1,252 @@
+# recordings_index.py
+# Persistent SQLite index of the recordings tree with waveform overviews
+
+import contextlib
+import os
+import sqlite3
+import time
+
+import numpy as np
+import soundfile as sf
+
+from render_cache import file_fingerprint
+
+INDEX_FILE = ".index.sqlite"
+AUDIO_EXTENSIONS = (".wav", ".flac", ".aiff", ".aif", ".ogg")
+# Samples per bucket of the finest overview; each coarser level is
+# OVERVIEW_FACTOR times coarser, down to MIN_OVERVIEW_BUCKETS buckets
+OVERVIEW_BUCKET = 1024
+OVERVIEW_FACTOR = 4
+MIN_OVERVIEW_BUCKETS = 256
+SORT_COLUMNS = ("path", "duration", "mtime_ns", "sample_rate", "channels", "size")
+# Bump when the stored data changes so older indexes are rebuilt
+INDEX_VERSION = 2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS recordings (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    frames INTEGER NOT NULL,
+    sample_rate INTEGER NOT NULL,
+    channels INTEGER NOT NULL,
+    duration REAL NOT NULL,
+    format TEXT,
+    subtype TEXT,
+    content_hash TEXT
+);
+CREATE TABLE IF NOT EXISTS overviews (
+    path TEXT NOT NULL REFERENCES recordings(path) ON DELETE CASCADE,
+    bucket INTEGER NOT NULL,
+    peaks BLOB NOT NULL,
+    rms BLOB NOT NULL,
+    PRIMARY KEY (path, bucket)
+);
+"""
+
+
+def compute_overviews(file_path, block_size=OVERVIEW_BUCKET * 256):
+    """
+    Read a file block by block and return {bucket_size: (peaks, rms)} for
+    every overview level. Peaks are the largest absolute sample and rms the
+    RMS over all channels in each bucket, as float32 arrays.
+    """
+    peaks, sums, counts = [], [], []
+    with sf.SoundFile(file_path) as f:
+        # block_size is a multiple of the bucket, so buckets never straddle
+        for block in f.blocks(blocksize=block_size, dtype="float32", always_2d=True):
+            n = -(-len(block) // OVERVIEW_BUCKET)
+            padded = np.zeros((n * OVERVIEW_BUCKET, block.shape[1]), dtype=np.float32)
+            padded[: len(block)] = block
+            grouped = padded.reshape(n, -1)
+            peaks.append(np.abs(grouped).max(axis=1))
+            sums.append(np.square(grouped, dtype=np.float64).sum(axis=1))
+            # Samples in each bucket; the last one of the file can be short,
+            # and its padding mustn't count towards the RMS
+            count = np.full(n, grouped.shape[1], dtype=np.int64)
+            count[-1] -= (len(padded) - len(block)) * block.shape[1]
+            counts.append(count)
+    if not peaks:
+        return {}
+    peaks = np.concatenate(peaks)
+    sums = np.concatenate(sums)
+    counts = np.concatenate(counts)
+
+    levels = {}
+    bucket = OVERVIEW_BUCKET
+    while True:
+        levels[bucket] = (
+            peaks.astype(np.float32),
+            np.sqrt(sums / counts).astype(np.float32),
+        )
+        if len(peaks) <= MIN_OVERVIEW_BUCKETS:
+            return levels
+        n = -(-len(peaks) // OVERVIEW_FACTOR)
+        pad = n * OVERVIEW_FACTOR - len(peaks)
+        peaks = np.pad(peaks, (0, pad)).reshape(n, -1).max(axis=1)
+        sums = np.pad(sums, (0, pad)).reshape(n, -1).sum(axis=1)
+        counts = np.pad(counts, (0, pad)).reshape(n, -1).sum(axis=1)
+        bucket *= OVERVIEW_FACTOR
+
+
+class RecordingsIndex:
+    """
+    Index of the audio files under a recordings directory. refresh() only
+    reads files that are new or whose mtime or size changed; listing,
+    sorting, filtering and overviews are served from the database alone.
+    """
+
+    def __init__(self, root="recordings", db_path=None):
+        self.root = root
+        self.db_path = db_path or os.path.join(root, INDEX_FILE)
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        with self._connect() as db:
+            db.executescript(SCHEMA)
+            if db.execute("PRAGMA user_version").fetchone()[0] < INDEX_VERSION:
+                # Overviews from older versions are recomputed on refresh
+                db.execute("DELETE FROM recordings")
+                db.execute(f"PRAGMA user_version = {INDEX_VERSION}")
+
+    @contextlib.contextmanager
+    def _connect(self):
+        # One short-lived connection per call, so any thread can use the index
+        db = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            db.execute("PRAGMA foreign_keys = ON")
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def _scan(self):
+        """
+        Yield (relative path, mtime_ns, size) for every audio file.
+        """
+        stack = [self.root]
+        while stack:
+            directory = stack.pop()
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.name.lower().endswith(AUDIO_EXTENSIONS):
+                        st = entry.stat()
+                        rel = os.path.relpath(entry.path, self.root)
+                        yield rel.replace(os.sep, "/"), st.st_mtime_ns, st.st_size
+
+    def refresh(self):
+        """
+        Bring the index up to date with the directory. Returns a dict with
+        the number of files added, updated, removed and unchanged, and the
+        time taken.
+        """
+        start = time.perf_counter()
+        with self._connect() as db:
+            known = {
+                path: (mtime_ns, size)
+                for path, mtime_ns, size in db.execute(
+                    "SELECT path, mtime_ns, size FROM recordings"
+                )
+            }
+        stats = {"added": 0, "updated": 0, "removed": 0, "unchanged": 0}
+        seen = set()
+        for path, mtime_ns, size in self._scan():
+            seen.add(path)
+            previous = known.get(path)
+            if previous == (mtime_ns, size):
+                stats["unchanged"] += 1
+                continue
+            try:
+                row, overviews = self._read_file(path, mtime_ns, size)
+            except (RuntimeError, OSError):
+                # Unreadable or not really audio; leave it out of the index
+                continue
+            with self._connect() as db:
+                db.execute("DELETE FROM overviews WHERE path = ?", (path,))
+                db.execute(
+                    "INSERT OR REPLACE INTO recordings VALUES "
+                    "(?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    row,
+                )
+                db.executemany(
+                    "INSERT INTO overviews VALUES (?, ?, ?, ?)",
+                    [
+                        (path, bucket, peaks.tobytes(), rms.tobytes())
+                        for bucket, (peaks, rms) in overviews.items()
+                    ],
+                )
+            stats["updated" if previous else "added"] += 1
+        removed = [(path,) for path in known.keys() - seen]
+        if removed:
+            with self._connect() as db:
+                db.executemany("DELETE FROM recordings WHERE path = ?", removed)
+            stats["removed"] = len(removed)
+        stats["elapsed"] = time.perf_counter() - start
+        return stats
+
+    def _read_file(self, path, mtime_ns, size):
+        file_path = os.path.join(self.root, path)
+        info = sf.info(file_path)
+        row = (
+            path,
+            mtime_ns,
+            size,
+            info.frames,
+            info.samplerate,
+            info.channels,
+            info.frames / info.samplerate,
+            info.format,
+            info.subtype,
+            file_fingerprint(file_path, content_hash=True),
+        )
+        return row, compute_overviews(file_path)
+
+    def list(self, order_by="path", descending=False, contains=None):
+        """
+        Return indexed recordings as dicts, sorted by one of SORT_COLUMNS
+        and optionally filtered to paths containing a substring.
+        """
+        if order_by not in SORT_COLUMNS:
+            raise ValueError(f"Cannot sort by {order_by!r}")
+        query = "SELECT * FROM recordings"
+        params = ()
+        if contains:
+            query += " WHERE instr(lower(path), lower(?)) > 0"
+            params = (contains,)
+        query += f" ORDER BY {order_by} {'DESC' if descending else 'ASC'}, path"
+        with self._connect() as db:
+            db.row_factory = sqlite3.Row
+            return [dict(row) for row in db.execute(query, params)]
+
+    def get(self, path):
+        """
+        Return the metadata dict for one recording, or None.
+        """
+        with self._connect() as db:
+            db.row_factory = sqlite3.Row
+            row = db.execute(
+                "SELECT * FROM recordings WHERE path = ?", (path,)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def overview(self, path, width):
+        """
+        Return (peaks, rms) float32 arrays from the coarsest overview with at
+        least width buckets (or the finest available), or None if the file
+        isn't indexed.
+        """
+        with self._connect() as db:
+            rows = db.execute(
+                "SELECT bucket, peaks, rms FROM overviews WHERE path = ? "
+                "ORDER BY bucket DESC",
+                (path,),
+            ).fetchall()
+        if not rows:
+            return None
+        for bucket, peaks, rms in rows:
+            # float32 blobs: 4 bytes per bucket
+            if len(peaks) // 4 >= width:
+                break
+        return np.frombuffer(peaks, dtype=np.float32), np.frombuffer(
+            rms, dtype=np.float32
+        )
@@ -0,0 +1,176 @@
+# render_cache.py
+# LRU cache of rendered audio keyed by source file and effect parameters
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from audio_processing import effects_key
+
+
+def file_fingerprint(file_path, content_hash=False):
+    """
+    Identify a source file either by path, mtime and size (cheap) or by a
+    hash of its contents (survives renames and copies).
+    """
+    if content_hash:
+        digest = hashlib.blake2b(digest_size=20)
+        with open(file_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+    st = os.stat(file_path)
+    return f"{os.path.realpath(file_path)}:{st.st_mtime_ns}:{st.st_size}"
+
+
+class RenderCache:
+    """
+    In-memory LRU cache of rendered (audio, sample_rate) pairs with a byte
+    budget. Entries evicted from memory are spilled to cache_dir when one is
+    given, and found there again on the next lookup. They are written after
+    the lock is released, so lookups never wait on a disk write.
+    """
+
+    def __init__(self, max_bytes=512 * 1024 * 1024, cache_dir=None, content_hash=False):
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self.content_hash = content_hash
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        # Evicted entries that are still being written to cache_dir
+        self._spilling = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def make_key(self, file_path, effects, sample_rate=None):
+        """
+        Build the cache key for a file rendered with the given effects,
+        optionally after conversion to sample_rate.
+        """
+        source = file_fingerprint(file_path, self.content_hash)
+        if sample_rate:
+            source = f"{source}@{sample_rate}"
+        return hashlib.blake2b(
+            f"{source}|{effects_key(effects)}".encode(), digest_size=20
+        ).hexdigest()
+
+    def get(self, key):
+        """
+        Return (audio, sample_rate) for the key, or None on a miss. The
+        audio is read-only, as every hit shares it.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            entry = self._spilling.get(key)
+        if entry is None:
+            entry = self._load_spilled(key)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            evicted = self._insert(key, entry)
+        self._spill(evicted)
+        return entry
+
+    def put(self, key, audio_ar, sample_rate):
+        """
+        Store a rendered result. A read-only copy is kept, since it is shared
+        with every later hit, and the caller's array is left as it is.
+        Arrays that are already read-only are stored without copying.
+        """
+        if audio_ar.flags.writeable:
+            audio_ar = audio_ar.copy()
+            audio_ar.setflags(write=False)
+        with self._lock:
+            evicted = self._insert(key, (audio_ar, sample_rate))
+        self._spill(evicted)
+
+    def __contains__(self, key):
+        # Checks memory only and doesn't count as a lookup
+        with self._lock:
+            return key in self._entries
+
+    def stats(self):
+        """
+        Return hit/miss counters and current memory usage.
+        """
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._spilling.clear()
+            self._bytes = 0
+
+    def _insert(self, key, entry):
+        # Called with the lock held. Returns the evicted entries that still
+        # have to be spilled, which the caller does after releasing it.
+        evicted = []
+        if key in self._entries:
+            self._bytes -= self._entries.pop(key)[0].nbytes
+        self._entries[key] = entry
+        self._bytes += entry[0].nbytes
+        while self._bytes > self.max_bytes and self._entries:
+            old_key, old_entry = self._entries.popitem(last=False)
+            self._bytes -= old_entry[0].nbytes
+            self.evictions += 1
+            if self.cache_dir:
+                self._spilling[old_key] = old_entry
+                evicted.append((old_key, old_entry))
+        return evicted
+
+    def _spill_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.npz")
+
+    def _spill(self, evicted):
+        try:
+            for key, entry in evicted:
+                path = self._spill_path(key)
+                if os.path.exists(path):
+                    continue
+                # Write to a temp file first so readers never see a partial
+                # entry; the thread id keeps concurrent spills of one key apart
+                tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(tmp_path, "wb") as f:
+                    np.savez(f, audio=entry[0], sample_rate=entry[1])
+                os.replace(tmp_path, path)
+        finally:
+            with self._lock:
+                for key, _ in evicted:
+                    self._spilling.pop(key, None)
+
+    def _load_spilled(self, key):
+        if not self.cache_dir:
+            return None
+        path = self._spill_path(key)
+        try:
+            with np.load(path) as data:
+                audio_ar = data["audio"]
+                sample_rate = int(data["sample_rate"])
+        except (OSError, ValueError, KeyError):
+            return None
+        audio_ar.setflags(write=False)
+        return audio_ar, sample_rate
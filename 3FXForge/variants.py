@@ -0,0 +1,202 @@
+# variants.py
+# Render many effect settings of one recording in parallel
+
+import argparse
+import itertools
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from audio_processing import apply_effects, load_audio, save_wav
+from effect_chain import is_chain_spec, load_spec
+
+# Decoded input, memory-mapped read-only in each worker process
+_shared_audio = None
+_shared_sample_rate = None
+
+
+def sweep(base, grid):
+    """
+    Expand a grid of parameter values over a base effects dict into a list
+    of variants, e.g. sweep({"reverb": True, "compressor": True},
+    {"room_size": [0.1, 0.5], "ratio": [2, 4]}) gives four variants.
+    Effect chains can't be swept and raise ValueError.
+    """
+    if not isinstance(base, dict) or is_chain_spec(base):
+        raise ValueError(
+            "Only a flat effects dict such as "
+            '{"reverb": true} can be swept, not an effect chain'
+        )
+    names = list(grid)
+    return [
+        {**base, **dict(zip(names, values))}
+        for values in itertools.product(*(grid[name] for name in names))
+    ]
+
+
+def _attach(audio_path, sample_rate):
+    global _shared_audio, _shared_sample_rate
+    _shared_audio = np.load(audio_path, mmap_mode="r")
+    _shared_sample_rate = sample_rate
+
+
+def _render_variant(index, effects, output_dir, file_name):
+    start = time.perf_counter()
+    processed_audio = apply_effects(_shared_audio, _shared_sample_rate, effects)
+    if output_dir is None:
+        result = processed_audio
+    else:
+        save_wav(processed_audio, _shared_sample_rate, file_name, base_path=output_dir)
+        result = os.path.join(output_dir, file_name)
+    return index, result, time.perf_counter() - start
+
+
+def render_variants(file_path, variants, workers=None, output_dir=None):
+    """
+    Render each effects dict or chain in variants over one recording,
+    decoding it only once. The decoded audio is written to a temporary
+    .npy file that every worker memory-maps read-only, so the pages are
+    shared rather than copied per process.
+
+    Yields (index, effects, result) as variants finish, in completion
+    order. result is the rendered (channels, samples) array, or the WAV
+    path when output_dir is given.
+    """
+    workers = workers or os.cpu_count() or 1
+    audio_ar, sr = load_audio(file_path)
+    stem = os.path.splitext(os.path.basename(file_path))[0]
+    if output_dir is not None:
+        os.makedirs(output_dir, exist_ok=True)
+
+    fd, audio_path = tempfile.mkstemp(suffix=".npy")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            np.save(f, np.ascontiguousarray(audio_ar))
+        del audio_ar
+        with ProcessPoolExecutor(
+            max_workers=workers, initializer=_attach, initargs=(audio_path, sr)
+        ) as pool:
+            futures = [
+                pool.submit(
+                    _render_variant,
+                    i,
+                    effects,
+                    output_dir,
+                    f"processed_{stem}_{i:03d}.wav",
+                )
+                for i, effects in enumerate(variants)
+            ]
+            for future in as_completed(futures):
+                index, result, _ = future.result()
+                yield index, variants[index], result
+    finally:
+        os.remove(audio_path)
+
+
+def bench_scaling(file_path, variants, worker_counts=None):
+    """
+    Render the variants with increasing pool sizes and print variants/sec
+    and the speedup over one worker.
+    """
+    cores = os.cpu_count() or 1
+    if worker_counts is None:
+        worker_counts = sorted({1, 2, 4, 8, cores} & set(range(1, cores + 1)))
+    print(f"{len(variants)} variants of {file_path} on {cores} cores")
+    baseline = None
+    for workers in worker_counts:
+        with tempfile.TemporaryDirectory() as output_dir:
+            start = time.perf_counter()
+            for _ in render_variants(file_path, variants, workers, output_dir):
+                pass
+            elapsed = time.perf_counter() - start
+        baseline = baseline or elapsed
+        print(
+            f"{workers:>3} workers: {elapsed:7.2f}s, "
+            f"{len(variants) / elapsed:6.2f} variants/sec, "
+            f"{baseline / elapsed:.2f}x"
+        )
+
+
+def parse_grid(items):
+    """
+    Parse NAME=V1,V2,... arguments into a grid of float values.
+    """
+    grid = {}
+    for item in items:
+        name, sep, values = item.partition("=")
+        if not sep or not values:
+            raise ValueError(f"Expected NAME=V1,V2,... but got {item!r}")
+        grid[name] = [float(v) for v in values.split(",")]
+    return grid
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Render a recording with many effect settings in parallel."
+    )
+    parser.add_argument("input", help="WAV file to render.")
+    parser.add_argument(
+        "--effects",
+        default='{"reverb": true, "compressor": true}',
+        help="Base effects dict as a JSON file or inline JSON; effect chains "
+        "can't be swept (default: reverb and compressor on).",
+    )
+    parser.add_argument(
+        "--sweep",
+        nargs="+",
+        required=True,
+        metavar="NAME=V1,V2,...",
+        help="Values to sweep, e.g. room_size=0.1,0.5,0.9 ratio=1,2,4,8.",
+    )
+    parser.add_argument(
+        "--output-dir",
+        default=os.path.join("recordings", "variants"),
+        help="Directory for rendered variants (default: recordings/variants).",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Number of worker processes (default: number of CPU cores).",
+    )
+    parser.add_argument(
+        "--benchmark",
+        action="store_true",
+        help="Time the sweep at increasing worker counts instead of keeping it.",
+    )
+    args = parser.parse_args(argv)
+
+    try:
+        variants = sweep(load_spec(args.effects), parse_grid(args.sweep))
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.benchmark:
+        bench_scaling(args.input, variants)
+        return 0
+
+    start = time.perf_counter()
+    manifest = {}
+    for index, effects, path in render_variants(
+        args.input, variants, args.workers, args.output_dir
+    ):
+        manifest[os.path.basename(path)] = effects
+        print(f"{path}: {json.dumps(effects, sort_keys=True)}")
+    elapsed = time.perf_counter() - start
+    # Record which settings produced which file
+    with open(os.path.join(args.output_dir, "variants.json"), "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    print(
+        f"Rendered {len(variants)} variants in {elapsed:.2f}s "
+        f"({len(variants) / elapsed:.2f} variants/sec)"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,519 @@
+# benchmarks.py
+# Drum3x - Headless benchmarks for the audio and recording hot paths
+
+import argparse
+import heapq
+import json
+import os
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from ctypes import c_int
+
+import numpy as np
+
+from bounce import bounce
+from groove import apply_tempo_map, humanize, quantize, stretch, swing
+from bindings import BEAT_RECORD_DTYPE, load_library, read_recording, write_recording
+from kit import load_kit
+from layers import LayerStack, merge_layers
+from mixer import BLOCK_SIZE, DrumMixer
+from pattern_file import HEADER_SIZE, load_pattern, save_pattern
+from sequencer import Sequencer
+
+BEATS_DIR = "beats"
+
+
+def bench_mixer(kit, polyphonies=(1, 2, 4, 8, 16, 32, 64), blocks=500):
+    """
+    Time DrumMixer.render per block with a fixed number of voices sounding.
+    """
+    print(f"Mixer render time per {BLOCK_SIZE}-frame block")
+    print(f"{'voices':>8} {'mean us':>10} {'p99 us':>10} {'% of block':>11}")
+    longest = int(np.argmax(kit.lengths))
+    for polyphony in polyphonies:
+        mixer = DrumMixer(kit, max_voices=polyphony)
+        for _ in range(polyphony):
+            mixer.trigger(longest)
+        mixer.render()
+        times = []
+        for _ in range(blocks):
+            # Keep the voice count constant once voices start to finish
+            for _ in range(polyphony - mixer.active_voices()):
+                mixer.trigger(longest)
+            start = time.perf_counter()
+            mixer.render()
+            times.append(time.perf_counter() - start)
+        us = np.array(times) * 1e6
+        budget_us = BLOCK_SIZE / mixer.sample_rate * 1e6
+        print(
+            f"{polyphony:>8} {us.mean():>10.1f} {np.percentile(us, 99):>10.1f} "
+            f"{100 * us.mean() / budget_us:>10.1f}%"
+        )
+
+
+def bench_bounce(samples, minutes=10, hits_per_sec=8):
+    """
+    Time an offline bounce of a random pattern of the given length.
+    """
+    rng = np.random.default_rng(0)
+    hits = int(minutes * 60 * hits_per_sec)
+    beat_ids = rng.integers(0, len(samples), hits)
+    timestamps = np.sort(rng.uniform(0, minutes * 60, hits))
+    start = time.perf_counter()
+    audio_ar = bounce(beat_ids, timestamps, samples)
+    elapsed = time.perf_counter() - start
+    print(
+        f"Bounced {hits} hits ({len(audio_ar) / 44100:.0f}s of audio) in "
+        f"{elapsed * 1000:.0f} ms ({len(audio_ar) / 44100 / elapsed:.0f}x realtime)"
+    )
+
+
+def random_records(size, seed=0):
+    """
+    A reproducible pattern of size hits with random gaps of up to 0.1 s.
+    """
+    rng = np.random.default_rng(seed)
+    records = np.zeros(size, dtype=BEAT_RECORD_DTYPE)
+    records["timestamp_ns"] = np.cumsum(rng.integers(1, 10**8, size))
+    records["beat_id"] = rng.integers(0, 9, size)
+    return records
+
+
+def fill_recording(lib, events):
+    lib.start_recording()
+    for i in range(events):
+        lib.record_beat(i % 9)
+    lib.stop_recording()
+
+
+def bench_export(lib, sizes=(1_000, 100_000, 1_000_000)):
+    """
+    Compare reading a recording with the per-index getters against the
+    bulk read_recording export.
+    """
+    print(f"{'events':>10} {'per-index ms':>14} {'bulk ms':>10} {'speedup':>9}")
+    for size in sizes:
+        fill_recording(lib, size)
+
+        start = time.perf_counter()
+        beat_ids = [lib.get_recorded_beat_id(c_int(i)) for i in range(size)]
+        timestamps = [lib.get_recorded_beat_timestamp_ns(c_int(i)) for i in range(size)]
+        per_index = time.perf_counter() - start
+
+        start = time.perf_counter()
+        records = read_recording(lib)
+        bulk = time.perf_counter() - start
+
+        assert records["beat_id"].tolist() == beat_ids
+        assert records["timestamp_ns"].tolist() == timestamps
+        print(
+            f"{size:>10} {per_index * 1000:>14.2f} {bulk * 1000:>10.3f} "
+            f"{per_index / bulk:>8.0f}x"
+        )
+    lib.free_recording()
+
+
+def stress_recording(lib, threads=16, beats_per_thread=20_000):
+    """
+    Hammer record_beat from many threads while another thread keeps taking
+    snapshots, then check that every beat landed exactly once.
+    """
+    lib.start_recording()
+    barrier = threading.Barrier(threads + 1)
+    writing = threading.Event()
+    writing.set()
+    snapshot_errors = []
+
+    def writer(beat_id):
+        barrier.wait()
+        for _ in range(beats_per_thread):
+            lib.record_beat(beat_id)
+
+    def reader():
+        barrier.wait()
+        last_length = 0
+        while writing.is_set():
+            records = read_recording(lib)
+            if len(records) < last_length:
+                snapshot_errors.append("snapshot shrank")
+            if (
+                len(records)
+                and not (
+                    (records["beat_id"] >= 0) & (records["beat_id"] < threads)
+                ).all()
+            ):
+                snapshot_errors.append("snapshot contains unwritten records")
+            last_length = len(records)
+
+    workers = [threading.Thread(target=writer, args=(i,)) for i in range(threads)]
+    reader_thread = threading.Thread(target=reader)
+    start = time.perf_counter()
+    for t in workers + [reader_thread]:
+        t.start()
+    for t in workers:
+        t.join()
+    writing.clear()
+    reader_thread.join()
+    elapsed = time.perf_counter() - start
+    lib.stop_recording()
+
+    records = read_recording(lib)
+    counts = np.bincount(records["beat_id"], minlength=threads)
+    expected = threads * beats_per_thread
+    ok = (
+        len(records) == expected
+        and (counts == beats_per_thread).all()
+        and lib.get_dropped_beats() == 0
+        and not snapshot_errors
+    )
+    print(
+        f"{threads} threads x {beats_per_thread} beats: {len(records)}/{expected} "
+        f"recorded, {lib.get_dropped_beats()} dropped, "
+        f"{len(set(snapshot_errors))} snapshot errors in {elapsed:.2f}s "
+        f"-> {'OK' if ok else 'FAILED'}"
+    )
+    lib.free_recording()
+    return ok
+
+
+def bench_pattern_io(lib, sizes=(1_000_000, 4_000_000)):
+    """
+    Time saving and loading pattern files, compared with parsing the same
+    file one record at a time in Python.
+    """
+    rng = np.random.default_rng(0)
+    print(
+        f"{'events':>10} {'save ms':>9} {'mmap ms':>9} {'read ms':>9} "
+        f"{'to C ms':>9} {'per-event ms':>13}"
+    )
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in sizes:
+            records = np.zeros(size, dtype=BEAT_RECORD_DTYPE)
+            records["timestamp_ns"] = np.cumsum(rng.integers(1, 10**8, size))
+            records["beat_id"] = rng.integers(0, 9, size)
+            path = os.path.join(tmp, f"{size}.d3x")
+
+            start = time.perf_counter()
+            save_pattern(path, records)
+            save = time.perf_counter() - start
+
+            start = time.perf_counter()
+            mapped = load_pattern(path)
+            mapped_ids = int(mapped["beat_id"].sum())
+            mmap_load = time.perf_counter() - start
+
+            start = time.perf_counter()
+            loaded = load_pattern(path, mmap=False)
+            read = time.perf_counter() - start
+
+            start = time.perf_counter()
+            write_recording(lib, loaded)
+            to_c = time.perf_counter() - start
+
+            start = time.perf_counter()
+            with open(path, "rb") as f:
+                f.seek(HEADER_SIZE)
+                parsed = [
+                    (timestamp_ns, beat_id)
+                    for timestamp_ns, beat_id, _ in struct.iter_unpack("<qii", f.read())
+                ]
+            per_event = time.perf_counter() - start
+
+            assert mapped_ids == int(records["beat_id"].sum())
+            assert np.array_equal(
+                read_recording(lib)["timestamp_ns"], records["timestamp_ns"]
+            )
+            assert len(parsed) == size
+            print(
+                f"{size:>10} {save * 1000:>9.1f} {mmap_load * 1000:>9.1f} "
+                f"{read * 1000:>9.1f} {to_c * 1000:>9.1f} {per_event * 1000:>13.1f}"
+            )
+            del mapped
+    lib.free_recording()
+
+
+def bench_groove(size=1_000_000, runs=5):
+    """
+    Time each groove transform on a random pattern, compared with quantizing
+    it one event at a time in Python.
+    """
+    records = random_records(size)
+    transforms = {
+        "quantize": lambda: quantize(records, 120, strength=0.8),
+        "swing": lambda: swing(records, 120, 1 / 3),
+        "humanize": lambda: humanize(records, 5.0, seed=0),
+        "stretch": lambda: stretch(records, 120, 96),
+        "tempo map": lambda: apply_tempo_map(records, 120, [(0, 120), (64, 140)]),
+    }
+    print(f"Groove transforms on {size} events (median of {runs} runs)")
+    for name, fn in transforms.items():
+        stats = time_runs(fn, runs)
+        print(f"{name:>10} {stats['median_s'] * 1000:>9.1f} ms")
+
+    step = 60e9 / 120 / 4
+    start = time.perf_counter()
+    [round(t / step) * step for t in records["timestamp_ns"].tolist()]
+    print(f"{'per-event':>10} {(time.perf_counter() - start) * 1000:>9.1f} ms")
+
+
+def random_layers(layers=100, events=10_000, loop_ns=8 * 10**9):
+    """
+    A LayerStack of takes of random hits over up to three passes of the loop.
+    """
+    rng = np.random.default_rng(0)
+    stack = LayerStack(loop_ns)
+    for i in range(layers):
+        take = np.zeros(events, dtype=BEAT_RECORD_DTYPE)
+        take["timestamp_ns"] = np.sort(rng.integers(0, 3 * loop_ns, events))
+        take["beat_id"] = i % 9
+        stack.add(take)
+    return stack
+
+
+def bench_layers(layers=100, events=10_000, runs=5):
+    """
+    Time reading the merged layers of a loop recording, against merging
+    them from scratch and merging them one event at a time with heapq.
+    """
+    start = time.perf_counter()
+    stack = random_layers(layers, events)
+    build = time.perf_counter() - start
+    takes = [stack.layer(i) for i in range(len(stack))]
+    take = takes[-1]
+
+    def read_muted():
+        stack.mute(0)
+        merged = stack.merged()
+        stack.mute(0, False)
+        return merged
+
+    def overdub():
+        stack.add(take)
+        stack.undo()
+
+    def heap_merge():
+        columns = [
+            zip(t["timestamp_ns"].tolist(), t["beat_id"].tolist()) for t in takes
+        ]
+        return list(heapq.merge(*columns))
+
+    print(f"{layers} layers x {events} events (median of {runs} runs)")
+    print(f"{'build layer by layer':>28} {build * 1000:>9.1f} ms")
+    for name, fn in (
+        ("read with a layer muted", read_muted),
+        ("overdub + undo", overdub),
+        ("k-way merge from scratch", lambda: merge_layers(takes)),
+        ("heapq.merge per event", heap_merge),
+    ):
+        stats = time_runs(fn, runs)
+        print(f"{name:>28} {stats['median_s'] * 1000:>9.1f} ms")
+
+
+def render_in_realtime(mixer, stop):
+    """
+    Stand in for the sound card: render a block every block's duration
+    until stop is set.
+    """
+    period = mixer.block_size / mixer.sample_rate
+    deadline = time.perf_counter()
+    while not stop.is_set():
+        mixer.render()
+        deadline += period
+        wait = deadline - time.perf_counter()
+        if wait > 0:
+            time.sleep(wait)
+
+
+def bench_sequencer(kit, seconds=10, bpm=120):
+    """
+    Play sixteenth notes through the Sequencer with the mixer rendered in
+    real time (no sound device needed) and print how late hits started
+    and how late the scheduling thread woke.
+    """
+    hits = int(seconds * bpm / 60 * 4)
+    records = np.zeros(hits, dtype=BEAT_RECORD_DTYPE)
+    records["timestamp_ns"] = np.arange(hits) * (15 * 10**9 // bpm)
+    records["beat_id"] = np.arange(hits) % len(kit)
+
+    mixer = DrumMixer(kit)
+    stop = threading.Event()
+    device = threading.Thread(target=render_in_realtime, args=(mixer, stop))
+    device.start()
+    sequencer = Sequencer(mixer)
+    try:
+        token = sequencer.play(records)
+        while sequencer.events.get() != (token, "finished"):
+            pass
+    finally:
+        sequencer.close()
+        stop.set()
+        device.join()
+    print(f"{hits} hits over {seconds}s")
+    print("Hit start after its scheduled sample:")
+    print(sequencer.hit_jitter.format())
+    print("Scheduler wake-up after its target time:")
+    print(sequencer.wake_jitter.format())
+
+
+def bench_startup(beats_dir=BEATS_DIR, runs=5):
+    """
+    Time loading the kit in a fresh process with an empty cache (cold) and
+    with the cache in place (warm).
+    """
+    script = (
+        "import sys, time; start = time.perf_counter(); "
+        "from kit import load_kit; "
+        "loaded = time.perf_counter(); "
+        "kit = load_kit(sys.argv[1], cache_dir=sys.argv[2]); "
+        "kit.bank.sum(); "
+        "print(loaded - start, time.perf_counter() - loaded)"
+    )
+    cache_dir = tempfile.mkdtemp()
+    try:
+        results = {"cold": [], "warm": []}
+        for _ in range(runs):
+            shutil.rmtree(cache_dir, ignore_errors=True)
+            for name in ("cold", "warm"):
+                output = subprocess.run(
+                    [sys.executable, "-c", script, beats_dir, cache_dir],
+                    capture_output=True,
+                    text=True,
+                    check=True,
+                )
+                results[name].append([float(t) for t in output.stdout.split()])
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+    print("Kit startup in a fresh process (median of {} runs)".format(runs))
+    for name, times in results.items():
+        imports, load = np.median(np.array(times), axis=0) * 1000
+        print(f"{name:>5}: imports {imports:.0f} ms, kit load {load:.1f} ms")
+
+
+def time_runs(fn, runs=5, setup=None):
+    """
+    Call fn once to warm up, then runs times, calling setup (untimed)
+    before each call. Returns timing stats in seconds.
+    """
+    times = []
+    for i in range(runs + 1):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        fn()
+        if i:
+            times.append(time.perf_counter() - start)
+    return {
+        "median_s": float(np.median(times)),
+        "min_s": float(np.min(times)),
+        "runs": runs,
+    }
+
+
+def run_suite(lib, kit, runs=5):
+    """
+    Time the recording, export, mixing and bounce paths on fixed workloads.
+    Returns {name: stats}.
+    """
+    results = {}
+    results["record_beat[100k]"] = time_runs(lambda: fill_recording(lib, 100_000), runs)
+
+    rng = np.random.default_rng(0)
+    records = np.zeros(1_000_000, dtype=BEAT_RECORD_DTYPE)
+    records["timestamp_ns"] = np.cumsum(rng.integers(1, 10**8, len(records)))
+    records["beat_id"] = rng.integers(0, 9, len(records))
+    results["write_recording[1M]"] = time_runs(
+        lambda: write_recording(lib, records), runs
+    )
+    results["read_recording[1M]"] = time_runs(lambda: read_recording(lib), runs)
+    lib.free_recording()
+    results["quantize[1M]"] = time_runs(lambda: quantize(records, 120), runs)
+    results["humanize[1M]"] = time_runs(lambda: humanize(records, 5.0, 0), runs)
+
+    stack = random_layers()
+    layers = [stack.layer(i) for i in range(len(stack))]
+    results["merge_layers[100x10k]"] = time_runs(lambda: merge_layers(layers), runs)
+
+    longest = int(np.argmax(kit.lengths))
+    mixer = DrumMixer(kit, max_voices=32)
+
+    def render_blocks():
+        for _ in range(500):
+            for _ in range(32 - mixer.active_voices()):
+                mixer.trigger(longest)
+            mixer.render()
+
+    results["mixer_render[32 voices x 500 blocks]"] = time_runs(render_blocks, runs)
+
+    minutes, hits = 1, 480
+    beat_ids = rng.integers(0, len(kit), hits)
+    timestamps = np.sort(rng.uniform(0, minutes * 60, hits))
+    results["bounce[1 min]"] = time_runs(
+        lambda: bounce(beat_ids, timestamps, kit.samples), runs
+    )
+    # Dense enough that the pads are rendered by convolution
+    dense_ids = rng.integers(0, len(kit), 40000)
+    dense_timestamps = np.sort(rng.uniform(0, 10, 40000))
+    results["bounce[10 s x 4000 hits/s]"] = time_runs(
+        lambda: bounce(dense_ids, dense_timestamps, kit.samples), runs
+    )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drum3x benchmarks")
+    parser.add_argument(
+        "benchmark",
+        choices=[
+            "mixer",
+            "bounce",
+            "export",
+            "stress",
+            "pattern",
+            "groove",
+            "layers",
+            "sequencer",
+            "startup",
+            "suite",
+        ],
+    )
+    parser.add_argument("--beats-dir", default=BEATS_DIR)
+    parser.add_argument("--runs", type=int, default=5, help="Runs per suite item.")
+    parser.add_argument("--json", help="Write the suite results to this file.")
+    args = parser.parse_args()
+
+    if args.benchmark == "mixer":
+        bench_mixer(load_kit(args.beats_dir))
+    elif args.benchmark == "bounce":
+        bench_bounce(load_kit(args.beats_dir).samples)
+    elif args.benchmark == "export":
+        bench_export(load_library())
+    elif args.benchmark == "stress":
+        if not stress_recording(load_library()):
+            raise SystemExit(1)
+    elif args.benchmark == "pattern":
+        bench_pattern_io(load_library())
+    elif args.benchmark == "groove":
+        bench_groove()
+    elif args.benchmark == "layers":
+        bench_layers()
+    elif args.benchmark == "sequencer":
+        bench_sequencer(load_kit(args.beats_dir))
+    elif args.benchmark == "startup":
+        bench_startup(args.beats_dir)
+    elif args.benchmark == "suite":
+        results = run_suite(load_library(), load_kit(args.beats_dir), args.runs)
+        print(f"Median of {args.runs} runs")
+        for name, stats in results.items():
+            print(f"{name:>36} {stats['median_s'] * 1000:>10.2f} ms")
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
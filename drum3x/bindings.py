@@ -0,0 +1,63 @@
+# bindings.py
+# Drum3x - ctypes bindings for the C recording library
+
+import sys
+from ctypes import cdll, c_int, c_int64, c_void_p
+
+import numpy as np
+
+# Matches BeatRecord in drum3x.c
+BEAT_RECORD_DTYPE = np.dtype(
+    [("timestamp_ns", "<i8"), ("beat_id", "<i4"), ("tag", "<i4")]
+)
+
+
+def load_library(path=None):
+    """
+    Load the compiled C library and set up its function prototypes.
+    """
+    if path is None:
+        path = "drum3x.dll" if sys.platform.startswith("win") else "./libdrum3x.so"
+    lib = cdll.LoadLibrary(path)
+
+    lib.start_recording.restype = None
+    lib.stop_recording.restype = None
+    lib.free_recording.restype = None
+    lib.record_beat.argtypes = [c_int]
+    lib.record_beat.restype = None
+    lib.get_recording_length.restype = c_int
+    lib.get_dropped_beats.restype = c_int64
+    lib.get_recorded_beat_id.argtypes = [c_int]
+    lib.get_recorded_beat_id.restype = c_int
+    lib.get_recorded_beat_timestamp.argtypes = [c_int]
+    lib.get_recorded_beat_timestamp.restype = c_int
+    lib.get_recorded_beat_timestamp_ns.argtypes = [c_int]
+    lib.get_recorded_beat_timestamp_ns.restype = c_int64
+    lib.copy_recording.argtypes = [c_void_p, c_int, c_int]
+    lib.copy_recording.restype = c_int
+    lib.load_recording.argtypes = [c_void_p, c_int]
+    lib.load_recording.restype = c_int
+    return lib
+
+
+def read_recording(lib, start=0, count=None):
+    """
+    Return recorded beats as a BEAT_RECORD_DTYPE structured array, copied
+    out of the C store in a single call.
+    """
+    if count is None:
+        count = max(lib.get_recording_length() - start, 0)
+    records = np.empty(count, dtype=BEAT_RECORD_DTYPE)
+    if count:
+        copied = lib.copy_recording(records.ctypes.data_as(c_void_p), start, count)
+        records = records[:copied]
+    return records
+
+
+def write_recording(lib, records):
+    """
+    Replace the C store's recording with the given records in a single
+    call. Returns the number of records loaded.
+    """
+    records = np.ascontiguousarray(records, dtype=BEAT_RECORD_DTYPE)
+    return lib.load_recording(records.ctypes.data_as(c_void_p), len(records))
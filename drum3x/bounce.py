@@ -0,0 +1,107 @@
+# bounce.py
+# Drum3x - Sample-accurate offline rendering of recordings to WAV
+
+import os
+
+import numpy as np
+import soundfile as sf
+
+from kit import SAMPLE_RATE
+from metrics import METRICS
+
+# 3FXForge picks up WAV files from its recordings directory
+RECORDINGS_DIR = os.path.join("..", "3FXForge", "recordings")
+# Cost of transforming one sample with NumPy's FFT, in sample adds (measured
+# at about 100). Used to choose how each pad's hits are rendered.
+FFT_COST = 100
+
+
+def bounce(beat_ids, timestamps, samples, sample_rate=SAMPLE_RATE):
+    """
+    Render recorded hits into a (frames, channels) float32 buffer.
+    timestamps are in seconds from the start of the recording; each hit is
+    placed at its exact sample offset. Samples must already be at
+    sample_rate (as in Kit.samples).
+    """
+    beat_ids = np.asarray(beat_ids, dtype=np.int64)
+    offsets = np.round(np.asarray(timestamps, dtype=np.float64) * sample_rate)
+    offsets = offsets.astype(np.int64)
+    lengths = np.array([len(s) for s in samples], dtype=np.int64)
+    channels = samples[0].shape[1]
+    if len(beat_ids) == 0:
+        return np.zeros((0, channels), dtype=np.float32)
+
+    out = np.zeros(
+        (int((offsets + lengths[beat_ids]).max()), channels), dtype=np.float32
+    )
+    # One pass per pad. Slice adds cost hits x sample length, so pads hit
+    # often enough are convolved with their impulse train instead, whose
+    # cost doesn't depend on the number of hits.
+    for pad, sample in enumerate(samples):
+        pad_offsets = np.sort(offsets[beat_ids == pad])
+        if len(pad_offsets) == 0:
+            continue
+        if _convolution_is_cheaper(pad_offsets, sample):
+            _convolve_hits(out, pad_offsets, sample)
+        else:
+            n = len(sample)
+            for offset in pad_offsets:
+                out[offset : offset + n] += sample
+    # Same clipping as the realtime mixer
+    np.clip(out, -1.0, 1.0, out=out)
+    return out
+
+
+def _fft_size(n):
+    # Smallest power of two that fits a block at least as long as the sample
+    return 1 << (2 * n - 1).bit_length()
+
+
+def _convolution_is_cheaper(offsets, sample):
+    n, channels = sample.shape
+    nfft = _fft_size(n)
+    blocks = len(np.unique(offsets // (nfft - n + 1)))
+    # One forward transform of the impulses and one inverse per channel
+    convolution = FFT_COST * blocks * nfft * (1 + channels)
+    return convolution < len(offsets) * n * channels
+
+
+def _convolve_hits(out, offsets, sample):
+    """
+    Add sample to out at each of offsets (sorted) by overlap-add FFT
+    convolution of their impulse train. Only blocks with hits are
+    transformed.
+    """
+    n = len(sample)
+    nfft = _fft_size(n)
+    block = nfft - n + 1
+    # Transforms run along the last axis, so work channel by channel
+    spectrum = np.fft.rfft(np.ascontiguousarray(sample.T), nfft)
+    blocks, bounds = np.unique(offsets // block, return_index=True)
+    bounds = np.append(bounds, len(offsets))
+    for index, lo, hi in zip(blocks.tolist(), bounds[:-1], bounds[1:]):
+        start = index * block
+        # Hits on the same sample add up, as with slice adds
+        impulses = np.bincount(offsets[lo:hi] - start, minlength=nfft)
+        rendered = np.fft.irfft(np.fft.rfft(impulses) * spectrum, nfft)
+        end = min(start + nfft, len(out))
+        out[start:end] += rendered[:, : end - start].T
+
+
+def bounce_to_wav(
+    beat_ids,
+    timestamps,
+    samples,
+    file_name,
+    base_path=RECORDINGS_DIR,
+    sample_rate=SAMPLE_RATE,
+):
+    """
+    Render a recording and save it as a 24-bit WAV. Returns the file path.
+    """
+    with METRICS.time("bounce"):
+        audio_ar = bounce(beat_ids, timestamps, samples, sample_rate)
+    os.makedirs(base_path, exist_ok=True)
+    file_path = os.path.join(base_path, file_name)
+    sf.write(file_path, audio_ar, sample_rate, subtype="PCM_24")
+    return file_path
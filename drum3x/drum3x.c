@@ -3,51 +3,250 @@
 
 #include <stdio.h>
 #include <stdlib.h>
+#include <stdint.h>
+#include <string.h>
+#include <stdatomic.h>
 #include <time.h>
 
-#define MAX_RECORDING_LENGTH 1000  // Max number of beats in a recording
+#ifdef _WIN32
+#include <windows.h>
+#define cpu_relax() SwitchToThread()
+#else
+#include <sched.h>
+#define cpu_relax() sched_yield()
+#endif
+
+#define CHUNK_SIZE 4096    // Beats per chunk; the store grows one chunk at a time
+#define MAX_CHUNKS 16384   // Up to 64M beats in a recording
+#define MAX_BEATS ((int64_t)CHUNK_SIZE * MAX_CHUNKS)
 
 typedef struct {
-    int beat_id;
-    int timestamp;  
+    int64_t timestamp_ns;  // Nanoseconds since start_recording
+    int32_t beat_id;
+    _Atomic int32_t tag;   // Recording tag, stored last to publish the record
 } BeatRecord;
 
-static BeatRecord recording[MAX_RECORDING_LENGTH];
-static int recording_index = 0;
-static int is_recording = 0;
+// record_beat may be called from any number of threads at once and never
+// waits. A writer claims a slot by incrementing next_slot, fills it in and
+// publishes it by storing the current recording tag. Readers advance
+// published over the run of tagged slots, so they always see a gap-free
+// prefix of the recording. published packs the tag (high 32 bits) with the
+// length (low 32 bits), so a reader that raced a reset can't move the new
+// recording's length.
+static BeatRecord *_Atomic chunks[MAX_CHUNKS];
+static _Atomic int64_t next_slot = 0;
+static _Atomic uint64_t published = 0;
+static _Atomic int64_t capacity = MAX_BEATS;  // Lowered if a chunk can't be allocated
+static atomic_int active_writers = 0;
+static atomic_int is_recording = 0;
+// Bumped before and after every reset; odd while a reset is in progress.
+// Readers use it to detect a reset that overlapped their copy, and its
+// (even, non-zero) value tags the records of the current recording.
+static atomic_uint generation = 0;
+static atomic_flag reset_lock = ATOMIC_FLAG_INIT;
 static struct timespec recording_start_time;
 
-void start_recording() {
-    recording_index = 0;
-    is_recording = 1;
+// Stop new writers and wait for in-flight ones, then clear the store.
+// The caller holds reset_lock.
+static void reset_store(int free_chunks) {
+    atomic_store(&is_recording, 0);
+    while (atomic_load(&active_writers)) cpu_relax();
+    atomic_fetch_add(&generation, 1);
+    if (free_chunks) {
+        for (int i = 0; i < MAX_CHUNKS; i++) {
+            free(atomic_exchange(&chunks[i], NULL));
+        }
+    }
+    atomic_store(&next_slot, 0);
+    atomic_store(&capacity, MAX_BEATS);
     clock_gettime(CLOCK_MONOTONIC, &recording_start_time);
+    unsigned tag = atomic_fetch_add(&generation, 1) + 1;
+    atomic_store(&published, (uint64_t)tag << 32);
+}
+
+void start_recording() {
+    while (atomic_flag_test_and_set(&reset_lock)) cpu_relax();
+    // Allocated chunks are kept and reused by the next recording
+    reset_store(0);
+    atomic_store(&is_recording, 1);
+    atomic_flag_clear(&reset_lock);
 }
 
 void stop_recording() {
-    is_recording = 0;
+    atomic_store(&is_recording, 0);
+    // Let in-flight writers finish so the length and drop count are final
+    while (atomic_load(&active_writers)) cpu_relax();
+}
+
+// Release all chunk memory. Must not race with readers.
+void free_recording() {
+    while (atomic_flag_test_and_set(&reset_lock)) cpu_relax();
+    reset_store(1);
+    atomic_flag_clear(&reset_lock);
+}
+
+static BeatRecord *get_chunk(int64_t chunk) {
+    BeatRecord *block = atomic_load_explicit(&chunks[chunk], memory_order_acquire);
+    if (block) return block;
+    // Zeroed, so no slot carries a valid tag until it is written
+    BeatRecord *fresh = calloc(CHUNK_SIZE, sizeof(BeatRecord));
+    if (!fresh) return NULL;
+    // Another writer may have installed the chunk first; use theirs
+    if (atomic_compare_exchange_strong(&chunks[chunk], &block, fresh)) return fresh;
+    free(fresh);
+    return block;
+}
+
+static void lower_capacity(int64_t limit) {
+    int64_t current = atomic_load(&capacity);
+    while (limit < current && !atomic_compare_exchange_weak(&capacity, &current, limit));
 }
 
 void record_beat(int beat_id) {
-    if (!is_recording || recording_index >= MAX_RECORDING_LENGTH) return;
+    // Announce the writer before checking the flag so a reset either sees
+    // this writer and waits, or this writer sees the reset and leaves.
+    atomic_fetch_add(&active_writers, 1);
+    if (!atomic_load(&is_recording)) {
+        atomic_fetch_sub(&active_writers, 1);
+        return;
+    }
     struct timespec current_time;
     clock_gettime(CLOCK_MONOTONIC, &current_time);
-    int timestamp = (current_time.tv_sec - recording_start_time.tv_sec) * 1000
-                    + (current_time.tv_nsec - recording_start_time.tv_nsec) / 1000000;
-    recording[recording_index].beat_id = beat_id;
-    recording[recording_index].timestamp = timestamp;
-    recording_index++;
+    int64_t timestamp_ns =
+        (int64_t)(current_time.tv_sec - recording_start_time.tv_sec) * 1000000000
+        + (current_time.tv_nsec - recording_start_time.tv_nsec);
+
+    int32_t tag = (int32_t)atomic_load(&generation);
+    int64_t slot = atomic_fetch_add(&next_slot, 1);
+    if (slot < atomic_load(&capacity)) {
+        BeatRecord *block = get_chunk(slot / CHUNK_SIZE);
+        if (block) {
+            BeatRecord *record = &block[slot % CHUNK_SIZE];
+            record->beat_id = beat_id;
+            record->timestamp_ns = timestamp_ns;
+            atomic_store_explicit(&record->tag, tag, memory_order_release);
+        } else {
+            // Out of memory: stop handing out slots from this chunk on
+            lower_capacity(slot / CHUNK_SIZE * CHUNK_SIZE);
+        }
+    }
+    atomic_fetch_sub(&active_writers, 1);
+}
+
+// Extend the published prefix over slots whose writers have finished.
+static int64_t visible_length() {
+    uint64_t seen = atomic_load_explicit(&published, memory_order_acquire);
+    uint32_t tag = (uint32_t)(seen >> 32);
+    int64_t length = (int64_t)(seen & 0xFFFFFFFF);
+    int64_t limit = atomic_load(&next_slot);
+    int64_t max_length = atomic_load(&capacity);
+    if (limit > max_length) limit = max_length;
+
+    while (length < limit) {
+        BeatRecord *block = atomic_load_explicit(&chunks[length / CHUNK_SIZE],
+                                                 memory_order_acquire);
+        if (!block) break;
+        if (atomic_load_explicit(&block[length % CHUNK_SIZE].tag,
+                                 memory_order_acquire) != (int32_t)tag) break;
+        length++;
+    }
+    // If another reader advanced it further, or a reset started a new
+    // recording meanwhile, seen ends up larger and wins
+    uint64_t advanced = ((uint64_t)tag << 32) | (uint64_t)length;
+    while (seen < advanced &&
+           !atomic_compare_exchange_weak_explicit(&published, &seen, advanced,
+                                                  memory_order_release,
+                                                  memory_order_acquire));
+    return seen > advanced ? (int64_t)(seen & 0xFFFFFFFF) : length;
 }
 
 int get_recording_length() {
-    return recording_index;
+    return (int)visible_length();
+}
+
+// Beats claimed but never published: past capacity or out of memory.
+// Exact once stop_recording has returned.
+int64_t get_dropped_beats() {
+    return atomic_load(&next_slot) - visible_length();
+}
+
+static BeatRecord *get_record(int index) {
+    if (index < 0 || index >= visible_length()) return NULL;
+    return &chunks[index / CHUNK_SIZE][index % CHUNK_SIZE];
 }
 
 int get_recorded_beat_id(int index) {
-    if (index < 0 || index >= recording_index) return -1;
-    return recording[index].beat_id;
+    BeatRecord *record = get_record(index);
+    return record ? record->beat_id : -1;
+}
+
+int64_t get_recorded_beat_timestamp_ns(int index) {
+    BeatRecord *record = get_record(index);
+    return record ? record->timestamp_ns : -1;
+}
+
+// Copy up to count records starting at start into dst in one call.
+// Returns the number of records copied. The copy is a consistent snapshot:
+// recording may continue meanwhile, and if start_recording resets the store
+// during the copy it is retried against the new recording.
+int copy_recording(BeatRecord *dst, int start, int count) {
+    for (;;) {
+        unsigned before = atomic_load_explicit(&generation, memory_order_acquire);
+        if (before & 1) {
+            cpu_relax();
+            continue;
+        }
+        int64_t length = visible_length();
+        int wanted = count;
+        int copied = 0;
+        if (start >= 0 && wanted > 0 && start < length) {
+            if (wanted > length - start) wanted = (int)(length - start);
+            while (copied < wanted) {
+                int index = start + copied;
+                int offset = index % CHUNK_SIZE;
+                int n = CHUNK_SIZE - offset;
+                if (n > wanted - copied) n = wanted - copied;
+                memcpy(dst + copied, &chunks[index / CHUNK_SIZE][offset],
+                       n * sizeof(BeatRecord));
+                copied += n;
+            }
+        }
+        atomic_thread_fence(memory_order_acquire);
+        if (atomic_load_explicit(&generation, memory_order_relaxed) == before) {
+            return copied;
+        }
+    }
+}
+
+// Replace the store's contents with count records from src, e.g. a saved
+// pattern. Recording is stopped. Returns the number of records loaded.
+int load_recording(const BeatRecord *src, int count) {
+    while (atomic_flag_test_and_set(&reset_lock)) cpu_relax();
+    reset_store(0);
+    int32_t tag = (int32_t)atomic_load(&generation);
+    if (count > MAX_BEATS) count = (int)MAX_BEATS;
+    int loaded = 0;
+    while (loaded < count) {
+        BeatRecord *block = get_chunk(loaded / CHUNK_SIZE);
+        if (!block) break;
+        int n = CHUNK_SIZE;
+        if (n > count - loaded) n = count - loaded;
+        memcpy(block, src + loaded, n * sizeof(BeatRecord));
+        for (int i = 0; i < n; i++) {
+            atomic_store_explicit(&block[i].tag, tag, memory_order_relaxed);
+        }
+        loaded += n;
+    }
+    // Readers only look at slots below next_slot, so the records above
+    // are visible to them once it is stored
+    atomic_store(&next_slot, loaded);
+    atomic_store(&published, ((uint64_t)(uint32_t)tag << 32) | (uint64_t)loaded);
+    atomic_flag_clear(&reset_lock);
+    return loaded;
 }
 
+// Millisecond timestamp, kept for older callers
 int get_recorded_beat_timestamp(int index) {
-    if (index < 0 || index >= recording_index) return -1;
-    return recording[index].timestamp;
+    BeatRecord *record = get_record(index);
+    return record ? (int)(record->timestamp_ns / 1000000) : -1;
 }
@@ -2,41 +2,29 @@
 # Drum3x - The Ultimate Drum Pad Experience
 
 import tkinter as tk
-from tkinter import ttk
-import ctypes
-from ctypes import cdll, c_int
-import threading
+from tkinter import ttk, filedialog
+from ctypes import c_int
+import math
 import time
 import os
-import sys
-import psutil
-import pygame
+from collections import deque
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 import matplotlib.pyplot as plt
-import matplotlib.animation as animation
+from kit import load_kit
+from mixer import DrumMixer
+from bounce import bounce_to_wav
+from bindings import load_library, read_recording, write_recording
+from pattern_file import PatternWriter, load_pattern, save_pattern
+from groove import NS_PER_MINUTE, quantize
+from layers import LayerStack
+from sequencer import Sequencer
+from metrics import METRICS
 
 # Prevent Pygame from initializing the display module
 os.environ["SDL_VIDEODRIVER"] = "dummy"
-# Pygame mixer initialization
-pygame.mixer.pre_init(frequency=44100, size=-16, channels=2, buffer=512)
-pygame.mixer.init()
 
 # Loading the compiled C library
-if sys.platform.startswith("win"):
-    lib = cdll.LoadLibrary("drum3x.dll")
-else:
-    lib = cdll.LoadLibrary("./libdrum3x.so")
-    
-# Setting up the C function prototypes
-lib.start_recording.restype = None
-lib.stop_recording.restype = None
-lib.record_beat.argtypes = [c_int]
-lib.record_beat.restype = None
-lib.get_recording_length.restype = c_int
-lib.get_recorded_beat_id.argtypes = [c_int]
-lib.get_recorded_beat_id.restype = c_int
-lib.get_recorded_beat_timestamp.argtypes = [c_int]
-lib.get_recorded_beat_timestamp.restype = c_int
+lib = load_library()
 
 # Initialize Tkinter
 root = tk.Tk()
@@ -56,20 +44,28 @@ beat_filenames = [
     "SD_Snare_Drum_092.wav",
 ]
 
-# Loading beats
-beat_sounds = []
-for filename in beat_filenames:
-    filepath = os.path.join("beats", filename)
-    try:
-        beat_sound = pygame.mixer.Sound(filepath)
-        beat_sounds.append(beat_sound)
-    except pygame.error as e:
-        print(f"Error loading {filepath}: {e}")
-        exit(1)
+# Loading beats (decoded once, then memory-mapped from beats/.cache)
+try:
+    kit = load_kit("beats", beat_filenames)
+except (OSError, RuntimeError) as e:
+    print(f"Error loading beats: {e}")
+    exit(1)
+beat_samples = kit.samples
+
+# Mixer with a fixed 512-frame audio callback
+mixer = DrumMixer(kit, block_size=512, max_voices=32)
+mixer.start()
+# Plays recordings back through the mixer, scheduled to the sample
+sequencer = Sequencer(mixer)
+playback_token = None
+SEQUENCER_POLL_MS = 20
+# Position 0 of a playback sounds one block after it starts, so overdubs
+# are shifted back by this much to line up with what was heard
+PLAYBACK_LEAD_NS = mixer.block_size * 10**9 // mixer.sample_rate
 
 
 def play_beat(beat_id):
-    beat_sounds[beat_id].play()
+    mixer.trigger(beat_id)
     lib.record_beat(c_int(beat_id))
     animate_button(beat_id)
 
@@ -81,42 +77,245 @@ def animate_button(beat_id):
 
 
 # Function to start recording
+# The take in progress is appended to this file so it survives a crash
+AUTOSAVE_PATH = "last_take.d3x"
+autosave_writer = None
+# The pending root.after call of autosave_recording, so only one runs
+autosave_job = None
+# Overdub layers while loop recording (Loop ticked), None otherwise
+layer_stack = None
+overdubbing = False
+
+
+def bar_length_ns():
+    # Length of a bar of four beats at the set tempo, or None if the tempo
+    # box doesn't hold a positive number
+    try:
+        bpm = tempo_var.get()
+    except tk.TclError:
+        bpm = 0
+    if bpm <= 0:
+        status_label.config(text="Tempo must be a positive number")
+        return None
+    return 4 * NS_PER_MINUTE / bpm
+
+
 def start_recording():
+    global autosave_writer, autosave_job, layer_stack, overdubbing, playback_token
+    overdubbing = False
+    if loop_var.get():
+        # Loop recording: each take becomes a layer of a loop whose length
+        # is fixed by the first take's tempo and bar count
+        if layer_stack is None or len(layer_stack) == 0:
+            bar_ns = bar_length_ns()
+            if bar_ns is None:
+                return
+            try:
+                bars = bars_var.get()
+            except tk.TclError:
+                bars = 0
+            if bars <= 0:
+                status_label.config(text="Bars must be a positive number")
+                return
+            layer_stack = LayerStack(bars * bar_ns)
+        if len(layer_stack):
+            playback_token = sequencer.play(
+                layer_stack.merged(), loop=(0, layer_stack.loop_ns)
+            )
+            overdubbing = True
+    else:
+        layer_stack = None
+        refresh_layers()
     lib.start_recording()
-    status_label.config(text="Recording...")
+    cancel_autosave()
+    if autosave_writer is not None:
+        autosave_writer.close()
+    autosave_writer = PatternWriter(AUTOSAVE_PATH, append=False)
+    autosave_job = root.after(1000, autosave_recording)
+    if layer_stack is not None:
+        status_label.config(text=f"Recording layer {len(layer_stack) + 1}...")
+    else:
+        status_label.config(text="Recording...")
+
+
+def autosave_recording():
+    global autosave_job
+    autosave_job = None
+    if autosave_writer is None:
+        return
+    autosave_writer.append(read_recording(lib, start=autosave_writer.count))
+    autosave_job = root.after(1000, autosave_recording)
+
+
+def cancel_autosave():
+    global autosave_job
+    if autosave_job is not None:
+        root.after_cancel(autosave_job)
+        autosave_job = None
 
 
 # Function to stop recording
 def stop_recording():
+    global autosave_writer
     lib.stop_recording()
-    status_label.config(text="Stopped")
+    sequencer.stop()
+    added_layer = False
+    cancel_autosave()
+    if autosave_writer is not None:
+        autosave_writer.append(read_recording(lib, start=autosave_writer.count))
+        autosave_writer.close()
+        autosave_writer = None
+        if layer_stack is not None:
+            add_layer()
+            added_layer = True
+    dropped = lib.get_dropped_beats()
+    if dropped:
+        status_label.config(text=f"Stopped ({dropped} beats dropped)")
+    elif not added_layer:
+        status_label.config(text="Stopped")
+
+
+# Functions to manage the layers of a loop recording. The C store always
+# holds the merged unmuted layers, so Play, Bounce and Save use them.
+def add_layer():
+    take = read_recording(lib)
+    if len(take):
+        offset_ns = PLAYBACK_LEAD_NS if overdubbing else 0
+        layer_stack.add(take, offset_ns=offset_ns)
+        status_label.config(
+            text=f"Added layer {len(layer_stack)} ({len(take)} beats)"
+        )
+    else:
+        status_label.config(text="Stopped (empty take, no layer added)")
+    write_recording(lib, layer_stack.merged())
+    refresh_layers()
+
+
+def undo_layer():
+    if autosave_writer is not None:
+        status_label.config(text="Stop recording before undoing a layer")
+        return
+    if layer_stack is None or not layer_stack.undo():
+        status_label.config(text="No layer to undo")
+        return
+    write_recording(lib, layer_stack.merged())
+    refresh_layers()
+    status_label.config(text=f"Removed layer {len(layer_stack) + 1}")
+
+
+def toggle_layer_mute(event):
+    selected = layer_list.curselection()
+    if layer_stack is None or not selected or autosave_writer is not None:
+        return
+    index = selected[0]
+    layer_stack.mute(index, not layer_stack.is_muted(index))
+    write_recording(lib, layer_stack.merged())
+    refresh_layers()
+
+
+def refresh_layers():
+    layer_list.delete(0, tk.END)
+    if layer_stack is None:
+        return
+    for index in range(len(layer_stack)):
+        muted = " (muted)" if layer_stack.is_muted(index) else ""
+        beats = len(layer_stack.layer(index))
+        layer_list.insert(tk.END, f"Layer {index + 1}: {beats} beats{muted}")
 
 
-# Function to play back recording
+# Function to play back recording; playing again restarts it
 def play_recording():
-    recording_length = lib.get_recording_length()
-    if recording_length == 0:
+    global playback_token
+    records = read_recording(lib)
+    if len(records) == 0:
         status_label.config(text="No recording to play")
         return
-    status_label.config(text="Playing recording...")
-    playback_thread = threading.Thread(target=playback_function)
-    playback_thread.start()
-
-
-def playback_function():
-    recording_length = lib.get_recording_length()
-    start_time = time.time()
-    for i in range(recording_length):
-        beat_id = lib.get_recorded_beat_id(c_int(i))
-        timestamp = (
-            lib.get_recorded_beat_timestamp(c_int(i)) / 1000.0
-        ) 
-        time_to_wait = (start_time + timestamp) - time.time()
-        if time_to_wait > 0:
-            time.sleep(time_to_wait)
-        beat_sounds[beat_id].play()
-        animate_button(beat_id)
-    status_label.config(text="Playback finished")
+    loop = None
+    if loop_var.get() and layer_stack is not None:
+        loop = (0, layer_stack.loop_ns)
+    elif loop_var.get():
+        # Loop the recording rounded up to whole bars
+        bar_ns = bar_length_ns()
+        if bar_ns is None:
+            return
+        bars = math.floor(int(records["timestamp_ns"].max()) / bar_ns) + 1
+        loop = (0, bars * bar_ns)
+    playback_token = sequencer.play(records, loop)
+    status_label.config(text="Looping recording..." if loop else "Playing recording...")
+
+
+def poll_sequencer():
+    # Hits and the end of playback are reported from the sequencer's thread
+    while not sequencer.events.empty():
+        event = sequencer.events.get()
+        if event[0] != playback_token:
+            continue
+        if event[1] == "hit":
+            animate_button(event[2])
+        elif event[1] == "finished":
+            status_label.config(text="Playback finished")
+    root.after(SEQUENCER_POLL_MS, poll_sequencer)
+
+
+# Function to render the recording to a WAV file for 3FXForge
+def bounce_recording():
+    records = read_recording(lib)
+    if len(records) == 0:
+        status_label.config(text="No recording to bounce")
+        return
+    file_name = time.strftime("drum3x_%Y%m%d_%H%M%S.wav")
+    file_path = bounce_to_wav(
+        records["beat_id"], records["timestamp_ns"] / 1e9, beat_samples, file_name
+    )
+    status_label.config(text=f"Bounced to {file_path}")
+
+
+# Function to snap the recording to a sixteenth-note grid at the set tempo
+def quantize_recording():
+    if autosave_writer is not None:
+        status_label.config(text="Stop recording before quantizing")
+        return
+    records = read_recording(lib)
+    if len(records) == 0:
+        status_label.config(text="No recording to quantize")
+        return
+    try:
+        bpm = tempo_var.get()
+        records = quantize(records, bpm)
+    except (tk.TclError, ValueError):
+        status_label.config(text="Tempo must be a positive number")
+        return
+    write_recording(lib, records)
+    status_label.config(text=f"Quantized {len(records)} beats at {bpm:g} BPM")
+
+
+# Functions to save and load recordings as pattern files
+def save_pattern_file():
+    records = read_recording(lib)
+    if len(records) == 0:
+        status_label.config(text="No recording to save")
+        return
+    path = filedialog.asksaveasfilename(
+        defaultextension=".d3x", filetypes=[("Drum3x patterns", "*.d3x")]
+    )
+    if path:
+        save_pattern(path, records)
+        status_label.config(text=f"Saved {len(records)} beats to {path}")
+
+
+def load_pattern_file():
+    global layer_stack
+    path = filedialog.askopenfilename(filetypes=[("Drum3x patterns", "*.d3x")])
+    if not path:
+        return
+    try:
+        loaded = write_recording(lib, load_pattern(path))
+    except (OSError, ValueError) as e:
+        status_label.config(text=f"Cannot load {path}: {e}")
+        return
+    layer_stack = None
+    refresh_layers()
+    status_label.config(text=f"Loaded {loaded} beats from {path}")
 
 
 # Binding keys
@@ -195,15 +394,68 @@ play_button = ttk.Button(
 )
 play_button.grid(row=0, column=2, padx=5)
 
+bounce_button = ttk.Button(
+    control_frame, text="Bounce", command=bounce_recording, style="Dark.TButton"
+)
+bounce_button.grid(row=0, column=3, padx=5)
+
+save_button = ttk.Button(
+    control_frame, text="Save", command=save_pattern_file, style="Dark.TButton"
+)
+save_button.grid(row=0, column=4, padx=5)
+
+load_button = ttk.Button(
+    control_frame, text="Load", command=load_pattern_file, style="Dark.TButton"
+)
+load_button.grid(row=0, column=5, padx=5)
+
+tempo_var = tk.DoubleVar(value=120.0)
+tempo_spinbox = ttk.Spinbox(
+    control_frame, from_=20, to=300, increment=1, width=6, textvariable=tempo_var
+)
+tempo_spinbox.grid(row=1, column=0, padx=5, pady=5)
+
+quantize_button = ttk.Button(
+    control_frame, text="Quantize", command=quantize_recording, style="Dark.TButton"
+)
+quantize_button.grid(row=1, column=1, padx=5, pady=5)
+
+loop_var = tk.BooleanVar(value=False)
+loop_check = ttk.Checkbutton(control_frame, text="Loop", variable=loop_var)
+loop_check.grid(row=1, column=2, padx=5, pady=5)
+
+# Loop length in bars for loop recording
+bars_var = tk.IntVar(value=2)
+bars_spinbox = ttk.Spinbox(
+    control_frame, from_=1, to=16, increment=1, width=4, textvariable=bars_var
+)
+bars_spinbox.grid(row=1, column=3, padx=5, pady=5)
+
+undo_button = ttk.Button(
+    control_frame, text="Undo Layer", command=undo_layer, style="Dark.TButton"
+)
+undo_button.grid(row=1, column=4, padx=5, pady=5)
+
 status_label = ttk.Label(root, text="Ready", background="#0f0f0f", foreground="white")
 status_label.grid(row=4, column=0, columnspan=3)
 
-# Real-time CPU usage
-cpu_window = tk.Toplevel(root)
-cpu_window.title("System Performance Monitor")
-cpu_window.configure(bg="#0f0f0f")
+# Layers of a loop recording; double-click one to mute or unmute it
+layer_list = tk.Listbox(
+    root, height=4, bg="#1f1f1f", fg="white", selectbackground="#2f2f2f"
+)
+layer_list.grid(row=5, column=0, columnspan=3, sticky="ew", padx=5, pady=5)
+layer_list.bind("<Double-Button-1>", toggle_layer_mute)
+
+# Performance telemetry
+METRICS_JSONL_PATH = "drum3x_metrics.jsonl"
+METRICS_PROM_PATH = "drum3x_metrics.prom"
+TELEMETRY_SECONDS = 60
 
-# CPU usage
+telemetry_window = tk.Toplevel(root)
+telemetry_window.title("System Performance Monitor")
+telemetry_window.configure(bg="#0f0f0f")
+
+# The axes and lines are set up once; each update only replaces line data
 fig, ax = plt.subplots(facecolor="#0f0f0f")
 fig.patch.set_facecolor("#0f0f0f")
 ax.set_facecolor("#0f0f0f")
@@ -213,46 +465,74 @@ ax.spines["bottom"].set_color("white")
 ax.spines["top"].set_color("white")
 ax.spines["left"].set_color("white")
 ax.spines["right"].set_color("white")
-ax.set_ylabel("CPU Usage (%)", color="white", fontweight="bold")
+ax.grid(True, color="#2f2f2f")
+ax.set_ylim(0, 100)
+ax.set_xlim(0, TELEMETRY_SECONDS)
+ax.set_ylabel("Load (%)", color="white", fontweight="bold")
 ax.set_xlabel("Time (s)", color="white", fontweight="bold")
-ax.set_title("CPU Utilization", color="white", fontweight="bold")
+ax.set_title("Drum3x Performance", color="white", fontweight="bold")
+(cpu_line,) = ax.plot([], [], color="#00ff00", linewidth=2, label="Process CPU")
+(render_line,) = ax.plot(
+    [], [], color="#ff9f00", linewidth=2, label="Mixer render p99 / block"
+)
+ax.legend(loc="upper left", facecolor="#1f1f1f", labelcolor="white")
+info_text = ax.text(
+    0.99, 0.97, "", transform=ax.transAxes, ha="right", va="top", color="white"
+)
 
-cpu_usage_data = []
-time_data = []
+time_data = deque(maxlen=TELEMETRY_SECONDS)
+cpu_usage_data = deque(maxlen=TELEMETRY_SECONDS)
+render_load_data = deque(maxlen=TELEMETRY_SECONDS)
 start_time = time.time()
 
 
-def update_cpu_usage(i):
-    current_time = time.time() - start_time
-    cpu_percent = psutil.cpu_percent(interval=None)
-    cpu_usage_data.append(cpu_percent)
-    time_data.append(current_time)
-    if len(time_data) > 60:
-        time_data.pop(0)
-        cpu_usage_data.pop(0)
-    ax.clear()
-    ax.plot(
-        time_data, cpu_usage_data, color="#00ff00", linewidth=2
-    )  
-    ax.set_ylim(0, 100)
-    ax.set_ylabel("CPU Usage (%)", color="white", fontweight="bold")
-    ax.set_xlabel("Time (s)", color="white", fontweight="bold")
-    ax.set_title("CPU Utilization", color="white", fontweight="bold")
-    ax.tick_params(axis="x", colors="white")
-    ax.tick_params(axis="y", colors="white")
-    ax.set_facecolor("#0f0f0f")
-    ax.spines["bottom"].set_color("white")
-    ax.spines["top"].set_color("white")
-    ax.spines["left"].set_color("white")
-    ax.spines["right"].set_color("white")
-    # Add grid lines
-    ax.grid(True, color="#2f2f2f")
-
-
-
-canvas = FigureCanvasTkAgg(fig, master=cpu_window)
+def update_telemetry():
+    METRICS.sample_process()
+    snapshot = METRICS.snapshot()
+    timings = snapshot["timings"]
+    render = timings.get("mixer_render")
+    trigger = timings.get("trigger_to_play")
+    block_ms = mixer.block_size / mixer.sample_rate * 1000.0
+
+    now = time.time() - start_time
+    time_data.append(now)
+    cpu_usage_data.append(snapshot["gauges"]["process_cpu_percent"])
+    render_load_data.append(render["p99_ms"] / block_ms * 100.0 if render else 0.0)
+    cpu_line.set_data(time_data, cpu_usage_data)
+    render_line.set_data(time_data, render_load_data)
+    ax.set_xlim(time_data[0], max(time_data[0] + TELEMETRY_SECONDS, now))
+    info_text.set_text(
+        f"RSS {snapshot['gauges']['process_rss_bytes'] / 2**20:.0f} MB\n"
+        f"Trigger-to-play p99 {trigger['p99_ms'] if trigger else 0:.1f} ms\n"
+        f"Late blocks {snapshot['counters'].get('mixer_late_blocks', 0)}\n"
+        f"Late sequenced hits {snapshot['counters'].get('sequencer_late_hits', 0)}"
+    )
+    canvas.draw_idle()
+    root.after(1000, update_telemetry)
+
+
+def export_metrics():
+    METRICS.write_jsonl(METRICS_JSONL_PATH)
+    METRICS.write_prometheus(METRICS_PROM_PATH, "drum3x")
+    status_label.config(
+        text=f"Metrics written to {METRICS_JSONL_PATH} and {METRICS_PROM_PATH}"
+    )
+
+
+canvas = FigureCanvasTkAgg(fig, master=telemetry_window)
 canvas.get_tk_widget().pack(fill=tk.BOTH, expand=1)
 
-ani = animation.FuncAnimation(fig, update_cpu_usage, interval=1000)
+export_button = ttk.Button(
+    telemetry_window,
+    text="Export Metrics",
+    command=export_metrics,
+    style="Dark.TButton",
+)
+export_button.pack(pady=5)
+
+update_telemetry()
+poll_sequencer()
 
 root.mainloop()
+sequencer.close()
+mixer.stop()
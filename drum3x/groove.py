@@ -0,0 +1,232 @@
+# groove.py
+# Drum3x - Quantize, swing, humanize and tempo changes for recordings
+#
+# Every function takes a BEAT_RECORD_DTYPE array (as returned by
+# read_recording or load_pattern) and returns a new one sorted by time, ready
+# for write_recording, save_pattern or bounce. The work is done on the whole
+# timestamp column at once, so a million events take milliseconds.
+
+import argparse
+import sys
+
+import numpy as np
+
+from bindings import BEAT_RECORD_DTYPE
+from pattern_file import load_pattern, save_pattern
+
+NS_PER_MINUTE = 60 * 10**9
+# Grid steps per beat: 4 is sixteenth notes when a beat is a quarter note
+DEFAULT_DIVISION = 4
+
+
+def step_ns(bpm, division=DEFAULT_DIVISION):
+    """
+    Length of one grid step in nanoseconds.
+    """
+    if bpm <= 0 or division <= 0:
+        raise ValueError("bpm and division must be positive")
+    return NS_PER_MINUTE / bpm / division
+
+
+def _retimed(records, times):
+    """
+    Copy records with new timestamps, clamped at zero and re-sorted by time;
+    hits that end up at the same time keep their recorded order. times is
+    a float64 array of nanoseconds and is overwritten.
+    """
+    records = np.ascontiguousarray(records, dtype=BEAT_RECORD_DTYPE)
+    # Copying the raw bytes is many times faster than NumPy's field by
+    # field copy of a structured array
+    out = records.view(np.int64).copy().view(BEAT_RECORD_DTYPE)
+    np.rint(times, out=times)
+    np.maximum(times, 0, out=times)
+    out["timestamp_ns"] = times
+    stamps = out["timestamp_ns"]
+    if len(out) > 1 and (stamps[1:] < stamps[:-1]).any():
+        out = out[np.argsort(stamps, kind="stable")]
+    return out
+
+
+def quantize(records, bpm, division=DEFAULT_DIVISION, strength=1.0, offset_ns=0):
+    """
+    Move each hit strength of the way (0 to 1) towards the nearest step of
+    a grid with division steps per beat, starting at offset_ns.
+    """
+    if not 0.0 <= strength <= 1.0:
+        raise ValueError("strength must be between 0 and 1")
+    step = step_ns(bpm, division)
+    times = records["timestamp_ns"].astype(np.float64)
+    # Distance to the nearest step, computed in place to limit temporaries
+    shift = times - offset_ns
+    shift /= step
+    np.rint(shift, out=shift)
+    shift *= step
+    shift += offset_ns - times
+    shift *= strength
+    times += shift
+    return _retimed(records, times)
+
+
+def swing(records, bpm, amount, division=DEFAULT_DIVISION, offset_ns=0):
+    """
+    Delay every second grid step by amount (0 to 1) of a step; 1/3 gives a
+    triplet feel. Time within each pair of steps is stretched piecewise
+    linearly, so hits on the grid land on the swung grid and hits between
+    steps keep their relative place.
+    """
+    if not 0.0 <= amount < 1.0:
+        raise ValueError("swing amount must be at least 0 and below 1")
+    pair = 2 * step_ns(bpm, division)
+    # Position in pairs of steps, split into the pair and the fraction of
+    # the way through it
+    times = records["timestamp_ns"].astype(np.float64)
+    times -= offset_ns
+    times /= pair
+    start = np.floor(times)
+    times -= start
+    # Warp the fraction so 0.5 (the second step) moves to (1 + amount) / 2
+    # while both ends of the pair stay put
+    times += amount * np.minimum(times, 1.0 - times)
+    times += start
+    times *= pair
+    times += offset_ns
+    return _retimed(records, times)
+
+
+def humanize(records, timing_ms, seed=None):
+    """
+    Shift each hit by a random amount, normally distributed with a standard
+    deviation of timing_ms. Pass a seed for a repeatable result.
+    """
+    rng = np.random.default_rng(seed)
+    times = records["timestamp_ns"].astype(np.float64)
+    # float32 draws are about twice as fast and plenty for offsets in ms
+    noise = rng.standard_normal(len(times), dtype=np.float32)
+    noise *= np.float32(timing_ms * 1e6)
+    times += noise
+    return _retimed(records, times)
+
+
+def stretch(records, bpm, new_bpm):
+    """
+    Play a recording made at bpm at new_bpm instead.
+    """
+    if bpm <= 0 or new_bpm <= 0:
+        raise ValueError("bpm must be positive")
+    return _retimed(records, records["timestamp_ns"] * (bpm / new_bpm))
+
+
+def apply_tempo_map(records, bpm, tempo_map):
+    """
+    Re-time a recording made at a steady bpm to follow tempo_map, a list of
+    (beat, bpm) pairs sorted by beat, each tempo holding until the next
+    beat listed. The first pair should start at beat 0; before it the
+    recording keeps its own tempo.
+    """
+    changes = np.asarray(tempo_map, dtype=np.float64).reshape(-1, 2)
+    if len(changes) == 0:
+        return _retimed(records, records["timestamp_ns"].astype(np.float64))
+    beats_at, tempos = changes[:, 0], changes[:, 1]
+    if (tempos <= 0).any() or (np.diff(beats_at) < 0).any():
+        raise ValueError("tempo map needs positive tempos in beat order")
+    if beats_at[0] > 0:
+        beats_at = np.concatenate([[0.0], beats_at])
+        tempos = np.concatenate([[bpm], tempos])
+    ns_per_beat = NS_PER_MINUTE / tempos
+    # Time at which each tempo section starts under the new map
+    section_start = np.concatenate(
+        [[0.0], np.cumsum(np.diff(beats_at) * ns_per_beat[:-1])]
+    )
+
+    beats = records["timestamp_ns"] * (bpm / NS_PER_MINUTE)
+    section = np.searchsorted(beats_at, beats, side="right") - 1
+    return _retimed(
+        records,
+        section_start[section] + (beats - beats_at[section]) * ns_per_beat[section],
+    )
+
+
+def parse_tempo_map(text):
+    """
+    Parse "beat:bpm,beat:bpm,..." (e.g. "0:120,32:140") into a tempo map.
+    """
+    try:
+        return [tuple(float(v) for v in item.split(":")) for item in text.split(",")]
+    except ValueError:
+        raise ValueError(f"Bad tempo map {text!r}, expected beat:bpm,beat:bpm")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Quantize, swing, humanize or re-time a Drum3x pattern file."
+    )
+    parser.add_argument("input", help="Pattern file to read (.d3x).")
+    parser.add_argument("output", help="Pattern file to write (.d3x).")
+    parser.add_argument(
+        "--bpm", type=float, required=True, help="Tempo the pattern was recorded at."
+    )
+    parser.add_argument(
+        "--grid",
+        type=int,
+        default=16,
+        help="Grid as a note value, e.g. 8 or 16 (default: 16).",
+    )
+    parser.add_argument(
+        "--quantize",
+        type=float,
+        default=None,
+        metavar="STRENGTH",
+        help="Quantize to the grid with this strength, 0 to 1.",
+    )
+    parser.add_argument(
+        "--swing",
+        type=float,
+        default=None,
+        metavar="AMOUNT",
+        help="Delay every second grid step by this fraction of a step.",
+    )
+    parser.add_argument(
+        "--humanize",
+        type=float,
+        default=None,
+        metavar="MS",
+        help="Add random timing variation with this standard deviation.",
+    )
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument(
+        "--tempo", type=float, default=None, help="Stretch the pattern to this BPM."
+    )
+    parser.add_argument(
+        "--tempo-map",
+        default=None,
+        metavar="BEAT:BPM,...",
+        help="Follow these tempo changes instead, e.g. 0:120,32:140.",
+    )
+    args = parser.parse_args(argv)
+
+    # The grid is given as a note value with the beat as a quarter note
+    division = args.grid / 4
+    try:
+        records = load_pattern(args.input, mmap=False)
+        if args.quantize is not None:
+            records = quantize(records, args.bpm, division, args.quantize)
+        if args.swing is not None:
+            records = swing(records, args.bpm, args.swing, division)
+        if args.humanize is not None:
+            records = humanize(records, args.humanize, args.seed)
+        if args.tempo_map is not None:
+            records = apply_tempo_map(
+                records, args.bpm, parse_tempo_map(args.tempo_map)
+            )
+        elif args.tempo is not None:
+            records = stretch(records, args.bpm, args.tempo)
+    except (OSError, ValueError) as e:
+        print(e)
+        return 1
+    save_pattern(args.output, records)
+    print(f"Wrote {len(records)} beats to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,165 @@
+# kit.py
+# Drum3x - Decoding pad samples with a shared, memory-mapped cache
+
+import hashlib
+import json
+import os
+
+import numpy as np
+import soundfile as sf
+
+from metrics import METRICS
+from resample import convert_channels, resample
+
+SAMPLE_RATE = 44100
+CHANNELS = 2
+# Silent frames after each pad, so the mixer can read a whole block past
+# any voice position. Mixer blocks can't be larger than this.
+KIT_PADDING = 4096
+# Bump when decoding changes so old caches are ignored
+KIT_CACHE_VERSION = 3
+
+DEFAULT_KIT = [
+    "Bass_Drum_Comb.wav",
+    "Bass_Drum_Driven12.wav",
+    "OH_Open_Hat_04.wav",
+    "Bass_Drum_Driven.wav",
+    "CH_Closed_Hat23.wav",
+    "SD_Snare_Drum_014.wav",
+    "Bass_Drum_Driven1.wav",
+    "LT_Low_Tom_06.wav",
+    "SD_Snare_Drum_092.wav",
+]
+
+
+def load_sample(filepath, sample_rate=SAMPLE_RATE, channels=CHANNELS):
+    """
+    Decode a WAV file into a float32 (frames, channels) array at the mixer
+    rate and channel count, without its trailing silence.
+    """
+    data, sr = sf.read(filepath, dtype="float32", always_2d=True)
+    data = resample(convert_channels(data, channels), sr, sample_rate)
+    # Drop trailing digital silence; it costs mixing time and adds nothing
+    nonzero = np.flatnonzero(np.any(data != 0.0, axis=1))
+    data = data[: nonzero[-1] + 1 if len(nonzero) else 0]
+    return np.ascontiguousarray(data, dtype=np.float32)
+
+
+class Kit:
+    """
+    Pad samples packed into one (frames, channels) float32 bank, each pad
+    followed by KIT_PADDING silent frames. The bank may be a read-only
+    memory map shared with other processes.
+    """
+
+    def __init__(self, bank, lengths, sample_rate=SAMPLE_RATE):
+        self.bank = bank
+        self.lengths = np.asarray(lengths, dtype=np.int64)
+        self.starts = np.concatenate(
+            ([0], np.cumsum(self.lengths + KIT_PADDING)[:-1])
+        ).astype(np.int64)
+        self.sample_rate = sample_rate
+        self.channels = bank.shape[1]
+
+    @classmethod
+    def from_samples(cls, samples, sample_rate=SAMPLE_RATE):
+        lengths = [len(s) for s in samples]
+        bank = np.zeros(
+            (sum(lengths) + KIT_PADDING * len(samples), samples[0].shape[1]),
+            dtype=np.float32,
+        )
+        kit = cls(bank, lengths, sample_rate)
+        for start, sample in zip(kit.starts, samples):
+            bank[start : start + len(sample)] = sample
+        return kit
+
+    @property
+    def samples(self):
+        """
+        Per-pad (frames, channels) views into the bank.
+        """
+        return [
+            self.bank[start : start + length]
+            for start, length in zip(self.starts, self.lengths)
+        ]
+
+    def __len__(self):
+        return len(self.lengths)
+
+
+def kit_cache_key(paths, sample_rate=SAMPLE_RATE, channels=CHANNELS):
+    """
+    Key a decoded kit by its source files' names, mtimes and sizes and the
+    target format.
+    """
+    digest = hashlib.blake2b(digest_size=12)
+    digest.update(f"{KIT_CACHE_VERSION}:{sample_rate}:{channels}".encode())
+    for path in paths:
+        st = os.stat(path)
+        digest.update(
+            f"|{os.path.basename(path)}:{st.st_mtime_ns}:{st.st_size}".encode()
+        )
+    return digest.hexdigest()
+
+
+def load_kit(
+    beats_dir,
+    filenames=DEFAULT_KIT,
+    sample_rate=SAMPLE_RATE,
+    channels=CHANNELS,
+    cache_dir=None,
+):
+    """
+    Load a kit, decoding it only if there is no up-to-date cache. Cached
+    kits are memory-mapped, so every process using the same cache (GUI,
+    bouncer, batch workers) shares one copy of the samples in memory.
+    """
+    paths = [os.path.join(beats_dir, f) for f in filenames]
+    cache_dir = cache_dir or os.path.join(beats_dir, ".cache")
+    key = kit_cache_key(paths, sample_rate, channels)
+    bank_path = os.path.join(cache_dir, f"kit_{key}.npy")
+    meta_path = os.path.join(cache_dir, f"kit_{key}.json")
+
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+        kit = Kit(np.load(bank_path, mmap_mode="r"), meta["lengths"], sample_rate)
+        METRICS.incr("kit_cache_hits")
+        return kit
+    except (OSError, ValueError, KeyError):
+        METRICS.incr("kit_cache_misses")
+
+    with METRICS.time("decode"):
+        kit = Kit.from_samples(
+            [load_sample(p, sample_rate, channels) for p in paths], sample_rate
+        )
+    try:
+        _write_cache(cache_dir, key, kit, filenames)
+    except OSError:
+        # A read-only beats directory just means no cache
+        pass
+    return kit
+
+
+def _write_atomically(path, write):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        write(f)
+    os.replace(tmp_path, path)
+
+
+def _write_cache(cache_dir, key, kit, filenames):
+    os.makedirs(cache_dir, exist_ok=True)
+    prefix = os.path.join(cache_dir, f"kit_{key}")
+    # The bank goes first and the metadata last, so a reader that finds
+    # the metadata always finds a complete bank
+    _write_atomically(prefix + ".npy", lambda f: np.save(f, kit.bank))
+    meta = json.dumps({"files": list(filenames), "lengths": kit.lengths.tolist()})
+    _write_atomically(prefix + ".json", lambda f: f.write(meta.encode()))
+    # Remove caches of older versions of the kit
+    for name in os.listdir(cache_dir):
+        if name.startswith("kit_") and not name.startswith(f"kit_{key}"):
+            try:
+                os.remove(os.path.join(cache_dir, name))
+            except OSError:
+                pass
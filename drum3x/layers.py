@@ -0,0 +1,150 @@
+# layers.py
+# Drum3x - Loop recording with overdub layers merged by time on read
+#
+# Each take is folded into one pass of the loop and kept as its own sorted
+# layer. Reads merge the layers into one BEAT_RECORD_DTYPE array sorted by
+# time, which is what write_recording, the Sequencer and bounce expect.
+
+import numpy as np
+
+from bindings import BEAT_RECORD_DTYPE
+
+
+def _raw(records):
+    # Gathers and scatters of whole records as opaque bytes are several
+    # times faster than NumPy's field by field structured copies
+    return records.view((np.void, BEAT_RECORD_DTYPE.itemsize))
+
+
+def wrap_take(records, loop_ns, offset_ns=0):
+    """
+    Fold a take recorded over one or more passes of the loop into a single
+    pass: timestamps are moved back by offset_ns and taken modulo loop_ns.
+    Returns a new array sorted by time.
+    """
+    if loop_ns <= 0:
+        raise ValueError("loop length must be positive")
+    layer = _raw(np.ascontiguousarray(records, dtype=BEAT_RECORD_DTYPE))
+    layer = layer.copy().view(BEAT_RECORD_DTYPE)
+    layer["timestamp_ns"] = (layer["timestamp_ns"] - offset_ns) % loop_ns
+    order = np.argsort(layer["timestamp_ns"], kind="stable")
+    return _raw(layer)[order].view(BEAT_RECORD_DTYPE)
+
+
+def merge_layers(layers):
+    """
+    k-way merge of layers that are each sorted by time. Returns the merged
+    records and, for each, the index of the layer it came from. Hits at the
+    same time keep layer order.
+    """
+    if not layers:
+        return np.zeros(0, dtype=BEAT_RECORD_DTYPE), np.zeros(0, dtype=np.int32)
+    stacked = np.concatenate([_raw(np.ascontiguousarray(l)) for l in layers])
+    stacked = stacked.view(BEAT_RECORD_DTYPE)
+    source = np.repeat(np.arange(len(layers), dtype=np.int32), [len(l) for l in layers])
+    # NumPy's stable sort is a timsort, which finds the sorted runs and
+    # merges them, so this costs O(n log k) for k layers rather than a full
+    # sort
+    order = np.argsort(stacked["timestamp_ns"], kind="stable")
+    return _raw(stacked)[order].view(BEAT_RECORD_DTYPE), source[order]
+
+
+def _insert(merged, source, layer, index):
+    """
+    Merge one sorted layer into already merged records, after any hits at
+    the same time.
+    """
+    at = np.searchsorted(merged["timestamp_ns"], layer["timestamp_ns"], side="right")
+    at += np.arange(len(layer))
+    total = len(merged) + len(layer)
+    old = np.ones(total, dtype=bool)
+    old[at] = False
+    out = np.empty(total, dtype=BEAT_RECORD_DTYPE)
+    _raw(out)[at] = _raw(layer)
+    _raw(out)[old] = _raw(merged)
+    out_source = np.empty(total, dtype=np.int32)
+    out_source[at] = index
+    out_source[old] = source
+    return out, out_source
+
+
+class LayerStack:
+    """
+    Overdub layers of a loop of loop_ns nanoseconds. All layers are kept
+    merged, along with the layer each hit came from, so a new layer costs
+    one two-way merge and a read with layers muted is a single mask over
+    the merged hits, however many layers there are. Muting and undoing
+    never copy or re-sort a layer's events.
+    """
+
+    def __init__(self, loop_ns):
+        if loop_ns <= 0:
+            raise ValueError("loop length must be positive")
+        self.loop_ns = int(loop_ns)
+        self._layers = []
+        self._muted = np.zeros(0, dtype=bool)
+        self._all, self._source = merge_layers([])
+        self._merged = None
+
+    def __len__(self):
+        return len(self._layers)
+
+    def add(self, records, offset_ns=0):
+        """
+        Add a take as a new layer (see wrap_take) and return its index.
+        """
+        layer = wrap_take(records, self.loop_ns, offset_ns)
+        layer.setflags(write=False)
+        index = len(self._layers)
+        self._all, self._source = _insert(self._all, self._source, layer, index)
+        self._layers.append(layer)
+        self._muted = np.append(self._muted, False)
+        self._merged = None
+        return index
+
+    def undo(self):
+        """
+        Remove the newest layer. Returns False if there was none.
+        """
+        if not self._layers:
+            return False
+        index = len(self._layers) - 1
+        keep = self._source != index
+        self._all = _raw(self._all)[keep].view(BEAT_RECORD_DTYPE)
+        self._source = self._source[keep]
+        self._layers.pop()
+        self._muted = self._muted[:index]
+        self._merged = None
+        return True
+
+    def clear(self):
+        self.__init__(self.loop_ns)
+
+    def mute(self, index, muted=True):
+        if self._muted[index] != muted:
+            self._muted[index] = muted
+            self._merged = None
+
+    def is_muted(self, index):
+        return bool(self._muted[index])
+
+    def layer(self, index):
+        """
+        The hits of one layer, read-only and sorted by time.
+        """
+        return self._layers[index]
+
+    def merged(self):
+        """
+        Return the hits of every unmuted layer as one read-only array
+        sorted by time. The result is cached until the layers change.
+        """
+        if self._merged is None:
+            if self._muted.any():
+                keep = ~self._muted[self._source]
+                merged = _raw(self._all)[keep].view(BEAT_RECORD_DTYPE)
+            else:
+                merged = self._all.view()
+            merged.setflags(write=False)
+            self._merged = merged
+        return self._merged
@@ -0,0 +1,148 @@
+# metrics.py
+# Lightweight in-process performance metrics with JSONL and Prometheus export
+#
+# 3FXForge and Drum3x each keep an identical copy of this file, as each app
+# runs from its own directory. Make every change to both copies.
+
+import contextlib
+import json
+import os
+import re
+import threading
+import time
+from collections import deque
+
+import numpy as np
+import psutil
+
+
+class Metrics:
+    """
+    Registry of counters, gauges and timings. Recording a value is a dict
+    update under a lock, so it is cheap enough for audio callbacks. Timings
+    keep a running count and sum plus a window of recent values for
+    percentiles.
+    """
+
+    def __init__(self, window=1024):
+        self.window = window
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._timings = {}
+        self._process = psutil.Process()
+
+    def incr(self, name, value=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def set_gauge(self, name, value):
+        with self._lock:
+            self._gauges[name] = value
+
+    def observe(self, name, seconds):
+        """
+        Record one duration, in seconds, for a stage.
+        """
+        with self._lock:
+            timing = self._timings.get(name)
+            if timing is None:
+                timing = self._timings[name] = [0, 0.0, deque(maxlen=self.window)]
+            timing[0] += 1
+            timing[1] += seconds
+            timing[2].append(seconds)
+
+    @contextlib.contextmanager
+    def time(self, name):
+        """
+        Time the body of a with block as one observation of a stage.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def sample_process(self):
+        """
+        Update the process RSS and CPU gauges. CPU is the share of the
+        whole machine used by this process since the previous sample.
+        """
+        self.set_gauge("process_rss_bytes", self._process.memory_info().rss)
+        self.set_gauge(
+            "process_cpu_percent",
+            self._process.cpu_percent(interval=None) / (os.cpu_count() or 1),
+        )
+
+    def snapshot(self):
+        """
+        Return all metrics as a JSON-serializable dict. Timings are given
+        in ms, with percentiles over the recent window.
+        """
+        with self._lock:
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+            timings = {
+                name: (count, total, np.array(recent))
+                for name, (count, total, recent) in self._timings.items()
+            }
+        snapshot = {
+            "time": time.time(),
+            "counters": counters,
+            "gauges": gauges,
+            "timings": {},
+        }
+        for name, (count, total, recent) in timings.items():
+            ms = recent * 1000.0
+            snapshot["timings"][name] = {
+                "count": count,
+                "total_ms": total * 1000.0,
+                "mean_ms": total / count * 1000.0,
+                "p50_ms": float(np.percentile(ms, 50)),
+                "p99_ms": float(np.percentile(ms, 99)),
+                "max_ms": float(ms.max()),
+            }
+        return snapshot
+
+    def write_jsonl(self, path):
+        """
+        Append a snapshot to a JSON Lines file.
+        """
+        with open(path, "a") as f:
+            f.write(json.dumps(self.snapshot(), sort_keys=True) + "\n")
+
+    def write_prometheus(self, path, prefix):
+        """
+        Write the current metrics to a Prometheus text-format file, e.g. for
+        the node_exporter textfile collector. Timings become summaries in
+        seconds.
+        """
+        snapshot = self.snapshot()
+        lines = []
+        for name, value in sorted(snapshot["counters"].items()):
+            metric = _metric_name(prefix, name) + "_total"
+            lines += [f"# TYPE {metric} counter", f"{metric} {value}"]
+        for name, value in sorted(snapshot["gauges"].items()):
+            metric = _metric_name(prefix, name)
+            lines += [f"# TYPE {metric} gauge", f"{metric} {value}"]
+        for name, timing in sorted(snapshot["timings"].items()):
+            metric = _metric_name(prefix, name) + "_seconds"
+            lines.append(f"# TYPE {metric} summary")
+            for quantile in ("50", "99"):
+                value = timing[f"p{quantile}_ms"] / 1000.0
+                lines.append(f'{metric}{{quantile="0.{quantile}"}} {value}')
+            lines.append(f"{metric}_sum {timing['total_ms'] / 1000.0}")
+            lines.append(f"{metric}_count {timing['count']}")
+        # Write to a temp file first so a scraper never reads a partial file
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, path)
+
+
+def _metric_name(prefix, name):
+    return re.sub(r"[^a-zA-Z0-9_]", "_", f"{prefix}_{name}")
+
+
+# Shared registry for the whole application
+METRICS = Metrics()
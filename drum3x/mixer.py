@@ -0,0 +1,211 @@
+# mixer.py
+# Drum3x - Low-latency voice mixer with a fixed-size audio callback
+
+import heapq
+import time
+from collections import deque
+
+import numpy as np
+
+from kit import KIT_PADDING
+from metrics import METRICS
+
+BLOCK_SIZE = 512
+MAX_VOICES = 32
+
+
+class DrumMixer:
+    """
+    Mixes a Kit's pad samples into fixed-size blocks. All samples live in
+    one preloaded bank and the active voices are summed with a single gather,
+    so the cost of a block does not depend on Python-level voice loops.
+
+    trigger() may be called from any thread; render() is called from the
+    audio callback, or directly to render offline without a sound device.
+    frames_rendered counts the frames rendered so far and is the clock that
+    hits can be scheduled against, to the sample.
+    """
+
+    def __init__(self, kit, block_size=BLOCK_SIZE, max_voices=MAX_VOICES):
+        if block_size > KIT_PADDING:
+            raise ValueError(f"block_size can be at most {KIT_PADDING} frames")
+        self.sample_rate = kit.sample_rate
+        self.block_size = block_size
+        self.max_voices = max_voices
+        self.channels = kit.channels
+
+        # The kit's bank is used as is (it may be a shared memory map); its
+        # padding lets a voice always read a whole block past its start.
+        self.bank = kit.bank
+        self.lengths = kit.lengths
+        self.starts = kit.starts
+
+        self._voice_pad = np.zeros(max_voices, dtype=np.int64)
+        self._voice_pos = np.zeros(max_voices, dtype=np.int64)
+        self._voice_gain = np.zeros(max_voices, dtype=np.float32)
+        self._voice_age = np.zeros(max_voices, dtype=np.int64)
+        self._voice_active = np.zeros(max_voices, dtype=bool)
+        self._next_age = 0
+        self._offsets = np.arange(block_size, dtype=np.int64)
+
+        # deque.append/popleft are atomic, so triggers need no lock
+        self._pending = deque()
+        # Heap of (frame, order, pad, gain) for hits scheduled ahead; only
+        # render() touches it
+        self._scheduled = []
+        self._hits_scheduled = 0
+        self.frames_rendered = 0
+        self.voices_stolen = 0
+        self.render_times = deque(maxlen=2048)
+        self.trigger_latencies = deque(maxlen=2048)
+        # Frames between when each scheduled hit was due and when it started
+        self.schedule_errors = deque(maxlen=2048)
+
+        self._device = None
+
+    def trigger(self, pad, gain=1.0, frame=None):
+        """
+        Queue a hit on a pad. It starts at the beginning of the next block,
+        or at frame on the frames_rendered clock if given. A hit whose frame
+        has already been rendered starts at the next block instead.
+        """
+        self._pending.append((pad, gain, time.perf_counter(), frame))
+
+    def cancel_scheduled(self):
+        """
+        Drop every hit queued with a frame that has not started yet.
+        """
+        self._pending.append(None)
+
+    def active_voices(self):
+        return int(self._voice_active.sum())
+
+    def render(self, frames=None, out=None):
+        """
+        Render the next block of audio as a (frames, channels) float32 array.
+        frames may not exceed block_size. If out is given it is filled in
+        place, which is how the audio callback avoids allocating.
+        """
+        begin = time.perf_counter()
+        frames = self.block_size if frames is None else frames
+        if out is None:
+            out = np.empty((frames, self.channels), dtype=np.float32)
+
+        block_start = self.frames_rendered
+        while self._pending:
+            hit = self._pending.popleft()
+            if hit is None:
+                self._scheduled.clear()
+                continue
+            pad, gain, triggered_at, frame = hit
+            if frame is not None:
+                heapq.heappush(
+                    self._scheduled, (frame, self._hits_scheduled, pad, gain)
+                )
+                self._hits_scheduled += 1
+                continue
+            self._start_voice(pad, gain)
+            # Time until the hit reaches the device: queueing plus one block
+            latency = begin - triggered_at + frames / self.sample_rate
+            self.trigger_latencies.append(latency)
+            METRICS.observe("trigger_to_play", latency)
+        while self._scheduled and self._scheduled[0][0] < block_start + frames:
+            frame, _, pad, gain = heapq.heappop(self._scheduled)
+            offset = max(frame - block_start, 0)
+            self._start_voice(pad, gain, offset)
+            self.schedule_errors.append(block_start + offset - frame)
+
+        voices = np.flatnonzero(self._voice_active)
+        if len(voices) == 0:
+            out.fill(0.0)
+        else:
+            pads = self._voice_pad[voices]
+            idx = (self.starts[pads] + self._voice_pos[voices])[:, None]
+            block = self.bank[idx + self._offsets[:frames]]
+            # Weighted sum over voices: (voices, frames, ch) -> (frames, ch)
+            np.einsum("v,vfc->fc", self._voice_gain[voices], block, out=out)
+            np.clip(out, -1.0, 1.0, out=out)
+
+            self._voice_pos[voices] += frames
+            self._voice_active[voices] = self._voice_pos[voices] < self.lengths[pads]
+        self.frames_rendered += frames
+
+        elapsed = time.perf_counter() - begin
+        self.render_times.append(elapsed)
+        METRICS.observe("mixer_render", elapsed)
+        # A block that takes longer to render than to play means an underrun
+        if elapsed > frames / self.sample_rate:
+            METRICS.incr("mixer_late_blocks")
+        return out
+
+    def _start_voice(self, pad, gain, offset=0):
+        free = np.flatnonzero(~self._voice_active)
+        if len(free):
+            voice = free[0]
+        else:
+            # Steal the oldest voice
+            voice = int(np.argmin(self._voice_age))
+            self.voices_stolen += 1
+            METRICS.incr("voices_stolen")
+        self._voice_pad[voice] = pad
+        # A voice starting offset frames into the block begins at a negative
+        # position, reading silence until then: every pad is followed by
+        # KIT_PADDING silent frames, and the first pad's negative indices
+        # wrap around to the padding at the end of the bank.
+        self._voice_pos[voice] = -offset
+        self._voice_gain[voice] = gain
+        self._voice_age[voice] = self._next_age
+        self._voice_active[voice] = True
+        self._next_age += 1
+
+    def latency_stats(self):
+        """
+        Return render time and trigger-to-output latency figures in ms.
+        """
+        stats = {"voices_stolen": self.voices_stolen}
+        for name, values in (
+            ("render", self.render_times),
+            ("trigger_latency", self.trigger_latencies),
+        ):
+            if values:
+                ms = np.array(values) * 1000.0
+                stats[f"{name}_mean_ms"] = float(ms.mean())
+                stats[f"{name}_p99_ms"] = float(np.percentile(ms, 99))
+                stats[f"{name}_max_ms"] = float(ms.max())
+        return stats
+
+    def _callback(self, device, buffer):
+        out = np.frombuffer(buffer, dtype=np.float32).reshape(-1, self.channels)
+        self.render(len(out), out=out)
+
+    def start(self, device_name=None):
+        """
+        Open the output device and start calling render() from its callback.
+        """
+        from pygame._sdl2.sdl2 import init_subsystem, INIT_AUDIO
+        from pygame._sdl2.audio import (
+            AudioDevice,
+            AUDIO_F32,
+            get_audio_device_names,
+        )
+
+        init_subsystem(INIT_AUDIO)
+        if device_name is None:
+            device_name = get_audio_device_names(False)[0]
+        self._device = AudioDevice(
+            devicename=device_name,
+            iscapture=False,
+            frequency=self.sample_rate,
+            audioformat=AUDIO_F32,
+            numchannels=self.channels,
+            chunksize=self.block_size,
+            allowed_changes=0,
+            callback=self._callback,
+        )
+        self._device.pause(0)
+
+    def stop(self):
+        if self._device is not None:
+            self._device.pause(1)
+            self._device.close()
+            self._device = None
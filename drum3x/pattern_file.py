@@ -0,0 +1,119 @@
+# pattern_file.py
+# Drum3x - Compact binary files for saving and loading recordings
+#
+# Layout: a 32-byte header followed by packed 16-byte records in the same
+# layout as BeatRecord in drum3x.c (BEAT_RECORD_DTYPE), so a file can be
+# memory-mapped as a NumPy array or handed straight to the C store.
+
+import os
+
+import numpy as np
+
+from bindings import BEAT_RECORD_DTYPE
+
+PATTERN_MAGIC = b"DRUM3XR\x00"
+PATTERN_VERSION = 1
+HEADER_DTYPE = np.dtype(
+    [
+        ("magic", "S8"),
+        ("version", "<u4"),
+        ("record_size", "<u4"),
+        ("count", "<u8"),
+        ("reserved", "<u8"),
+    ]
+)
+HEADER_SIZE = HEADER_DTYPE.itemsize
+
+
+def _make_header(count):
+    header = np.zeros((), dtype=HEADER_DTYPE)
+    header["magic"] = PATTERN_MAGIC
+    header["version"] = PATTERN_VERSION
+    header["record_size"] = BEAT_RECORD_DTYPE.itemsize
+    header["count"] = count
+    return header.tobytes()
+
+
+def read_header(path):
+    """
+    Read and validate a pattern file header. Returns the record count,
+    limited to the records actually present (a file may have been cut off
+    in the middle of an append).
+    """
+    with open(path, "rb") as f:
+        raw = f.read(HEADER_SIZE)
+    if len(raw) < HEADER_SIZE:
+        raise ValueError(f"{path} is not a Drum3x pattern file")
+    header = np.frombuffer(raw, dtype=HEADER_DTYPE)[0]
+    if header["magic"] != PATTERN_MAGIC.rstrip(b"\x00"):
+        raise ValueError(f"{path} is not a Drum3x pattern file")
+    if header["version"] != PATTERN_VERSION:
+        raise ValueError(f"Unsupported pattern file version {header['version']}")
+    if header["record_size"] != BEAT_RECORD_DTYPE.itemsize:
+        raise ValueError(f"Unexpected record size {header['record_size']}")
+    on_disk = (os.path.getsize(path) - HEADER_SIZE) // BEAT_RECORD_DTYPE.itemsize
+    return int(min(header["count"], on_disk))
+
+
+def save_pattern(path, records):
+    """
+    Write records (a BEAT_RECORD_DTYPE array) to a new pattern file.
+    """
+    with PatternWriter(path, append=False) as writer:
+        writer.append(records)
+
+
+def load_pattern(path, mmap=True):
+    """
+    Return the records of a pattern file as a BEAT_RECORD_DTYPE array. By
+    default the file is memory-mapped read-only rather than read in.
+    """
+    count = read_header(path)
+    if count == 0:
+        return np.zeros(0, dtype=BEAT_RECORD_DTYPE)
+    if mmap:
+        return np.memmap(
+            path, dtype=BEAT_RECORD_DTYPE, mode="r", offset=HEADER_SIZE, shape=count
+        )
+    with open(path, "rb") as f:
+        f.seek(HEADER_SIZE)
+        return np.fromfile(f, dtype=BEAT_RECORD_DTYPE, count=count)
+
+
+class PatternWriter:
+    """
+    Appends records to a pattern file, updating the header count after each
+    append so the file is always loadable, even mid-session.
+    """
+
+    def __init__(self, path, append=True):
+        self.path = path
+        if append and os.path.exists(path):
+            self.count = read_header(path)
+            self._file = open(path, "r+b")
+            # Drop any partial record left by an interrupted append
+            self._file.truncate(HEADER_SIZE + self.count * BEAT_RECORD_DTYPE.itemsize)
+        else:
+            self.count = 0
+            self._file = open(path, "w+b")
+            self._file.write(_make_header(0))
+
+    def append(self, records):
+        records = np.ascontiguousarray(records, dtype=BEAT_RECORD_DTYPE)
+        if len(records) == 0:
+            return
+        self._file.seek(HEADER_SIZE + self.count * BEAT_RECORD_DTYPE.itemsize)
+        self._file.write(records.tobytes())
+        self.count += len(records)
+        self._file.seek(0)
+        self._file.write(_make_header(self.count))
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,201 @@
+# sequencer.py
+# Drum3x - Look-ahead playback of recordings, scheduled to the sample
+
+import queue
+import threading
+import time
+
+import numpy as np
+
+from metrics import METRICS
+
+# How far past the block being rendered hits are handed to the mixer. It
+# has to cover the time between wake-ups plus however late one can be.
+LOOKAHEAD_SECONDS = 0.03
+# Time between wake-ups of the scheduling thread
+WAKE_SECONDS = 0.005
+# Bucket edges for the jitter histograms, in ms
+JITTER_EDGES_MS = (0.0, 0.1, 0.5, 1.0, 2.0, 5.0, 10.0, 20.0, 50.0)
+
+
+class JitterHistogram:
+    """
+    Counts of how late things happened, in the buckets of JITTER_EDGES_MS
+    (the last bucket is open-ended). Early values count as on time.
+    """
+
+    def __init__(self, edges_ms=JITTER_EDGES_MS):
+        self.edges_ms = np.asarray(edges_ms, dtype=np.float64)
+        self.counts = np.zeros(len(self.edges_ms), dtype=np.int64)
+
+    def add(self, seconds):
+        ms = np.maximum(np.atleast_1d(seconds) * 1000.0, 0.0)
+        buckets = np.searchsorted(self.edges_ms, ms, side="right") - 1
+        self.counts += np.bincount(buckets, minlength=len(self.counts))
+
+    def reset(self):
+        self.counts[:] = 0
+
+    def as_dict(self):
+        return {"edges_ms": self.edges_ms.tolist(), "counts": self.counts.tolist()}
+
+    def format(self):
+        """
+        Return the histogram as lines of text, one per bucket.
+        """
+        total = max(int(self.counts.sum()), 1)
+        lines = []
+        uppers = list(self.edges_ms[1:]) + [np.inf]
+        for lower, upper, count in zip(self.edges_ms, uppers, self.counts):
+            label = f"{lower:g}-{upper:g} ms" if upper < np.inf else f">={lower:g} ms"
+            lines.append(f"{label:>14} {count:>8} {100 * count / total:>6.1f}%")
+        return "\n".join(lines)
+
+
+class Sequencer:
+    """
+    Plays recordings through a DrumMixer from one long-lived thread. Hits
+    are placed on the mixer's frame clock, so they start at their exact
+    sample however late the thread wakes up; it only has to hand them over
+    within LOOKAHEAD_SECONDS of the block being rendered. Wake-ups are
+    timed with the monotonic perf_counter clock.
+
+    play(), stop() and close() only queue a command and return. Each play()
+    returns a token, and when a recording finishes (token, "finished") is
+    put on events; every hit handed to the mixer also puts (token, "hit",
+    beat_id) there, for the UI. hit_jitter counts how far each hit started
+    after its scheduled frame, and wake_jitter how late the thread woke.
+    """
+
+    def __init__(self, mixer, lookahead=LOOKAHEAD_SECONDS, interval=WAKE_SECONDS):
+        self.mixer = mixer
+        self.interval = interval
+        self.lookahead_frames = int(lookahead * mixer.sample_rate)
+        self.events = queue.SimpleQueue()
+        self.hit_jitter = JitterHistogram()
+        self.wake_jitter = JitterHistogram()
+        self._commands = queue.SimpleQueue()
+        self._tokens = 0
+        self._token = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def play(self, records, loop=None):
+        """
+        Start playing records (a BEAT_RECORD_DTYPE array), replacing any
+        recording already playing. loop is an optional (start_ns, end_ns)
+        region: the recording plays from the start up to end_ns, then the
+        region repeats until stop().
+        """
+        if loop is not None and not 0 <= loop[0] < loop[1]:
+            raise ValueError("loop region must start at 0 or later and end after it")
+        self._tokens += 1
+        self._commands.put(("play", self._tokens, records, loop))
+        return self._tokens
+
+    def stop(self):
+        self._commands.put(("stop",))
+
+    def close(self):
+        """
+        Stop playback and end the thread.
+        """
+        self._commands.put(("close",))
+        self._thread.join()
+
+    def _run(self):
+        next_wake = 0.0
+        while True:
+            if self._token is None:
+                command = self._commands.get()
+            else:
+                timeout = max(next_wake - time.perf_counter(), 0.0)
+                try:
+                    command = self._commands.get(timeout=timeout)
+                except queue.Empty:
+                    command = None
+            if command is not None:
+                if command[0] == "close":
+                    self._unload()
+                    return
+                self._handle(command)
+                next_wake = time.perf_counter()
+            else:
+                late = time.perf_counter() - next_wake
+                self.wake_jitter.add(late)
+                METRICS.observe("sequencer_wake_late", max(late, 0.0))
+            if self._token is not None:
+                self._schedule()
+                # Keep to a steady grid, unless a wake-up was missed entirely
+                next_wake = max(next_wake + self.interval, time.perf_counter())
+            self._collect_errors()
+
+    def _handle(self, command):
+        if command[0] == "stop":
+            self._unload()
+            return
+        _, token, records, loop = command
+        self._unload()
+        order = np.argsort(records["timestamp_ns"], kind="stable")
+        rate = self.mixer.sample_rate / 1e9
+        self._beat_ids = records["beat_id"][order].tolist()
+        self._frames = np.rint(records["timestamp_ns"][order] * rate).astype(np.int64)
+        self._next = 0
+        if loop is None:
+            self._loop = None
+            self._end = len(self._frames)
+        else:
+            start, end = (int(round(t * rate)) for t in loop)
+            self._loop = (start, end, int(np.searchsorted(self._frames, start)))
+            self._end = int(np.searchsorted(self._frames, end))
+        # Position 0 of the recording falls one block after the block about
+        # to be rendered, so the first hits can't already be late
+        self._start = self.mixer.frames_rendered + self.mixer.block_size
+        self._token = token
+
+    def _schedule(self):
+        """
+        Hand the mixer every hit due before the end of the look-ahead
+        window, wrapping around the loop region as often as it fits.
+        """
+        now = self.mixer.frames_rendered
+        horizon = now + self.mixer.block_size + self.lookahead_frames
+        while True:
+            due = min(
+                int(np.searchsorted(self._frames, horizon - self._start)), self._end
+            )
+            for i in range(self._next, due):
+                self.mixer.trigger(
+                    self._beat_ids[i], frame=self._start + self._frames[i]
+                )
+                self.events.put((self._token, "hit", self._beat_ids[i]))
+            self._next = max(self._next, due)
+            if self._loop is None or self._next < self._end:
+                break
+            start, end, first = self._loop
+            if horizon - self._start < end:
+                break
+            # The next pass starts where this one's loop region ends
+            self._start += end - start
+            self._next = first
+        if self._loop is None and self._next >= self._end:
+            last = self._frames[-1] if len(self._frames) else 0
+            if now > self._start + last:
+                # The last hit has started, so its error is in by now
+                self._collect_errors()
+                self.events.put((self._token, "finished"))
+                self._token = None
+
+    def _collect_errors(self):
+        errors = []
+        while self.mixer.schedule_errors:
+            errors.append(self.mixer.schedule_errors.popleft())
+        if errors:
+            late = np.array(errors) / self.mixer.sample_rate
+            self.hit_jitter.add(late)
+            METRICS.incr("sequencer_late_hits", int(np.count_nonzero(late)))
+
+    def _unload(self):
+        if self._token is not None:
+            self.mixer.cancel_scheduled()
+            self._token = None
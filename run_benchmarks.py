@@ -0,0 +1,196 @@
+# run_benchmarks.py
+# Runs the 3FXForge and Drum3x benchmark suites, saves the results with
+# machine info, and optionally flags slowdowns against a saved baseline.
+#
+#   python run_benchmarks.py --output baseline.json
+#   python run_benchmarks.py --compare baseline.json
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# suite name -> (directory, command line of its JSON-producing benchmark)
+SUITES = {
+    "3fxforge": ("3FXForge", ["benchmarks.py"]),
+    "drum3x": ("drum3x", ["benchmarks.py", "suite"]),
+}
+
+
+def cpu_model():
+    try:
+        with open("/proc/cpuinfo") as f:
+            for line in f:
+                if line.startswith("model name"):
+                    return line.split(":", 1)[1].strip()
+    except OSError:
+        pass
+    return platform.processor() or platform.machine()
+
+
+def machine_info():
+    """
+    Describe the machine and software the results were measured on.
+    """
+    info = {
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "cpu": cpu_model(),
+        "cpu_count": os.cpu_count(),
+    }
+    try:
+        import numpy
+
+        info["numpy"] = numpy.__version__
+    except ImportError:
+        pass
+    try:
+        import psutil
+
+        info["memory_bytes"] = psutil.virtual_memory().total
+    except ImportError:
+        pass
+    try:
+        info["commit"] = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        pass
+    return info
+
+
+def run_suite(name, extra_args):
+    """
+    Run one app's suite in its own directory and return its results.
+    """
+    directory, command = SUITES[name]
+    fd, json_path = tempfile.mkstemp(suffix=".json")
+    os.close(fd)
+    try:
+        subprocess.run(
+            [sys.executable, *command, "--json", json_path, *extra_args],
+            cwd=os.path.join(ROOT, directory),
+            check=True,
+        )
+        with open(json_path) as f:
+            return json.load(f)
+    finally:
+        os.remove(json_path)
+
+
+def compare(results, baseline, threshold):
+    """
+    Print each benchmark against the baseline and return the names that
+    got slower by more than threshold (a fraction, e.g. 0.1 for 10%).
+    Best-of-N times are compared, as they are the least affected by noise
+    from other processes.
+    """
+    regressions = []
+    print(f"{'benchmark':>44} {'baseline ms':>12} {'current ms':>11} {'change':>8}")
+    for name, stats in results.items():
+        base = baseline.get(name)
+        if base is None:
+            print(f"{name:>44} {'-':>12} {stats['min_s'] * 1000:>11.2f}      new")
+            continue
+        change = stats["min_s"] / base["min_s"] - 1.0
+        flag = ""
+        if change > threshold:
+            regressions.append(name)
+            flag = "  SLOWER"
+        print(
+            f"{name:>44} {base['min_s'] * 1000:>12.2f} "
+            f"{stats['min_s'] * 1000:>11.2f} {change:>+8.1%}{flag}"
+        )
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Run the 3FXForge and Drum3x benchmark suites."
+    )
+    parser.add_argument(
+        "--suites",
+        nargs="+",
+        choices=sorted(SUITES),
+        default=sorted(SUITES),
+        help="Suites to run (default: all).",
+    )
+    parser.add_argument("--runs", type=int, default=5, help="Runs per benchmark.")
+    parser.add_argument(
+        "--seconds", type=float, default=30.0, help="Length of the synthetic WAV."
+    )
+    parser.add_argument("--channels", type=int, default=2)
+    parser.add_argument("--sample-rate", type=int, default=44100)
+    parser.add_argument(
+        "--output",
+        default="benchmark_results.json",
+        help="Where to save the results (default: benchmark_results.json).",
+    )
+    parser.add_argument("--compare", metavar="BASELINE", help="Baseline results file.")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.10,
+        help="Flag benchmarks slower than the baseline by more than this "
+        "fraction (default: 0.10).",
+    )
+    args = parser.parse_args(argv)
+
+    suite_args = {
+        "3fxforge": [
+            "--runs",
+            str(args.runs),
+            "--seconds",
+            str(args.seconds),
+            "--channels",
+            str(args.channels),
+            "--sample-rate",
+            str(args.sample_rate),
+        ],
+        "drum3x": ["--runs", str(args.runs)],
+    }
+    results = {}
+    failed = []
+    for name in args.suites:
+        try:
+            suite_results = run_suite(name, suite_args[name])
+        except subprocess.CalledProcessError:
+            print(f"The {name} suite failed; see the output above.")
+            failed.append(name)
+            continue
+        for benchmark, stats in suite_results.items():
+            results[f"{name}.{benchmark}"] = stats
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "machine": machine_info(),
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results saved to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline.get("machine", {}).get("cpu") != report["machine"]["cpu"]:
+            print("Warning: the baseline was measured on a different CPU.")
+        regressions = compare(results, baseline["results"], args.threshold)
+        if regressions:
+            print(f"{len(regressions)} benchmark(s) slower than the baseline.")
+            return 1
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())